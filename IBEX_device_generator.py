@@ -1,23 +1,119 @@
 """ Contains main method for creating a vanilla IOC from scratch """
 import argparse
 
-from run_tests import run_tests
-from utils.common_utils import create_component
-from utils.gui_utils import create_opi
-from utils.emulator_utils import create_emulator
-from utils.ioc_utils import create_ioc
-from utils.ioc_test_framework_utils import create_test_framework
-from utils.support_utils import create_submodule, apply_support_dir_template
-from system_paths import CLIENT, IOC_ROOT, EPICS
+from utils.common_utils import lazy_action
+from utils.scheduler_utils import Step, run_steps
+from system_paths import CLIENT, IOC_ROOT, IOC_STARTUP, EPICS, EPICS_SUPPORT, OPI_RESOURCES
+from os import path
 import logging
+from utils.batch_utils import read_manifest, group_by_ticket, SharedEdits, InvalidManifestError
 from utils.device_info_generator import DeviceInfoGenerator, InvalidIOCNameError
-from utils.requests_utils import create_github_repository, grant_permissions_for_github_repository
+from utils.opi_index_utils import load_opi_index, existing_opi_problems
+from utils.profiling_utils import write_profile, span
+from utils.self_test_utils import run_tests_if_changed
+
+# Steps import their modules when they run, so the generator starts without loading GitPython, lxml or requests
+create_opi = lazy_action("utils.gui_utils", "create_opi")
+add_opis_to_opi_info = lazy_action("utils.gui_utils", "add_opis_to_opi_info")
+create_emulator = lazy_action("utils.emulator_utils", "create_emulator")
+create_ioc = lazy_action("utils.ioc_utils", "create_ioc")
+add_iocs_to_ioc_makefile = lazy_action("utils.ioc_utils", "add_iocs_to_ioc_makefile")
+make_ioc_startups = lazy_action("utils.build_utils", "make_ioc_startups")
+create_test_framework = lazy_action("utils.ioc_test_framework_utils", "create_test_framework")
+create_submodule = lazy_action("utils.support_utils", "create_submodule")
+apply_support_dir_template = lazy_action("utils.support_utils", "apply_support_dir_template")
+add_support_modules_to_makefile = lazy_action("utils.support_utils", "add_support_modules_to_makefile")
+create_github_repository = lazy_action("utils.requests_utils", "create_github_repository")
+grant_permissions_for_github_repository = lazy_action("utils.requests_utils", "grant_permissions_for_github_repository")
 
 def _configure_logging():
     logging.basicConfig(format="%(asctime)-15s, %(levelname)s: %(message)s")
     logging.getLogger().setLevel(logging.INFO)
 
-def generate_device(ioc_name, device_name, ticket, device_count, use_git, github_token):
+def _branch_name(ticket, ioc_name):
+    """
+    Args:
+        ticket: The ticket number the changes relate to
+        ioc_name: The name of the IOC
+
+    Returns: The name of the branch to put the changes on in each repository
+    """
+    return "Ticket{}_Add_IOC_{}".format(ticket, ioc_name)
+
+
+def _ioc_startups_step():
+    """
+    Returns: The step that makes the startup files the IOCs share. It reads every IOC, so it runs after the steps that
+        create them
+    """
+    return Step(EPICS, EPICS, make_ioc_startups, "Make IOC startup files", False, reads=[IOC_ROOT],
+                writes=[IOC_STARTUP])
+
+
+def _device_steps(device_info, device_count, use_git, github_token, shared_edits=None, max_workers=1,
+                  clone_iocs=False):
+    """
+    Args:
+        device_info: Provides name-based information about the device
+        device_count: Number of IOCs to generate
+        use_git: use git, if True then create branch, commit and push; if false do nothing with git
+        github_token: If set creates GitHub repository
+        shared_edits: If set, edits to files shared between devices are collected here rather than being made
+        max_workers: Maximum number of processes a step may run at once, e.g. when generating the IOCs
+        clone_iocs: Generate the first IOC with perl and create the others by copying it
+
+    Returns: The steps to generate the device, in the order they would run one after another. Without shared_edits
+        this includes making the IOC startup files, otherwise that is left to the caller to do once for every device
+    """
+    support_makefile = path.join(EPICS_SUPPORT, "Makefile")
+    ioc_makefile = path.join(IOC_ROOT, "Makefile")
+    opi_info = path.join(OPI_RESOURCES, "opi_info.xml")
+    if shared_edits is None:
+        submodule_kwargs, ioc_kwargs, opi_kwargs = {}, {}, {}
+        submodule_writes, ioc_writes, opi_writes = [support_makefile], [ioc_makefile], [opi_info]
+    else:
+        submodule_kwargs = {"supp_dirs": shared_edits.supp_dirs}
+        ioc_kwargs = {"ioc_dirs": shared_edits.ioc_dirs}
+        opi_kwargs = {"opi_entries": shared_edits.opi_entries}
+        submodule_writes, ioc_writes, opi_writes = [], [], []
+
+    github_repository = Step(device_info, device_info.support_master_dir(), create_github_repository,
+                             "Create GitHub repository", False, github_token=github_token)
+
+    github_permissions = Step(device_info, device_info.support_master_dir(), grant_permissions_for_github_repository,
+                              "Grant permissions for GitHub repository", False, after=[github_repository],
+                              github_token=github_token)
+
+    submodule = Step(device_info, EPICS, create_submodule, "Add support submodule to EPICS", use_git,
+                     writes=[path.join(EPICS, ".gitmodules"), device_info.support_dir()] + submodule_writes,
+                     after=[github_repository], create_submodule_in_git=use_git, **submodule_kwargs)
+
+    support_template = Step(device_info, device_info.support_master_dir(), apply_support_dir_template,
+                            "Creating template file structure in support submodule", use_git,
+                            writes=[device_info.support_master_dir()])
+
+    # The IOC's build writes inside its own folder only. The startup files the IOCs share are made by their own step
+    ioc = Step(device_info, IOC_ROOT, create_ioc, "Add template IOC", use_git,
+               writes=[device_info.ioc_path()] + ioc_writes, device_count=device_count,
+               max_workers=max_workers, clone=clone_iocs, **ioc_kwargs)
+
+    test_framework = Step(device_info, device_info.support_master_dir(), create_test_framework,
+                          "Add device to test framework", use_git,
+                          writes=[device_info.ioc_test_framework_folder_path(),
+                                  device_info.ioc_test_framework_run_script_path()])
+
+    emulator = Step(device_info, device_info.support_master_dir(), create_emulator, "Add template emulator", use_git,
+                    writes=[path.dirname(device_info.emulator_dir())])
+
+    opi = Step(device_info, CLIENT, create_opi, "Add template OPI file", use_git,
+               writes=[device_info.opi_file_path()] + opi_writes, **opi_kwargs)
+
+    steps = [github_repository, github_permissions, submodule, support_template, ioc, test_framework, emulator, opi]
+    return steps if shared_edits is not None else steps + [_ioc_startups_step()]
+
+
+def generate_device(ioc_name, device_name, ticket, device_count, use_git, github_token, max_workers=1,
+                    clone_iocs=False):
     """
     Creates the boilerplate components for an IOC
 
@@ -28,6 +124,8 @@ def generate_device(ioc_name, device_name, ticket, device_count, use_git, github
         device_count: Number of IOCs to generate
         use_git: use git, if True then create branch, commit and push; if false do nothing with git
         github_token: If set creates GitHub repository
+        max_workers: Maximum number of independent steps, or of processes within a step, to run at once
+        clone_iocs: Generate the first IOC with perl and create the others by copying it
     """
 
     _configure_logging()
@@ -35,55 +133,148 @@ def generate_device(ioc_name, device_name, ticket, device_count, use_git, github
     # Raises if ioc name is invalid
     device_info = DeviceInfoGenerator(ioc_name, device_name)
 
+    branch = _branch_name(ticket, device_info.ioc_name)
+
+    for problem in existing_opi_problems(device_info):
+        logging.warning(problem)
 
-    branch = "Ticket{}_Add_IOC_{}".format(ticket, device_info.ioc_name)
+    run_steps(_device_steps(device_info, device_count, use_git, github_token, max_workers=max_workers,
+                            clone_iocs=clone_iocs), branch, max_workers)
 
-    create_component(device_info, branch, device_info.support_master_dir(), create_github_repository,
-                    "Create GitHub repository", False, github_token=github_token)
 
-    create_component(device_info, branch, device_info.support_master_dir(), grant_permissions_for_github_repository,
-                    "Grant permissions for GitHub repository", False, github_token=github_token)
+def generate_devices(manifest_entries, use_git, github_token, max_workers=1, clone_iocs=False):
+    """
+    Creates the boilerplate components for several IOCs. Devices for the same ticket share a branch in each
+    repository and the files shared between devices (the IOC and support Makefiles, opi_info.xml and the IOC startup
+    files) are updated once per ticket rather than once per device
 
-    create_component(device_info, branch, EPICS, create_submodule, "Add support submodule to EPICS", use_git,
-                    create_submodule_in_git=use_git)
+    Args:
+        manifest_entries: List of ManifestEntry describing the devices to generate
+        use_git: use git, if True then create branch, commit and push; if false do nothing with git
+        github_token: If set creates GitHub repositories
+        max_workers: Maximum number of independent steps, or of processes within a step, to run at once
+        clone_iocs: Generate the first IOC of each device with perl and create the others by copying it
+    """
+    _configure_logging()
+    step_answers = {}
+    opis = load_opi_index()
 
-    create_component(device_info, branch, device_info.support_master_dir(),
-                    apply_support_dir_template, "Creating template file structure in support submodule", use_git)
+    for ticket, entries in group_by_ticket(manifest_entries).items():
+        branch = _branch_name(ticket, entries[0].ioc_name) if len(entries) == 1 else "Ticket{}_Add_IOCs".format(ticket)
+        shared_edits = SharedEdits()
+        steps = []
+        for entry in entries:
+            try:
+                device_info = DeviceInfoGenerator(entry.ioc_name, entry.device_name)
+            except InvalidIOCNameError:
+                logging.error("IOC Name {} is invalid, skipping it.".format(entry.ioc_name))
+                continue
+            for problem in existing_opi_problems(device_info, opis):
+                logging.warning(problem)
+            steps += _device_steps(device_info, entry.device_count, use_git, github_token, shared_edits, max_workers,
+                                   clone_iocs)
 
-    create_component(device_info, branch, IOC_ROOT, create_ioc, "Add template IOC", use_git, device_count=device_count)
+        device_steps = list(steps)
+        steps += [
+            Step(shared_edits.supp_dirs, EPICS, add_support_modules_to_makefile,
+                 "Add support modules to support Makefile", use_git, writes=[path.join(EPICS_SUPPORT, "Makefile")]),
+            Step(shared_edits.ioc_dirs, IOC_ROOT, add_iocs_to_ioc_makefile,
+                 "Add IOCs to IOC Makefile", use_git, writes=[path.join(IOC_ROOT, "Makefile")]),
+            Step(shared_edits.opi_entries, CLIENT, add_opis_to_opi_info,
+                 "Add OPIs to opi_info.xml", use_git, writes=[path.join(OPI_RESOURCES, "opi_info.xml")]),
+            _ioc_startups_step(),
+        ]
+        # The shared edits are only known once every device's steps have finished
+        for shared_step in steps[len(device_steps):]:
+            shared_step.after = device_steps
 
-    create_component(device_info, branch, device_info.support_master_dir(), create_test_framework,
-                    "Add device to test framework", use_git)
+        logging.info("Generating devices {} for ticket {}".format(", ".join(e.ioc_name for e in entries), ticket))
+        run_steps(steps, branch, max_workers, step_answers)
 
-    create_component(device_info, branch, device_info.support_master_dir(), create_emulator, "Add template emulator",
-                    use_git)
 
-    create_component(device_info, branch, CLIENT, create_opi, "Add template OPI file", use_git)
+def _run_tests():
+    """
+    Returns: True if the generator's unit tests pass, False otherwise
+    """
+    from run_tests import run_tests
+    return run_tests()
 
 
 def main():
     """
     Routine to run when script executed from the command line
     """
-    if not run_tests():
-        raise AssertionError("IOC generator failed its unit tests. Please fix before running")
-    
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
                                     description="Generate boilerplate code for IBEX device support")
-    parser.add_argument("--ioc_name", type=str, help="Name of the IOC.", required=True)
+    parser.add_argument("--ioc_name", type=str, help="Name of the IOC. Required unless --manifest is given.")
     parser.add_argument("--device_name", type=str, help="Name of the device, the support submodule will be named according to this.", required=False, default=None)
-    parser.add_argument("--ticket", type=int, help="Ticket number", required=True)
+    parser.add_argument("--ticket", type=int, help="Ticket number. Required unless --manifest is given.")
+    parser.add_argument("--manifest", type=str, help="CSV file with columns ioc_name, device_name, ticket and "
+                                                     "device_count listing several devices to generate in one run")
     parser.add_argument("--device_count", type=int, help="Number of duplicate IOCs to generate", default=2)
     parser.add_argument("--use_git", action='store_true', help="Use to create relevant branches. Remote repository must exist")
     parser.add_argument("--github_token", type=str, help="GitHub token with \"repo\" scope. Use to create support repository")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Maximum number of independent steps to run at once, and of perl processes to run at "
+                             "once when generating IOCs. With more than one job you are asked about every step before "
+                             "any of them run")
+    parser.add_argument("--clone_iocs", action="store_true",
+                        help="Generate only the first IOC with makeBaseApp.pl and create the others by copying it. "
+                             "Faster, and allows up to 99 IOCs rather than 9")
+    parser.add_argument("--fetch_window", type=int, default=15 * 60,
+                        help="Seconds after fetching a repository, in this run or a previous one, during which it is "
+                             "not fetched again. 0 to always fetch")
+    parser.add_argument("--defer_push", action="store_true",
+                        help="Commit each step locally and push each repository once, all at the same time, after "
+                             "every step has finished. Nothing is pushed if a step fails")
+    parser.add_argument("--profile-out", "--profile_out", dest="profile_out", type=str, default=None,
+                        help="Write the time and resources used by each step, command and git call to this JSON "
+                             "file, and as a Chrome trace (flame chart) alongside it")
+    parser.add_argument("--rerun_tests", action="store_true",
+                        help="Run the generator's unit tests even if they have passed before for this version of it")
 
     args = parser.parse_args()
 
+    with span("self tests", "tests"):
+        if not run_tests_if_changed(_run_tests, force=args.rerun_tests):
+            raise AssertionError("IOC generator failed its unit tests. Please fix before running")
+
+    try:
+        _generate(args, parser)
+    finally:
+        if args.profile_out is not None:
+            write_profile(args.profile_out)
+
+
+def _generate(args, parser):
+    """
+    Generates the devices requested on the command line
+
+    Args:
+        args: The parsed command line arguments
+        parser: The command line parser, used to report invalid arguments
+    """
+    if args.use_git:
+        from utils.git_utils import set_fetch_window, set_deferred_push
+        set_fetch_window(args.fetch_window)
+        set_deferred_push(args.defer_push)
+
+    if args.manifest is not None:
+        try:
+            generate_devices(read_manifest(args.manifest), args.use_git, args.github_token, args.jobs, args.clone_iocs)
+        except (IOError, InvalidManifestError) as e:
+            logging.error("Unable to read manifest {}: {}".format(args.manifest, e))
+        return
+
+    if args.ioc_name is None or args.ticket is None:
+        parser.error("--ioc_name and --ticket are required unless --manifest is given")
+
     if args.device_name is None:
         args.device_name = args.ioc_name
 
     try:
-        generate_device(args.ioc_name, args.device_name, args.ticket, args.device_count, args.use_git, args.github_token)
+        generate_device(args.ioc_name, args.device_name, args.ticket, args.device_count, args.use_git, args.github_token,
+                        args.jobs, args.clone_iocs)
     except InvalidIOCNameError:
         logging.error("IOC Name is invalid. Make sure IOC name is an alphanumeric string, all upper case and the length is between 1 to 8.") 
 
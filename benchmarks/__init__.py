@@ -0,0 +1 @@
+""" Benchmarks of the generator against a synthetic EPICS and ibex_gui tree """
@@ -0,0 +1,165 @@
+""" Builds a synthetic EPICS and ibex_gui tree, with local git remotes, for benchmarking the generator against """
+import os
+import subprocess
+from os.path import join, dirname, abspath
+
+STUBS = join(dirname(abspath(__file__)), "stubs")
+GITHUB_URL = "https://github.com/ISISComputingGroup/"
+ARCHITECTURE = "windows-x64"
+
+
+class FakeTree(object):
+    """
+    A temporary IBEX instrument tree. EPICS, its IOC submodule and ibex_gui are git repositories with bare remotes
+    under remotes/, and GitHub URLs are redirected to those remotes through a private git config
+    """
+
+    def __init__(self, root, ioc_dirs=3000, supp_dirs=1000, opi_entries=8000):
+        """
+        Args:
+            root: Empty directory to build the tree in
+            ioc_dirs: Number of entries in the IOCDIRS list of the IOC Makefile
+            supp_dirs: Number of entries in the SUPPDIRS list of the support Makefile
+            opi_entries: Number of entries in opi_info.xml
+        """
+        self.root = abspath(root)
+        self.instrument = join(self.root, "Instrument")
+        self.epics = join(self.instrument, "Apps", "EPICS")
+        self.ioc_root = join(self.epics, "ioc", "master")
+        self.client = join(self.instrument, "Dev", "ibex_gui")
+        self.opi_resources = join(self.client, "base", "uk.ac.stfc.isis.ibex.opis", "resources")
+        self.remotes = join(self.root, "remotes")
+        self.git_config = join(self.root, "gitconfig")
+        self.ioc_dirs = ioc_dirs
+        self.supp_dirs = supp_dirs
+        self.opi_entries = opi_entries
+
+    def environment(self):
+        """
+        Returns: Environment variables that point the generator, perl, make and git at the tree, and the generator's
+            cache at a folder inside it
+        """
+        env = dict(os.environ)
+        env.pop("EPICS_KIT_ROOT", None)
+        env.update({
+            "IBEX_INSTRUMENT_ROOT": self.instrument,
+            "IBEX_PERL": join(STUBS, "perl"),
+            "EPICS_HOST_ARCH": ARCHITECTURE,
+            "PATH": STUBS + os.pathsep + env.get("PATH", ""),
+            "GIT_CONFIG_GLOBAL": self.git_config,
+            "GIT_CONFIG_NOSYSTEM": "1",
+            "GIT_TERMINAL_PROMPT": "0",
+            "IBEX_GENERATOR_CACHE": join(self.root, "cache"),
+        })
+        return env
+
+    def _git(self, args, cwd):
+        subprocess.run(["git"] + args, cwd=cwd, env=self.environment(), check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+
+    def _write(self, path, content):
+        os.makedirs(dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _make_repo(self, path, remote_name, files):
+        """
+        Creates a repository with a main branch holding the given files, pushed to a new bare remote
+
+        Args:
+            path: Path to the working tree
+            remote_name: Name of the bare remote under remotes/
+            files: Dictionary of path relative to the working tree to file content
+        """
+        remote = join(self.remotes, remote_name + ".git")
+        self._git(["init", "--bare", "-q", "-b", "main", remote], self.root)
+        os.makedirs(path, exist_ok=True)
+        self._git(["init", "-q", "-b", "main"], path)
+        for name, content in files.items():
+            self._write(join(path, name), content)
+        self._git(["add", "-A"], path)
+        self._git(["commit", "-q", "-m", "Initial commit"], path)
+        self._git(["remote", "add", "origin", remote], path)
+        self._git(["push", "-q", "-u", "origin", "main"], path)
+        return remote
+
+    def add_support_remote(self, repo_name):
+        """
+        Creates the remote for a device's support repository, as creating it on GitHub with auto_init would
+
+        Args:
+            repo_name: Name of the repository, e.g. EPICS-MyDevice
+        """
+        work = join(self.root, "work", repo_name)
+        self._make_repo(work, repo_name, {"README.md": "# {}\n".format(repo_name)})
+
+    def _list_makefile(self, list_name, entries, prefix):
+        lines = ["# Synthetic Makefile", "TOP = .", "include $(TOP)/configure/CONFIG", "",
+                 "{} = {}".format(list_name, " ".join(entries[:8]))]
+        for i in range(8, len(entries), 8):
+            lines.append("{} += {}".format(list_name, " ".join(entries[i:i + 8])))
+        lines += ["", "include $(TOP)/configure/RULES_{}".format(prefix), ""]
+        return "\n".join(lines)
+
+    def _opi_info(self):
+        entries = []
+        for i in range(self.opi_entries):
+            key = "DEV{:05d}".format(i)
+            entries.append(
+                "    <entry>\n"
+                "      <key>{key}</key>\n"
+                "      <value>\n"
+                "        <categories/>\n"
+                "        <type>UNKNOWN</type>\n"
+                "        <path>{lower}.opi</path>\n"
+                "        <description>The OPI for the synthetic device {key}</description>\n"
+                "        <macros>\n"
+                "          <macro>\n"
+                "            <name>{key}</name>\n"
+                "            <description>The synthetic device {key} PV prefix (e.g. {key}_01)</description>\n"
+                "          </macro>\n"
+                "        </macros>\n"
+                "      </value>\n"
+                "    </entry>\n".format(key=key, lower=key.lower()))
+        return "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n<opiinfo>\n  <opis>\n{}  </opis>\n" \
+               "</opiinfo>\n".format("".join(entries))
+
+    def build(self):
+        """
+        Creates the tree on disk
+
+        Returns: self
+        """
+        os.makedirs(self.remotes, exist_ok=True)
+        self._write(self.git_config,
+                    "[user]\n\tname = Benchmark\n\temail = benchmark@example.com\n"
+                    "[protocol \"file\"]\n\tallow = always\n"
+                    "[init]\n\tdefaultBranch = main\n"
+                    "[url \"{}/\"]\n\tinsteadOf = {}\n".format(self.remotes.replace("\\", "/"), GITHUB_URL))
+
+        ioc_remote = self._make_repo(join(self.root, "work", "EPICS-IOC"), "EPICS-IOC", {
+            "Makefile": self._list_makefile("IOCDIRS", ["IOC{:04d}".format(i) for i in range(self.ioc_dirs)], "DIRS"),
+        })
+
+        self._make_repo(self.epics, "EPICS", {
+            "Makefile": "TOP = .\niocstartups:\n\t@echo iocstartups\n",
+            join("support", "Makefile"): self._list_makefile(
+                "SUPPDIRS", ["supp{:04d}".format(i) for i in range(self.supp_dirs)], "DIRS"),
+            join("base", "master", "bin", ARCHITECTURE, "makeBaseApp.pl"): "# Run by the stub perl\n",
+            join("support", "asyn", "master", "bin", ARCHITECTURE, "makeSupport.pl"): "# Run by the stub perl\n",
+        })
+        self._git(["submodule", "add", "-q", "-b", "main", "--name", "ioc", ioc_remote, "ioc/master"], self.epics)
+        self._git(["commit", "-q", "-m", "Add IOC submodule"], self.epics)
+        self._git(["push", "-q"], self.epics)
+
+        # system_paths calls the IOC directory "IOC", device info calls it "ioc". On a case sensitive file system
+        # make both work, without git seeing the link
+        if not os.path.exists(join(self.epics, "IOC")):
+            os.symlink("ioc", join(self.epics, "IOC"))
+            with open(join(self.epics, ".git", "info", "exclude"), "a") as f:
+                f.write("/IOC\n")
+
+        self._make_repo(self.client, "ibex_gui", {
+            join(os.path.relpath(self.opi_resources, self.client), "opi_info.xml"): self._opi_info(),
+        })
+        return self
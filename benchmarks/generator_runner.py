@@ -0,0 +1,66 @@
+"""
+Runs the generator for one device without a user, answering its prompts as a developer would for a new device.
+Started by run_benchmarks.py in a separate process so that system_paths picks up the synthetic tree.
+"""
+import argparse
+import builtins
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Ordered (fragment of prompt, reply) pairs. The first match wins
+ANSWERS = (
+    ("Delete its contents", "N"),
+    ("already exists. Delete it?", "Y"),
+    ("already exists. Replace it?", "Y"),
+    ("Should I do step: Create GitHub repository", "N"),
+    ("Should I do step: Grant permissions", "N"),
+    ("Should I do step", "Y"),
+    ("is dirty", "0"),
+    ("Press return", ""),
+    ("press return", ""),
+)
+
+
+def _answer(message=""):
+    """
+    Stands in for input()
+
+    Args:
+        message: The prompt
+
+    Returns: The reply a developer would give to the prompt
+    """
+    for fragment, reply in ANSWERS:
+        if fragment in message:
+            return reply
+    raise RuntimeError("Benchmark has no answer for prompt: {}".format(message))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the generator for one device without prompting")
+    parser.add_argument("--ioc_name", required=True)
+    parser.add_argument("--device_count", type=int, default=2)
+    parser.add_argument("--use_git", action="store_true")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--clone_iocs", action="store_true")
+    parser.add_argument("--defer_push", action="store_true")
+    parser.add_argument("--profile_out", required=True)
+    args = parser.parse_args()
+
+    builtins.input = _answer
+
+    from IBEX_device_generator import generate_device
+    from utils.profiling_utils import span, write_profile
+    if args.defer_push:
+        from utils.git_utils import set_deferred_push
+        set_deferred_push(True)
+    with span("generate_device", "run"):
+        generate_device(args.ioc_name, args.ioc_name, 1, args.device_count, args.use_git, None, args.jobs,
+                        args.clone_iocs)
+    write_profile(args.profile_out)
+
+
+if __name__ == "__main__":
+    main()
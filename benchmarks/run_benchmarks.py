@@ -0,0 +1,170 @@
+"""
+Times each step of generate_device against a synthetic EPICS and ibex_gui tree, with stub perl and make, and writes
+the results as JSON so that runs on different commits can be compared.
+
+Run from the root of the generator, e.g.
+
+    python -m benchmarks.run_benchmarks --output before.json
+    python -m benchmarks.run_benchmarks --output after.json --compare before.json
+
+The stub perl and make are Python scripts, so this runs on Linux and macOS. On Windows set IBEX_PERL and put a real
+make on the path instead.
+"""
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from os.path import join, dirname, abspath
+
+from benchmarks.fake_tree import FakeTree
+
+ROOT = dirname(dirname(abspath(__file__)))
+IOC_NAME = "BENCH"
+
+
+def _commit():
+    """
+    Returns: The commit of the generator being benchmarked, marked if there are uncommitted changes
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                        text=True).strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_once(args):
+    """
+    Builds a fresh tree and generates a device in it
+
+    Args:
+        args: The parsed command line arguments
+
+    Returns: A dictionary of the wall time, child CPU time and status of each step, and totals for the run
+    """
+    root = tempfile.mkdtemp(prefix="ibex_generator_benchmark_")
+    try:
+        tree = FakeTree(root, args.ioc_dirs, args.supp_dirs, args.opi_entries).build()
+        if args.use_git:
+            tree.add_support_remote("EPICS-{}".format(IOC_NAME))
+
+        profile = join(root, "profile.json")
+        command = [sys.executable, join(ROOT, "benchmarks", "generator_runner.py"), "--ioc_name", IOC_NAME,
+                   "--device_count", str(args.device_count), "--jobs", str(args.jobs), "--profile_out", profile]
+        if args.use_git:
+            command.append("--use_git")
+        if args.clone_iocs:
+            command.append("--clone_iocs")
+        if args.defer_push:
+            command.append("--defer_push")
+        completed = subprocess.run(command, cwd=ROOT, env=tree.environment(), stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True, timeout=args.timeout)
+        if completed.returncode != 0:
+            raise RuntimeError("Generator failed:\n{}".format(completed.stdout))
+
+        with open(profile) as f:
+            spans = json.load(f)["spans"]
+    finally:
+        if args.keep:
+            print("Kept benchmark tree in {}".format(root), file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    steps = {s["name"]: {"wall_time": s["wall_time"], "child_cpu_time": s["child_cpu_time"], "status": s["status"]}
+             for s in spans if s["category"] == "step"}
+    totals = {}
+    for s in spans:
+        if s["category"] in ("command", "git"):
+            totals[s["category"]] = totals.get(s["category"], 0.0) + s["wall_time"]
+    totals["run"] = sum(s["wall_time"] for s in spans if s["category"] == "run")
+    return {"steps": steps, "totals": totals, "failed_steps": [n for n, s in steps.items() if s["status"] != 0]}
+
+
+def summarise(runs):
+    """
+    Args:
+        runs: The results of run_once
+
+    Returns: The minimum and median wall time of each step and total across the runs
+    """
+    times = {}
+    for run in runs:
+        for name, step in run["steps"].items():
+            times.setdefault(name, []).append(step["wall_time"])
+        for name, total in run["totals"].items():
+            times.setdefault("total: " + name, []).append(total)
+    return {name: {"min": min(values), "median": statistics.median(values)} for name, values in times.items()}
+
+
+def compare(summary, baseline_path):
+    """
+    Prints the change in median time of each step from a previous benchmark
+
+    Args:
+        summary: The summary of this benchmark
+        baseline_path: Path to the JSON written by a previous benchmark
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print("{:<60} {:>10} {:>10} {:>8}".format("Median wall time (s)", "baseline", "current", "change"))
+    for name in sorted(set(summary) | set(baseline["summary"])):
+        before = baseline["summary"].get(name, {}).get("median")
+        after = summary.get(name, {}).get("median")
+        change = "{:+.0%}".format(after / before - 1) if before and after is not None else ""
+        print("{:<60} {:>10} {:>10} {:>8}".format(name, "-" if before is None else "{:.3f}".format(before),
+                                                 "-" if after is None else "{:.3f}".format(after), change))
+
+
+def main():
+    """
+    Routine to run when script executed from the command line
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description="Benchmark the generator against a synthetic tree")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs, each against a fresh tree")
+    parser.add_argument("--ioc_dirs", type=int, default=3000, help="Number of IOCs in the IOC Makefile")
+    parser.add_argument("--supp_dirs", type=int, default=1000, help="Number of support modules in the support Makefile")
+    parser.add_argument("--opi_entries", type=int, default=8000, help="Number of entries in opi_info.xml")
+    parser.add_argument("--device_count", type=int, default=2, help="Number of IOCs to generate for the device")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of steps the generator may run at once")
+    parser.add_argument("--clone_iocs", action="store_true",
+                        help="Copy the first IOC rather than running perl for each")
+    parser.add_argument("--defer_push", action="store_true",
+                        help="Push each repository once at the end rather than after every step")
+    parser.add_argument("--no_git", dest="use_git", action="store_false", help="Run the generator without git")
+    parser.add_argument("--timeout", type=int, default=600, help="Seconds to allow for each run")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic trees for inspection")
+    parser.add_argument("--output", type=str, default=None, help="File to write the results to, default stdout")
+    parser.add_argument("--compare", type=str, default=None, help="Results of a previous benchmark to compare with")
+    args = parser.parse_args()
+
+    runs = [run_once(args) for _ in range(args.repeat)]
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: getattr(args, k) for k in ("repeat", "ioc_dirs", "supp_dirs", "opi_entries", "device_count",
+                                                  "jobs", "use_git", "clone_iocs", "defer_push")},
+        "runs": runs,
+        "summary": summarise(runs),
+    }
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        compare(results["summary"], args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,27 @@ from tests.test_device_info_generator import DeviceInfoGeneratorTests
 from tests.test_gui_utils import GuiUtilsTests
 from tests.test_file_system_utils import FileSystemUtilsTests
 from tests.test_system_path import SystemPathTests
+from tests.test_batch_utils import BatchUtilsTests
+from tests.test_profiling_utils import ProfilingUtilsTests
+from tests.test_self_test_utils import SelfTestUtilsTests
+from tests.test_staging_utils import StagingUtilsTests
+from tests.test_makefile_utils import MakefileUtilsTests
+from tests.test_opi_index_utils import OpiIndexUtilsTests
+from tests.test_common_utils import CommonUtilsTests
+from tests.test_ioc_utils import IocUtilsTests
+from tests.test_ioc_skeleton_utils import IocSkeletonUtilsTests
+from tests.test_support_skeleton_utils import SupportSkeletonUtilsTests
+from tests.test_build_utils import BuildUtilsTests
+from tests.test_gitmodules_utils import GitModulesUtilsTests
 
 DEFAULT_TEST_LOCATION = "test-reports\\"
 
 
 def run_tests(test_reports_path=DEFAULT_TEST_LOCATION):
     """
-    Runs the test suite
+    Runs the unit tests the generator runs before it starts. Tests that need git, e.g. those that create repositories
+    or run the scheduler's git steps, are left out so a quirk of git on the user's machine does not stop the generator
+    from starting. Run every test with python -m pytest
 
     Args:
         test_reports_path: Path to test reports
@@ -24,7 +38,11 @@ def run_tests(test_reports_path=DEFAULT_TEST_LOCATION):
     """
     loader = unittest.TestLoader()
     suite = unittest.TestSuite()
-    for case in [DeviceInfoGeneratorTests, GuiUtilsTests, SystemPathTests, FileSystemUtilsTests]:
+    for case in [DeviceInfoGeneratorTests, GuiUtilsTests, SystemPathTests, FileSystemUtilsTests, BatchUtilsTests,
+                 ProfilingUtilsTests, SelfTestUtilsTests, StagingUtilsTests,
+                 MakefileUtilsTests, OpiIndexUtilsTests, CommonUtilsTests,
+                 IocUtilsTests, IocSkeletonUtilsTests, SupportSkeletonUtilsTests,
+                 BuildUtilsTests, GitModulesUtilsTests]:
         suite.addTests(loader.loadTestsFromTestCase(case))
 
     return XMLTestRunner(output=str(os.path.join(test_reports_path)), stream=sys.stdout).run(suite).wasSuccessful()
@@ -2,11 +2,14 @@
 from os import getenv
 from os.path import join
 
-INSTRUMENT = join("C:\\", "Instrument")
+# IBEX_INSTRUMENT_ROOT and IBEX_PERL allow the generator to be pointed at another tree, e.g. for benchmarking
+INSTRUMENT = getenv("IBEX_INSTRUMENT_ROOT", join("C:\\", "Instrument"))
 EPICS = getenv("EPICS_KIT_ROOT", join(INSTRUMENT, "Apps", "EPICS"))
 
 IOC_ROOT = join(EPICS, "IOC", "master")
-PERL = join("C:\\", "Strawberry", "perl", "bin", "perl.exe")
+# Startup files the IOCs share, generated by make iocstartups at the top of EPICS
+IOC_STARTUP = join(EPICS, "iocstartup")
+PERL = getenv("IBEX_PERL", join("C:\\", "Strawberry", "perl", "bin", "perl.exe"))
 EPICS_BASE_BUILD = join(EPICS, "base", "master", "bin")
 ARCHITECTURE = getenv("EPICS_HOST_ARCH", "windows-x64")
 PERL_IOC_GENERATOR = join(EPICS_BASE_BUILD, ARCHITECTURE, "makeBaseApp.pl")
@@ -0,0 +1,2 @@
+PROD_IOC = $(APPNAME)
+DBD += $(APPNAME).dbd
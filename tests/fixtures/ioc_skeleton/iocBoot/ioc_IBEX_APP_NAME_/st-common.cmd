@@ -0,0 +1,5 @@
+epicsEnvSet("STREAM_PROTOCOL_PATH", "$(_SUPPORT_MACRO_)/data")
+dbLoadRecords("$(_SUPPORT_MACRO_)/db/_DB_NAME_.db", "P=$(MYPVPREFIX)$(IOCNAME):")
+< $(IOCSTARTUP)/preiocinit.cmd
+iocInit
+< $(IOCSTARTUP)/postiocinit.cmd
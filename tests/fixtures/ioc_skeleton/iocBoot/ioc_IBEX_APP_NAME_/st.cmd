@@ -0,0 +1,6 @@
+#!../../bin/_IBEX_ARCH_/_IBEX_APP_NAME_
+< envPaths
+dbLoadDatabase "dbd/_IBEX_APP_NAME_.dbd"
+_IBEX_APP_NAME__registerRecordDeviceDriver pdbbase
+< $(IOCSTARTUP)/init.cmd
+< st-common.cmd
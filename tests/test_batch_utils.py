@@ -0,0 +1,50 @@
+""" Tests for reading device manifests """
+import unittest
+
+from utils.batch_utils import parse_manifest, group_by_ticket, InvalidManifestError, DEFAULT_DEVICE_COUNT
+
+
+class BatchUtilsTests(unittest.TestCase):
+
+    def test_GIVEN_manifest_with_all_columns_WHEN_parsed_THEN_entries_match_rows_in_order(self):
+        # Arrange
+        manifest = [
+            "ioc_name,device_name,ticket,device_count\n",
+            "MYIOC,My Device,1234,3\n",
+            "OTHER,,1234,1\n",
+        ]
+
+        # Act
+        entries = parse_manifest(manifest)
+
+        # Assert
+        self.assertEqual(2, len(entries))
+        self.assertEqual(("MYIOC", "My Device", 1234, 3), tuple(entries[0]))
+        self.assertEqual(("OTHER", "OTHER", 1234, 1), tuple(entries[1]))
+
+    def test_GIVEN_manifest_without_optional_columns_WHEN_parsed_THEN_defaults_are_used(self):
+        # Arrange
+        manifest = ["ioc_name,ticket\n", "# A comment\n", "\n", "MYIOC,42\n"]
+
+        # Act
+        entries = parse_manifest(manifest)
+
+        # Assert
+        self.assertEqual([("MYIOC", "MYIOC", 42, DEFAULT_DEVICE_COUNT)], [tuple(e) for e in entries])
+
+    def test_GIVEN_manifest_missing_ticket_column_WHEN_parsed_THEN_error_raised(self):
+        self.assertRaises(InvalidManifestError, parse_manifest, ["ioc_name\n", "MYIOC\n"])
+
+    def test_GIVEN_manifest_with_non_numeric_ticket_WHEN_parsed_THEN_error_raised(self):
+        self.assertRaises(InvalidManifestError, parse_manifest, ["ioc_name,ticket\n", "MYIOC,abc\n"])
+
+    def test_GIVEN_entries_for_several_tickets_WHEN_grouped_THEN_entries_grouped_by_ticket_in_order(self):
+        # Arrange
+        entries = parse_manifest(["ioc_name,ticket\n", "A,2\n", "B,1\n", "C,2\n"])
+
+        # Act
+        groups = group_by_ticket(entries)
+
+        # Assert
+        self.assertEqual([2, 1], list(groups.keys()))
+        self.assertEqual(["A", "C"], [e.ioc_name for e in groups[2]])
@@ -0,0 +1,52 @@
+""" Tests for building the IOCs and support modules that are generated """
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.build_utils import make_jobs, build, make_ioc_startups
+
+
+class BuildUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _write(self, content, *parts):
+        path = os.path.join(self.directory, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def test_WHEN_make_jobs_THEN_at_least_one(self):
+        # Act
+        jobs = make_jobs()
+
+        # Assert
+        self.assertGreaterEqual(jobs, 1)
+
+    def test_GIVEN_make_creates_a_file_WHEN_built_THEN_make_run_in_parallel_and_file_reported_as_rebuilt(self):
+        # Arrange
+        self._write("all:\n", "Makefile")
+
+        def make(command, working_dir, timeout):
+            self._write("binary", "bin", "MYDEV-IOC-01")
+
+        # Act
+        with mock.patch("utils.build_utils.run_command", side_effect=make) as run_command:
+            result = build(self.directory, jobs=4)
+
+        # Assert
+        self.assertEqual(["make", "-j4"], run_command.call_args[0][0])
+        self.assertEqual([os.path.join(self.directory, "bin", "MYDEV-IOC-01")], result.rebuilt)
+
+    def test_WHEN_startups_made_THEN_iocstartups_target_made_once_at_top_of_epics(self):
+        # Act
+        with mock.patch("utils.build_utils.run_command") as run_command:
+            make_ioc_startups(self.directory)
+
+        # Assert
+        run_command.assert_called_once()
+        self.assertEqual((["make", "iocstartups"], self.directory), run_command.call_args[0])
@@ -0,0 +1,74 @@
+""" Tests for the utilities common to all steps """
+import os
+import sys
+import time
+import unittest
+
+from utils.common_utils import run_commands, run_command, CommandError, OUTPUT_LINES
+
+
+class CommonUtilsTests(unittest.TestCase):
+
+    def test_GIVEN_commands_that_pass_and_fail_WHEN_run_THEN_results_in_order_with_exit_codes_and_output(self):
+        # Arrange
+        commands = [[sys.executable, "-c", "print('first')"],
+                    [sys.executable, "-c", "import sys; print('second'); sys.exit(3)"]]
+
+        # Act
+        results = run_commands(commands, ".", max_workers=2, check=False)
+
+        # Assert
+        self.assertEqual(commands, [result.command for result in results])
+        self.assertEqual([0, 3], [result.returncode for result in results])
+        self.assertEqual(["first", "second"], [result.output.strip() for result in results])
+
+    def test_GIVEN_several_workers_WHEN_slow_commands_run_THEN_they_run_at_the_same_time(self):
+        # Arrange
+        commands = [[sys.executable, "-c", "import time; time.sleep(0.5)"]] * 3
+
+        # Act
+        start = time.perf_counter()
+        run_commands(commands, ".", max_workers=3)
+        elapsed = time.perf_counter() - start
+
+        # Assert
+        self.assertLess(elapsed, 1.4)
+
+    def test_GIVEN_command_that_fails_WHEN_run_THEN_error_raised_with_exit_code_and_last_lines_of_output(self):
+        # Arrange
+        command = [sys.executable, "-c", "import sys\nfor i in range(200): print(i)\nsys.exit(2)"]
+
+        # Act
+        with self.assertRaises(CommandError) as context:
+            run_command(command, ".")
+
+        # Assert
+        self.assertEqual(2, context.exception.returncode)
+        self.assertEqual([str(i) for i in range(200 - OUTPUT_LINES, 200)], context.exception.output.splitlines())
+
+    def test_GIVEN_command_that_hangs_WHEN_run_with_timeout_THEN_killed_and_error_raised(self):
+        # Arrange
+        command = [sys.executable, "-c", "import time; print('started', flush=True); time.sleep(30)"]
+
+        # Act
+        start = time.perf_counter()
+        with self.assertRaises(CommandError) as context:
+            run_command(command, ".", timeout=0.5)
+        elapsed = time.perf_counter() - start
+
+        # Assert
+        self.assertLess(elapsed, 10)
+        self.assertIsNone(context.exception.returncode)
+        self.assertEqual("started", context.exception.output)
+
+    def test_GIVEN_command_that_writes_to_stdout_and_stderr_WHEN_run_THEN_both_logged(self):
+        # Arrange
+        command = [sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr)"]
+
+        # Act
+        with self.assertLogs(level="INFO") as logs:
+            run_command(command, ".")
+
+        # Assert
+        self.assertIn("INFO:root:{}: out".format(os.path.basename(sys.executable)), logs.output)
+        self.assertIn("WARNING:root:{}: err".format(os.path.basename(sys.executable)), logs.output)
@@ -1,6 +1,11 @@
 """ Test auxillary methods from File System Utils """
+import os
+import shutil
+import tempfile
 import unittest
-from utils.file_system_utils import _add_entry_to_list
+from unittest import mock
+from utils.file_system_utils import _add_entry_to_list, Substitutions, replace_in_files, write_file, record_writes, \
+    render_tree
 
 
 class FileSystemUtilsTests(unittest.TestCase):
@@ -69,3 +74,127 @@ class FileSystemUtilsTests(unittest.TestCase):
 
         # Assert
         self.assertEquals(iocdirs_input, actual_output)
+
+    def test_GIVEN_originals_sharing_a_prefix_WHEN_substitutions_applied_THEN_longest_original_wins(self):
+        # Arrange
+        substitutions = Substitutions([("_DEVICE_", "MYDEV"), ("_DEVICE_NAME_", "My Device")])
+
+        # Act
+        text, count = substitutions.apply("_DEVICE_NAME_ is _DEVICE_")
+
+        # Assert
+        self.assertEqual("My Device is MYDEV", text)
+        self.assertEqual(2, count)
+
+    def test_GIVEN_final_containing_another_original_WHEN_substitutions_applied_THEN_final_is_not_substituted(self):
+        # Arrange
+        substitutions = Substitutions([("_A_", "_B_"), ("_B_", "b")])
+
+        # Act
+        text, count = substitutions.apply("_A_ _B_")
+
+        # Assert
+        self.assertEqual("_B_ b", text)
+        self.assertEqual(2, count)
+
+    def test_GIVEN_files_with_and_without_matches_WHEN_replace_in_files_THEN_only_matching_files_rewritten(self):
+        # Arrange
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        matching, unmatched = os.path.join(directory, "st.cmd"), os.path.join(directory, "config.xml")
+        with open(matching, "w") as f:
+            f.write("dbLoadRecords(_DB_NAME_.db)\n")
+        with open(unmatched, "w") as f:
+            f.write("<ioc_config/>\n")
+        os.utime(unmatched, (0, 0))
+
+        # Act
+        changed = replace_in_files([matching, unmatched], [("_DB_NAME_", "MYIOC"), ("$(", "$(")])
+
+        # Assert
+        self.assertEqual([matching], changed)
+        with open(matching) as f:
+            self.assertEqual("dbLoadRecords(MYIOC.db)\n", f.read())
+        self.assertEqual(0, os.stat(unmatched).st_mtime)
+
+    def test_GIVEN_file_holding_same_content_WHEN_write_file_THEN_file_is_not_rewritten_and_skip_is_counted(self):
+        # Arrange
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        target = os.path.join(directory, "Makefile")
+        with open(target, "w") as f:
+            f.write("IOCDIRS += MYIOC\n")
+        os.utime(target, (0, 0))
+
+        # Act
+        with record_writes() as stats:
+            written = write_file(target, "IOCDIRS += MYIOC\n")
+
+        # Assert
+        self.assertFalse(written)
+        self.assertEqual(0, os.stat(target).st_mtime)
+        self.assertEqual((0, 0, 1), (stats.bytes_written, stats.files_written, stats.files_skipped))
+
+    def test_GIVEN_file_with_different_content_WHEN_write_file_THEN_file_replaced_keeping_its_mode(self):
+        # Arrange
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        target = os.path.join(directory, "run_tests.sh")
+        with open(target, "w") as f:
+            f.write("old\n")
+        os.chmod(target, 0o755)
+        mode = os.stat(target).st_mode
+
+        # Act
+        with record_writes() as stats:
+            written = write_file(target, "new content\n")
+
+        # Assert
+        self.assertTrue(written)
+        with open(target) as f:
+            self.assertEqual("new content\n", f.read())
+        self.assertEqual(mode, os.stat(target).st_mode)
+        self.assertEqual(["run_tests.sh"], os.listdir(directory))
+        self.assertEqual((1, 0), (stats.files_written, stats.files_skipped))
+        self.assertEqual(len("new content" + os.linesep), stats.bytes_written)
+
+    def test_GIVEN_no_file_WHEN_write_file_THEN_file_created_with_same_mode_as_open_gives(self):
+        # Arrange
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        opened = os.path.join(directory, "opened.txt")
+        with open(opened, "w") as f:
+            f.write("content\n")
+
+        # Act
+        with mock.patch("os.umask") as umask:
+            write_file(os.path.join(directory, "written.txt"), "content\n")
+
+        # Assert
+        umask.assert_not_called()
+        self.assertEqual(os.stat(opened).st_mode, os.stat(os.path.join(directory, "written.txt")).st_mode)
+        self.assertEqual(["opened.txt", "written.txt"], sorted(os.listdir(directory)))
+
+    def test_GIVEN_template_tree_WHEN_render_tree_THEN_names_renamed_content_substituted_and_ignored_names_skipped(self):
+        # Arrange
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source, destination = os.path.join(directory, "source"), os.path.join(directory, "emulators")
+        os.makedirs(os.path.join(source, "DEVICENAME", "__pycache__"))
+        with open(os.path.join(source, "DEVICENAME", "device.py"), "wb") as f:
+            f.write(b"class DEVICENAME(object):\r\n")
+        with open(os.path.join(source, "versions.py"), "wb") as f:
+            f.write(b"VERSIONS = []\r\n")
+
+        # Act
+        written = render_tree(source, destination, [("DEVICENAME", "Mydev")], renames={"DEVICENAME": "Mydev"},
+                              ignore=lambda folder, names: {"__pycache__"})
+
+        # Assert
+        self.assertEqual(2, len(written))
+        self.assertEqual(["Mydev", "versions.py"], sorted(os.listdir(destination)))
+        self.assertEqual(["device.py"], os.listdir(os.path.join(destination, "Mydev")))
+        with open(os.path.join(destination, "Mydev", "device.py"), "rb") as f:
+            self.assertEqual(b"class Mydev(object):\r\n", f.read())
+        with open(os.path.join(destination, "versions.py"), "rb") as f:
+            self.assertEqual(b"VERSIONS = []\r\n", f.read())
@@ -0,0 +1,71 @@
+""" Tests for the utilities for reading refs and staged changes with few git processes """
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.git_plumbing_utils import RefIndex, read_refs, staged_paths
+from tests.test_git_utils import GIT_ENVIRONMENT
+
+
+class GitPlumbingUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        environment = mock.patch.dict(os.environ, GIT_ENVIRONMENT)
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        for name in ("first.txt", "second.txt"):
+            with open(os.path.join(self.path, name), "w") as f:
+                f.write("Committed\n")
+        for args in (["init", "-q", "-b", "main"], ["add", "-A"], ["commit", "-q", "-m", "Initial commit"],
+                     ["branch", "Ticket1_Add_IOC_FIRST"]):
+            self._git(args)
+
+    def _git(self, args):
+        subprocess.run(["git"] + args, cwd=self.path, check=True, stdout=subprocess.DEVNULL)
+
+    def test_GIVEN_repository_WHEN_refs_read_THEN_local_branches_indexed(self):
+        # Act
+        refs = read_refs(self.path)
+
+        # Assert
+        self.assertEqual({"refs/heads/main", "refs/heads/Ticket1_Add_IOC_FIRST"}, set(refs.refs))
+        self.assertEqual("main", refs.default_branch())
+        self.assertEqual("Ticket1_Add_IOC_FIRST", refs.branch("TICKET1_ADD_IOC_FIRST"))
+        self.assertIsNone(refs.branch("Ticket2_Add_IOC_SECOND"))
+
+    def test_GIVEN_master_on_origin_only_WHEN_default_branch_found_THEN_master(self):
+        # Arrange
+        refs = RefIndex({"refs/remotes/origin/master": "abc"})
+
+        # Act
+        default_branch = refs.default_branch()
+
+        # Assert
+        self.assertEqual("master", default_branch)
+
+    def test_GIVEN_both_master_and_main_WHEN_default_branch_found_THEN_error(self):
+        # Arrange
+        refs = RefIndex({"refs/heads/main": "abc", "refs/remotes/origin/master": "abc"})
+
+        # Act / Assert
+        self.assertRaises(RuntimeError, refs.default_branch)
+
+    def test_GIVEN_staged_and_unstaged_changes_WHEN_staged_paths_read_THEN_only_staged_paths_in_pathspec_returned(self):
+        # Arrange
+        for name in ("first.txt", "second.txt", "third.txt"):
+            with open(os.path.join(self.path, name), "a") as f:
+                f.write("Changed\n")
+        self._git(["add", "first.txt", "third.txt"])
+
+        # Act
+        everything = staged_paths(self.path)
+        scoped = staged_paths(self.path, ["third.txt"])
+
+        # Assert
+        self.assertEqual(["first.txt", "third.txt"], everything)
+        self.assertEqual(["third.txt"], scoped)
@@ -0,0 +1,108 @@
+""" Tests for the utilities for finding the changes in part of a git working tree """
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.git_status_utils import parse_porcelain_v2, status, is_dirty, pathspecs, StatusEntry
+from tests.test_git_utils import GIT_ENVIRONMENT
+
+
+class GitStatusUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        environment = mock.patch.dict(os.environ, GIT_ENVIRONMENT)
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        os.makedirs(os.path.join(self.path, "ioc"))
+        os.makedirs(os.path.join(self.path, "support"))
+        for name in ("ioc", "support"):
+            with open(os.path.join(self.path, name, "file.txt"), "w") as f:
+                f.write("Committed\n")
+        for args in (["init", "-q", "-b", "main"], ["add", "-A"], ["commit", "-q", "-m", "Initial commit"]):
+            subprocess.run(["git"] + args, cwd=self.path, check=True, stdout=subprocess.DEVNULL)
+
+    def test_GIVEN_changed_and_untracked_files_WHEN_parsed_THEN_entries_returned_and_headers_skipped(self):
+        # Arrange
+        output = b"# branch.oid abc\0" \
+                 b"1 .M N... 100644 100644 100644 abc abc ioc/my file.txt\0" \
+                 b"? support/new.db\0"
+
+        # Act
+        entries = list(parse_porcelain_v2([output]))
+
+        # Assert
+        self.assertEqual([StatusEntry("1", ".M", "ioc/my file.txt", None),
+                          StatusEntry("?", None, "support/new.db", None)], entries)
+
+    def test_GIVEN_renamed_and_unmerged_files_WHEN_parsed_THEN_paths_and_original_paths_returned(self):
+        # Arrange
+        output = b"2 R. N... 100644 100644 100644 abc abc R100 new.txt\0old.txt\0" \
+                 b"u UU N... 100644 100644 100644 100644 abc abc abc both.txt\0"
+
+        # Act
+        entries = list(parse_porcelain_v2([output]))
+
+        # Assert
+        self.assertEqual([StatusEntry("2", "R.", "new.txt", "old.txt"), StatusEntry("u", "UU", "both.txt", None)],
+                         entries)
+
+    def test_GIVEN_output_split_inside_entry_WHEN_parsed_THEN_entry_joined_up(self):
+        # Arrange
+        output = b"1 .M N... 100644 100644 100644 abc abc first.txt\0? second.txt\0"
+
+        # Act
+        entries = list(parse_porcelain_v2(output[i:i + 7] for i in range(0, len(output), 7)))
+
+        # Assert
+        self.assertEqual(["first.txt", "second.txt"], [entry.path for entry in entries])
+
+    def test_GIVEN_path_outside_working_tree_WHEN_pathspecs_made_THEN_left_out(self):
+        # Act
+        specs = pathspecs(self.path, [os.path.join(self.path, "ioc"), os.path.dirname(self.path)])
+
+        # Assert
+        self.assertEqual(1, len(specs))
+        self.assertTrue(specs[0].endswith("ioc"))
+
+    def test_GIVEN_change_in_one_folder_WHEN_checked_THEN_only_that_folder_dirty(self):
+        # Arrange
+        with open(os.path.join(self.path, "ioc", "file.txt"), "a") as f:
+            f.write("Uncommitted\n")
+
+        # Act
+        ioc_dirty = is_dirty(self.path, [os.path.join(self.path, "ioc")])
+        support_dirty = is_dirty(self.path, [os.path.join(self.path, "support")])
+
+        # Assert
+        self.assertTrue(ioc_dirty)
+        self.assertFalse(support_dirty)
+
+    def test_GIVEN_untracked_file_WHEN_checked_THEN_dirty_for_its_path_but_not_for_whole_tree(self):
+        # Arrange
+        with open(os.path.join(self.path, "support", "new.txt"), "w") as f:
+            f.write("Untracked\n")
+
+        # Act
+        path_dirty = is_dirty(self.path, [os.path.join(self.path, "support")])
+        tree_dirty = is_dirty(self.path)
+
+        # Assert
+        self.assertTrue(path_dirty)
+        self.assertFalse(tree_dirty)
+
+    def test_GIVEN_changes_WHEN_status_read_THEN_paths_relative_to_working_tree(self):
+        # Arrange
+        for name in ("ioc", "support"):
+            with open(os.path.join(self.path, name, "file.txt"), "a") as f:
+                f.write("Uncommitted\n")
+
+        # Act
+        entries = list(status(self.path))
+
+        # Assert
+        self.assertEqual(["ioc/file.txt", "support/file.txt"], sorted(entry.path for entry in entries))
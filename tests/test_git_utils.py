@@ -0,0 +1,375 @@
+""" Tests for the utilities for interacting with git """
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from IBEX_device_generator import generate_devices
+from utils.batch_utils import ManifestEntry
+from utils.ioc_utils import create_ioc
+from utils.profiling_utils import span, spans
+from utils.scheduler_utils import Step, run_steps
+from utils.git_utils import RepoWrapper, repo_session, prepare_repositories, _nesting_levels, set_fetch_window, \
+    DEFAULT_FETCH_WINDOW, set_deferred_push, push_deferred, discard_deferred_pushes
+
+GIT_ENVIRONMENT = {"GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com", "GIT_COMMITTER_NAME": "Test",
+                   "GIT_COMMITTER_EMAIL": "test@example.com", "GIT_TERMINAL_PROMPT": "0"}
+
+
+class GitUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        environment = mock.patch.dict(os.environ, GIT_ENVIRONMENT)
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        cache = mock.patch("utils.cache_utils.CACHE_DIR", os.path.join(self.root, ".cache"))
+        cache.start()
+        self.addCleanup(cache.stop)
+        self.path = self._make_repo("repo")
+
+    def _make_repo(self, name):
+        remote = os.path.join(self.root, name + ".git")
+        path = os.path.join(self.root, name)
+        self._git(["init", "-q", "--bare", "-b", "main", remote], self.root)
+        self._git(["init", "-q", "-b", "main", path], self.root)
+        with open(os.path.join(path, "README.md"), "w") as f:
+            f.write("# Repo\n")
+        self._git(["add", "-A"], path)
+        self._git(["commit", "-q", "-m", "Initial commit"], path)
+        self._git(["remote", "add", "origin", remote], path)
+        self._git(["push", "-q", "-u", "origin", "main"], path)
+        return path
+
+    def _git(self, args, cwd):
+        subprocess.run(["git"] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _git_commands(self, parent):
+        commands = []
+        for git_span in spans():
+            if git_span.parent == parent:
+                words = git_span.name.split()[1:]
+                while words[0] == "-c":
+                    words = words[2:]
+                commands.append(words[0])
+        return commands
+
+    def _remote_branches(self, name):
+        output = subprocess.check_output(["git", "for-each-ref", "--format=%(refname:short)", "refs/heads"],
+                                         cwd=os.path.join(self.root, name + ".git"), text=True)
+        return output.split()
+
+    def _branch_files(self, branch):
+        output = subprocess.check_output(["git", "ls-tree", "-r", "--name-only", branch],
+                                         cwd=os.path.join(self.root, "repo.git"), text=True)
+        return sorted(output.split())
+
+    def _commit_deferred(self):
+        set_deferred_push(True)
+        self.addCleanup(set_deferred_push, False)
+        session = repo_session(self.path)
+        session.prepare_new_branch("Ticket1_Add_IOC_FIRST")
+        with open(os.path.join(self.path, "new.txt"), "w") as f:
+            f.write("New\n")
+        session.push_all_changes("Add new file")
+        return session
+
+    def test_GIVEN_same_repository_WHEN_session_requested_twice_THEN_same_session_returned(self):
+        # Act
+        first = repo_session(self.path)
+        second = repo_session(os.path.join(self.path, "."))
+
+        # Assert
+        self.assertIs(first, second)
+
+    def test_GIVEN_repository_prepared_WHEN_prepared_for_another_branch_THEN_not_cleaned_and_only_branch_fetched(self):
+        # Arrange
+        session = repo_session(self.path)
+        session.prepare_new_branch("Ticket1_Add_IOC_FIRST")
+
+        # Act
+        with mock.patch.object(session, "is_dirty") as is_dirty, \
+                mock.patch.object(session, "_git", wraps=session._git) as git:
+            session.prepare_new_branch("Ticket2_Add_IOC_SECOND")
+
+        # Assert
+        is_dirty.assert_not_called()
+        self.assertEqual(
+            [("fetch", "origin", "+refs/heads/Ticket2_Add_IOC_SECOND:refs/remotes/origin/Ticket2_Add_IOC_SECOND"),
+             ("fetch", "origin", "+refs/heads/main:refs/remotes/origin/main")],
+            [call[0] for call in git.call_args_list if call[0][0] == "fetch"])
+        self.assertEqual("Ticket2_Add_IOC_SECOND", session._repo.active_branch.name)
+
+    def test_GIVEN_repository_prepared_WHEN_prepared_again_for_same_branch_THEN_no_git_commands_run(self):
+        # Arrange
+        session = repo_session(self.path)
+        session.prepare_new_branch("Ticket1_Add_IOC_FIRST")
+
+        # Act
+        with mock.patch.object(session, "_git") as git:
+            session.prepare_new_branch("Ticket1_Add_IOC_FIRST")
+
+        # Assert
+        git.assert_not_called()
+
+    def test_GIVEN_nested_repositories_WHEN_grouped_THEN_outer_repositories_first(self):
+        # Arrange
+        epics, client = os.path.join(self.root, "EPICS"), os.path.join(self.root, "ibex_gui")
+        ioc, support = os.path.join(epics, "ioc", "master"), os.path.join(epics, "support", "mydev", "master")
+
+        # Act
+        levels = _nesting_levels([ioc, client, support, epics])
+
+        # Assert
+        self.assertEqual([sorted(map(os.path.normcase, [epics, client])),
+                          sorted(map(os.path.normcase, [ioc, support]))], levels)
+
+    def test_GIVEN_clean_and_dirty_repositories_WHEN_prepared_THEN_asked_about_dirty_one_only_and_both_on_branch(self):
+        # Arrange
+        other = self._make_repo("other")
+        with open(os.path.join(other, "README.md"), "a") as f:
+            f.write("Uncommitted\n")
+
+        # Act
+        with mock.patch("utils.git_utils.prompt", return_value="1") as prompt, mock.patch("builtins.print"):
+            errors = prepare_repositories([self.path, other], "Ticket1_Add_IOC_FIRST", max_workers=2)
+
+        # Assert
+        self.assertEqual({}, errors)
+        self.assertEqual(1, prompt.call_count)
+        self.assertIn(other, prompt.call_args[0][0])
+        for path in (self.path, other):
+            self.assertEqual("Ticket1_Add_IOC_FIRST", repo_session(path)._repo.active_branch.name)
+        self.assertFalse(repo_session(other).is_dirty())
+
+    def test_GIVEN_change_outside_paths_written_WHEN_prepared_THEN_not_asked_and_change_kept(self):
+        # Arrange
+        with open(os.path.join(self.path, "README.md"), "a") as f:
+            f.write("Uncommitted\n")
+        writes = {self.path: [os.path.join(self.path, "ioc", "MYDEV")]}
+
+        # Act
+        with mock.patch("utils.git_utils.prompt") as prompt:
+            errors = prepare_repositories([self.path], "Ticket1_Add_IOC_FIRST", writes=writes)
+
+        # Assert
+        self.assertEqual({}, errors)
+        prompt.assert_not_called()
+        self.assertEqual("Ticket1_Add_IOC_FIRST", repo_session(self.path)._repo.active_branch.name)
+        self.assertTrue(repo_session(self.path).is_dirty())
+
+    def test_GIVEN_change_to_path_written_WHEN_stashed_THEN_only_that_change_stashed(self):
+        # Arrange
+        os.makedirs(os.path.join(self.path, "ioc"))
+        written = os.path.join(self.path, "ioc", "new.txt")
+        for path in (written, os.path.join(self.path, "README.md")):
+            with open(path, "a") as f:
+                f.write("Uncommitted\n")
+        session = repo_session(self.path)
+
+        # Act
+        session.clean_repo([os.path.join(self.path, "ioc")], clean_option=1)
+
+        # Assert
+        self.assertFalse(os.path.exists(written))
+        self.assertTrue(session.is_dirty([os.path.join(self.path, "README.md")]))
+
+    def test_GIVEN_repository_that_cannot_be_prepared_WHEN_prepared_THEN_error_returned_and_raised_again_later(self):
+        # Arrange
+        self._git(["remote", "set-url", "origin", os.path.join(self.root, "missing.git")], self.path)
+
+        # Act
+        errors = prepare_repositories([self.path], "Ticket1_Add_IOC_FIRST")
+
+        # Assert
+        self.assertEqual([os.path.normcase(os.path.realpath(self.path))], list(errors))
+        with mock.patch.object(repo_session(self.path), "_git") as git:
+            self.assertRaises(RuntimeError, repo_session(self.path).prepare_new_branch, "Ticket1_Add_IOC_FIRST")
+        git.assert_not_called()
+
+    def test_GIVEN_repository_fetched_recently_WHEN_prepared_in_a_new_run_THEN_not_fetched_again(self):
+        # Arrange
+        repo_session(self.path).prepare_new_branch("Ticket1_Add_IOC_FIRST")
+        session = RepoWrapper(self.path)
+
+        # Act
+        with mock.patch.object(session, "_git", wraps=session._git) as git:
+            session.prepare_new_branch("Ticket1_Add_IOC_FIRST")
+
+        # Assert
+        self.assertNotIn("fetch", [call[0][0] for call in git.call_args_list])
+
+    def test_GIVEN_no_fetch_window_WHEN_fetched_THEN_only_default_and_ticket_branches_fetched(self):
+        # Arrange
+        set_fetch_window(0)
+        self.addCleanup(set_fetch_window, DEFAULT_FETCH_WINDOW)
+        for branch in ("Ticket1_Add_IOC_FIRST", "Ticket1_Add_IOC_FIRST2"):
+            self._git(["branch", branch, "main"], os.path.join(self.root, "repo.git"))
+        session = repo_session(self.path)
+
+        # Act
+        with mock.patch.object(session, "_git", wraps=session._git) as git:
+            session.fetch("main", "Ticket1_Add_IOC_FIRST")
+
+        # Assert
+        self.assertEqual([mock.call("fetch", "origin", "+refs/heads/main:refs/remotes/origin/main",
+                                    "+refs/heads/Ticket1_Add_IOC_FIRST:refs/remotes/origin/Ticket1_Add_IOC_FIRST",
+                                    recurse_submodules="no")], git.call_args_list)
+        self.assertNotIn("origin/Ticket1_Add_IOC_FIRST2", [ref.name for ref in session._repo.remote().refs])
+
+    def test_GIVEN_ticket_branch_not_on_remote_WHEN_fetched_THEN_default_branch_fetched(self):
+        # Arrange
+        set_fetch_window(0)
+        self.addCleanup(set_fetch_window, DEFAULT_FETCH_WINDOW)
+        clone = os.path.join(self.root, "clone")
+        self._git(["clone", "-q", os.path.join(self.root, "repo.git"), clone], self.root)
+        self._git(["commit", "-q", "--allow-empty", "-m", "Later commit"], clone)
+        self._git(["push", "-q", "origin", "main"], clone)
+        session = repo_session(self.path)
+
+        # Act
+        session.fetch("main", "Ticket1_Add_IOC_FIRST")
+
+        # Assert
+        self.assertEqual("Later commit", session._repo.commit("origin/main").message.strip())
+
+    def test_GIVEN_submodule_added_WHEN_checked_THEN_contained_and_not_added_again(self):
+        # Arrange
+        other = self._make_repo("other")
+        session = repo_session(self.path)
+        self._git(["-c", "protocol.file.allow=always", "submodule", "add", "-q", other + ".git", "other"], self.path)
+
+        # Act
+        contained = session.contains_submodule(other.upper() + ".git")
+        with mock.patch("utils.git_utils.prompt") as prompt, mock.patch("subprocess.run") as run:
+            session.create_submodule("other", other + ".git", os.path.join(self.path, "other"))
+
+        # Assert
+        self.assertTrue(contained)
+        prompt.assert_called_once()
+        run.assert_not_called()
+
+    def test_GIVEN_pushes_deferred_WHEN_step_committed_THEN_nothing_pushed_until_push_deferred(self):
+        # Arrange
+        self._commit_deferred()
+        before = self._remote_branches("repo")
+
+        # Act
+        errors = push_deferred()
+
+        # Assert
+        self.assertEqual({}, errors)
+        self.assertEqual(["main"], before)
+        self.assertEqual(["Ticket1_Add_IOC_FIRST", "main"], self._remote_branches("repo"))
+        self.assertIsNone(repo_session(self.path).unpushed_branch)
+
+    def test_GIVEN_pushes_deferred_WHEN_discarded_THEN_commit_kept_locally_and_not_pushed(self):
+        # Arrange
+        session = self._commit_deferred()
+
+        # Act
+        discard_deferred_pushes()
+        push_deferred()
+
+        # Assert
+        self.assertEqual(["main"], self._remote_branches("repo"))
+        self.assertEqual("Add new file", session._repo.head.commit.message.strip())
+
+    def test_GIVEN_new_repository_session_WHEN_branch_prepared_and_step_committed_THEN_few_git_processes_run(self):
+        # Arrange
+        session = RepoWrapper(self.path)
+
+        # Act
+        with span("prepare for process count", "step"):
+            session.prepare_new_branch("Ticket1_Add_IOC_FIRST")
+        with open(os.path.join(self.path, "new.txt"), "w") as f:
+            f.write("New\n")
+        with span("commit for process count", "step"):
+            session.push_all_changes("Add new file", paths=[os.path.join(self.path, "new.txt")])
+
+        # Assert
+        # The new branch is not on the remote, so the default branch is fetched again without it
+        self.assertEqual(["status", "for-each-ref", "fetch", "fetch", "checkout", "push"],
+                         self._git_commands("prepare for process count"))
+        self.assertEqual(["add", "diff", "commit", "push"], self._git_commands("commit for process count"))
+
+    def test_GIVEN_pushes_deferred_WHEN_ioc_step_fails_THEN_nothing_pushed(self):
+        # Arrange
+        set_deferred_push(True)
+        self.addCleanup(set_deferred_push, False)
+        other = self._make_repo("other")
+        generator = os.path.join(self.root, "failing_generator.py")
+        with open(generator, "w") as f:
+            f.write("import sys\nsys.exit(2)\n")
+        device_info = mock.Mock(ioc_name="MYDEV")
+        device_info.ioc_path.return_value = os.path.join(self.path, "MYDEV")
+        device_info.ioc_app_name.side_effect = lambda index: "MYDEV-IOC-{:02d}".format(index)
+
+        def add_opi(device):
+            with open(os.path.join(other, "device.opi"), "w") as f:
+                f.write("<display/>\n")
+
+        steps = [Step(device_info, self.path, create_ioc, "Add template IOC", True, writes=[device_info.ioc_path()],
+                      device_count=1, ioc_dirs=[]),
+                 Step(device_info, other, add_opi, "Add template OPI file", True,
+                      writes=[os.path.join(other, "device.opi")])]
+
+        # Act
+        with mock.patch("utils.ioc_utils.ioc_skeleton_available", return_value=False), \
+                mock.patch("utils.ioc_utils.PERL", sys.executable), \
+                mock.patch("utils.ioc_utils.PERL_IOC_GENERATOR", generator):
+            run_steps(steps, "Ticket1_Add_IOC_MYDEV", max_workers=2,
+                      step_answers={"Add template IOC": True, "Add template OPI file": True})
+
+        # Assert
+        self.assertEqual(["main"], self._remote_branches("repo"))
+        self.assertEqual(["main"], self._remote_branches("other"))
+        self.assertEqual("Add template OPI file", repo_session(other)._repo.head.commit.message.strip())
+
+    def test_GIVEN_clone_without_local_default_branch_WHEN_branch_prepared_THEN_branched_from_origin(self):
+        # Arrange
+        self._git(["push", "-q", "origin", "main:other"], self.path)
+        clone = os.path.join(self.root, "clone")
+        self._git(["clone", "-q", "-b", "other", os.path.join(self.root, "repo.git"), clone], self.root)
+
+        # Act
+        repo_session(clone).prepare_new_branch("Ticket1_Add_IOC_FIRST")
+
+        # Assert
+        repo = repo_session(clone)._repo
+        self.assertEqual("Ticket1_Add_IOC_FIRST", repo.active_branch.name)
+        self.assertEqual(repo.commit("origin/main"), repo.head.commit)
+        self.assertNotIn("main", [branch.name for branch in repo.branches])
+
+    def test_GIVEN_two_tickets_WHEN_generated_one_step_at_a_time_THEN_each_branch_holds_only_its_own_paths(self):
+        # Arrange
+        def device_steps(device_info, *args):
+            def action(device):
+                # The second file stands in for what a step leaves behind outside the paths it commits, e.g. a
+                # support submodule's working tree
+                for folder, name in ((device.ioc_name, "declared.txt"), ("untracked", device.ioc_name + ".txt")):
+                    os.makedirs(os.path.join(self.path, folder), exist_ok=True)
+                    with open(os.path.join(self.path, folder, name), "w") as f:
+                        f.write("{}\n".format(device.ioc_name))
+            return [Step(device_info, self.path, action, "Add {}".format(device_info.ioc_name), True,
+                         writes=[os.path.join(self.path, device_info.ioc_name)])]
+
+        no_op = mock.Mock(return_value=None)
+        manifest = [ManifestEntry("AAA", "AAA", 7, 1), ManifestEntry("BBB", "BBB", 8, 1)]
+
+        # Act
+        with mock.patch("IBEX_device_generator._device_steps", side_effect=device_steps), \
+                mock.patch.multiple("IBEX_device_generator", EPICS=self.path, IOC_ROOT=self.path, CLIENT=self.path,
+                                    EPICS_SUPPORT=self.path, OPI_RESOURCES=self.path, load_opi_index=no_op,
+                                    add_support_modules_to_makefile=no_op, add_iocs_to_ioc_makefile=no_op,
+                                    add_opis_to_opi_info=no_op), \
+                mock.patch("utils.common_utils.ask_do_step", return_value=True):
+            generate_devices(manifest, True, None)
+
+        # Assert
+        self.assertEqual(["AAA/declared.txt", "README.md"], self._branch_files("Ticket7_Add_IOC_AAA"))
+        self.assertEqual(["BBB/declared.txt", "README.md"], self._branch_files("Ticket8_Add_IOC_BBB"))
@@ -0,0 +1,89 @@
+""" Tests for the utilities for reading the submodules of a repository from its .gitmodules file """
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.gitmodules_utils import parse_gitmodules, submodule_index, find_submodule, Submodule
+
+GITMODULES = """# Submodules of EPICS
+[submodule "base"]
+\tpath = base/master
+\turl = https://github.com/ISISComputingGroup/EPICS-base.git
+[submodule "mydev"]
+\tpath = "support/mydev/master" ; comment
+\turl = https://github.com/ISISComputingGroup/EPICS-mydev
+\tbranch = main
+"""
+
+
+class GitModulesUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _write_gitmodules(self, content):
+        with open(os.path.join(self.path, ".gitmodules"), "w") as f:
+            f.write(content)
+
+    def test_GIVEN_gitmodules_WHEN_parsed_THEN_name_path_and_url_of_each_submodule_returned(self):
+        # Act
+        submodules = parse_gitmodules(GITMODULES)
+
+        # Assert
+        self.assertEqual([Submodule("base", "base/master", "https://github.com/ISISComputingGroup/EPICS-base.git"),
+                          Submodule("mydev", "support/mydev/master",
+                                    "https://github.com/ISISComputingGroup/EPICS-mydev")], submodules)
+
+    def test_GIVEN_url_differing_in_case_and_suffix_WHEN_submodule_found_THEN_found(self):
+        # Arrange
+        self._write_gitmodules(GITMODULES)
+
+        # Act
+        submodule = find_submodule(self.path, url="https://github.com/isiscomputinggroup/EPICS-mydev.git/")
+
+        # Assert
+        self.assertEqual("mydev", submodule.name)
+
+    def test_GIVEN_unknown_url_WHEN_submodule_found_by_name_THEN_found(self):
+        # Arrange
+        self._write_gitmodules(GITMODULES)
+
+        # Act
+        submodule = find_submodule(self.path, "base", "https://example.com/other")
+
+        # Assert
+        self.assertEqual("base/master", submodule.path)
+
+    def test_GIVEN_no_gitmodules_WHEN_submodule_found_THEN_none(self):
+        # Act
+        submodule = find_submodule(self.path, "base", "https://github.com/ISISComputingGroup/EPICS-base.git")
+
+        # Assert
+        self.assertIsNone(submodule)
+
+    def test_GIVEN_unchanged_gitmodules_WHEN_indexed_again_THEN_not_read_again(self):
+        # Arrange
+        self._write_gitmodules(GITMODULES)
+        first = submodule_index(self.path)
+
+        # Act
+        with mock.patch("utils.gitmodules_utils.parse_gitmodules") as parse:
+            second = submodule_index(self.path)
+
+        # Assert
+        parse.assert_not_called()
+        self.assertIs(first, second)
+
+    def test_GIVEN_submodule_added_WHEN_indexed_again_THEN_new_submodule_found(self):
+        # Arrange
+        self._write_gitmodules(GITMODULES)
+        submodule_index(self.path)
+
+        # Act
+        self._write_gitmodules(GITMODULES + '[submodule "other"]\n\tpath = support/other/master\n\turl = other.git\n')
+
+        # Assert
+        self.assertEqual("support/other/master", find_submodule(self.path, "other").path)
@@ -1,9 +1,27 @@
 """ Test the GUI utilities """
+import os
+import shutil
+import tempfile
 import unittest
-from utils.gui_utils import _generate_opi_entry
+from unittest import mock
+from templates.paths import OPI
+from utils.file_system_utils import record_writes
+from utils.gui_utils import _generate_opi_entry, _splice_opi_entries, _rewrite_opi_info, create_opi
+from utils.opi_index_utils import read_opis
 from lxml import etree
 
 
+def _opi_keys(opi_info):
+    """
+    Args:
+        opi_info: The content of opi_info.xml
+
+    Returns:
+        The set of OPI keys
+    """
+    return set(read_opis(opi_info))
+
+
 class GuiUtilsTests(unittest.TestCase):
 
     def test_GIVEN_simple_opi_properties_WHEN_an_opi_is_generated_THEN_the_output_matches_the_standard_format(self):
@@ -18,3 +36,60 @@ class GuiUtilsTests(unittest.TestCase):
 
         # Assert
         self.assertEqual(actual, expected)
+
+    def test_GIVEN_opi_info_with_entries_WHEN_keys_read_THEN_only_keys_of_opis_returned(self):
+        # Arrange
+        opi_info = b"<?xml version='1.0' encoding='UTF-8'?>\n<opiinfo>\n  <opis>\n" \
+                   b"    <entry><key>RING</key><value><macros><macro><name>NOT_A_KEY</name></macro></macros></value>" \
+                   b"</entry>\n    <entry><key>SWORD</key><value/></entry>\n  </opis>\n</opiinfo>\n"
+
+        # Act
+        keys = _opi_keys(opi_info)
+
+        # Assert
+        self.assertEqual({"RING", "SWORD"}, keys)
+
+    def test_GIVEN_opi_info_with_entries_WHEN_entries_spliced_THEN_existing_content_kept_and_entries_indented(self):
+        # Arrange
+        head = b"<?xml version='1.0' encoding='UTF-8'?>\r\n<opiinfo>\r\n  <opis>\r\n" \
+               b"    <entry><key>RING</key><value/></entry>\r\n"
+        tail = b"  </opis>\r\n</opiinfo>\r\n"
+
+        # Act
+        spliced = _splice_opi_entries(head + tail, [_generate_opi_entry("SWORD", "sword.opi", "a sword", "SWORD")])
+
+        # Assert
+        self.assertTrue(spliced.startswith(head + b"    <entry>\r\n      <key>SWORD</key>\r\n"))
+        self.assertTrue(spliced.endswith(b"    </entry>\r\n" + tail))
+        self.assertEqual({"RING", "SWORD"}, _opi_keys(spliced))
+
+    def test_GIVEN_opi_info_with_empty_list_on_one_line_WHEN_entries_spliced_THEN_none_returned_and_rewrite_adds_entry(self):
+        # Arrange
+        opi_info = b"<?xml version='1.0' encoding='UTF-8'?>\n<opiinfo><opis/></opiinfo>\n"
+        entries = [_generate_opi_entry("SWORD", "sword.opi", "a sword", "SWORD")]
+
+        # Act
+        spliced = _splice_opi_entries(opi_info, entries)
+        rewritten = _rewrite_opi_info(opi_info, entries)
+
+        # Assert
+        self.assertIsNone(spliced)
+        self.assertEqual({"SWORD"}, _opi_keys(rewritten))
+
+    def test_GIVEN_new_device_WHEN_opi_created_THEN_written_once_with_device_macro(self):
+        # Arrange
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        device_info = mock.Mock(ioc_name="MYDEV")
+        device_info.opi_file_path.return_value = os.path.join(directory, "mydev.opi")
+        with open(OPI) as f:
+            expected = f.read().replace("$(DEVICE)", "$(MYDEV)")
+
+        # Act
+        with record_writes() as write_stats:
+            create_opi(device_info, opi_entries=[])
+
+        # Assert
+        self.assertEqual(1, write_stats.files_written)
+        with open(device_info.opi_file_path()) as f:
+            self.assertEqual(expected, f.read())
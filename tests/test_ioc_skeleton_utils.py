@@ -0,0 +1,176 @@
+""" Tests for generating IOCs from a snapshot of makeBaseApp.pl output """
+import filecmp
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from system_paths import PERL, PERL_IOC_GENERATOR
+from utils.ioc_skeleton_utils import render_ioc_skeleton, capture_ioc_skeleton, ioc_skeleton_available, \
+    _base_app_commands, APP_NAME, APP_IDENTIFIER, IOC_NAME
+from utils.ioc_utils import _run_ioc_template_setup
+
+# The perl the benchmarks use in place of the real one. It creates the files makeBaseApp.pl creates for an IBEX IOC,
+# and the snapshot in FIXTURE was captured from it with capture_ioc_skeleton, with the architecture windows-x64
+STUB_PERL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "stubs", "perl")
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ioc_skeleton")
+
+
+def _stub_perl():
+    """
+    Returns: Patches that make the IOC skeleton utilities run the stand in perl, as the snapshot in FIXTURE was taken
+    """
+    return mock.patch.multiple("utils.ioc_skeleton_utils", PERL=STUB_PERL, PERL_IOC_GENERATOR="makeBaseApp.pl",
+                               ARCHITECTURE="windows-x64", EPICS="C:\\Instrument\\Apps\\EPICS")
+
+
+class IocSkeletonUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.skeleton_dir = tempfile.mkdtemp()
+        self.ioc_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.skeleton_dir)
+        self.addCleanup(shutil.rmtree, self.ioc_path)
+        self.device_info = mock.Mock()
+        self.device_info.ioc_name = "MYDEV"
+        self.device_info.ioc_path.return_value = self.ioc_path
+        self.device_info.ioc_app_name.side_effect = lambda index: "MYDEV-IOC-{:02d}".format(index)
+
+    def _write(self, root, content, *parts):
+        path = os.path.join(root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _read(self, *parts):
+        with open(os.path.join(self.ioc_path, *parts)) as f:
+            return f.read()
+
+    def _write_skeleton(self):
+        self._write(self.skeleton_dir, "DIRS += $(wildcard *App)\n", "Makefile")
+        self._write(self.skeleton_dir, "APPNAME={}\n".format(APP_NAME), APP_NAME + "App", "src", "Makefile")
+        self._write(self.skeleton_dir, "{}_registerRecordDeviceDriver pdbbase\n# {}\n".format(APP_IDENTIFIER, IOC_NAME),
+                    "iocBoot", "ioc" + APP_NAME, "st.cmd")
+
+    def test_GIVEN_no_snapshot_WHEN_checked_THEN_not_available(self):
+        # Act
+        available = ioc_skeleton_available(self.skeleton_dir)
+
+        # Assert
+        self.assertFalse(available)
+
+    def test_GIVEN_snapshot_WHEN_rendered_THEN_tokens_replaced_in_names_and_content_for_each_app(self):
+        # Arrange
+        self._write_skeleton()
+
+        # Act
+        render_ioc_skeleton(self.device_info, 2, self.skeleton_dir)
+
+        # Assert
+        self.assertEqual("DIRS += $(wildcard *App)\n", self._read("Makefile"))
+        for app in ("MYDEV-IOC-01", "MYDEV-IOC-02"):
+            self.assertEqual("APPNAME={}\n".format(app), self._read(app + "App", "src", "Makefile"))
+            self.assertEqual("{}_registerRecordDeviceDriver pdbbase\n# MYDEV\n".format(app.replace("-", "_")),
+                             self._read("iocBoot", "ioc" + app, "st.cmd"))
+
+    def test_GIVEN_shared_file_exists_WHEN_rendered_THEN_shared_file_left_alone(self):
+        # Arrange
+        self._write_skeleton()
+        self._write(self.ioc_path, "# Edited\n", "Makefile")
+
+        # Act
+        render_ioc_skeleton(self.device_info, 1, self.skeleton_dir)
+
+        # Assert
+        self.assertEqual("# Edited\n", self._read("Makefile"))
+        self.assertEqual("APPNAME=MYDEV-IOC-01\n", self._read("MYDEV-IOC-01App", "src", "Makefile"))
+
+    def test_GIVEN_generated_files_WHEN_captured_THEN_placeholder_names_replaced_with_tokens(self):
+        # Arrange
+        def generate(commands, working_dir, max_workers=1):
+            self._write(working_dir, "APPNAME=SKELETON-IOC-01\n", "SKELETON-IOC-01App", "src", "Makefile")
+            self._write(working_dir, "SKELETON_IOC_01_registerRecordDeviceDriver\n", "iocBoot", "iocSKELETON-IOC-01",
+                        "st.cmd")
+            return [mock.Mock(returncode=0) for _ in commands]
+
+        # Act
+        with mock.patch("utils.ioc_skeleton_utils.run_commands", side_effect=generate):
+            capture_ioc_skeleton(self.skeleton_dir)
+
+        # Assert
+        with open(os.path.join(self.skeleton_dir, APP_NAME + "App", "src", "Makefile")) as f:
+            self.assertEqual("APPNAME={}\n".format(APP_NAME), f.read())
+        with open(os.path.join(self.skeleton_dir, "iocBoot", "ioc" + APP_NAME, "st.cmd")) as f:
+            self.assertEqual("{}_registerRecordDeviceDriver\n".format(APP_IDENTIFIER), f.read())
+
+    @unittest.skipUnless(os.path.exists(PERL) and os.path.exists(PERL_IOC_GENERATOR), "makeBaseApp.pl not available")
+    def test_GIVEN_snapshot_of_makeBaseApp_WHEN_rendered_THEN_same_files_as_makeBaseApp(self):
+        # Arrange
+        expected = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, expected)
+        for i in (1, 2):
+            for command in _base_app_commands(self.device_info.ioc_app_name(i)):
+                subprocess.run(command, cwd=expected, check=True, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        capture_ioc_skeleton(self.skeleton_dir)
+
+        # Act
+        render_ioc_skeleton(self.device_info, 2, self.skeleton_dir)
+
+        # Assert
+        self._assert_same_trees(expected, self.ioc_path)
+
+    def _run_stub_perl(self, directory, device_count):
+        with _stub_perl():
+            for i in range(1, device_count + 1):
+                for command in _base_app_commands(self.device_info.ioc_app_name(i)):
+                    subprocess.run(command, cwd=directory, check=True, stdin=subprocess.DEVNULL)
+
+    @unittest.skipIf(os.name == "nt", "The stand in perl is run through its shebang line")
+    def test_GIVEN_committed_snapshot_WHEN_rendered_THEN_same_files_as_the_perl_it_was_taken_from(self):
+        # Arrange
+        expected = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, expected)
+        self._run_stub_perl(expected, 2)
+
+        # Act
+        with _stub_perl():
+            render_ioc_skeleton(self.device_info, 2, FIXTURE)
+
+        # Assert
+        self._assert_same_trees(expected, self.ioc_path)
+
+    @unittest.skipIf(os.name == "nt", "The stand in perl is run through its shebang line")
+    def test_GIVEN_stand_in_perl_WHEN_captured_THEN_same_as_committed_snapshot(self):
+        # Arrange
+        skeleton_dir = os.path.join(self.skeleton_dir, "skeleton")
+
+        # Act
+        with _stub_perl():
+            capture_ioc_skeleton(skeleton_dir)
+
+        # Assert
+        self._assert_same_trees(FIXTURE, skeleton_dir)
+
+    def test_GIVEN_snapshot_available_WHEN_iocs_set_up_THEN_rendered_from_snapshot_without_running_perl(self):
+        # Act
+        with mock.patch("utils.ioc_utils.ioc_skeleton_available", return_value=True), \
+                mock.patch("utils.ioc_utils.render_ioc_skeleton",
+                           side_effect=lambda info, count: render_ioc_skeleton(info, count, FIXTURE)), \
+                mock.patch("utils.ioc_utils.run_commands") as run_commands, _stub_perl():
+            _run_ioc_template_setup(self.device_info, 2)
+
+        # Assert
+        run_commands.assert_not_called()
+        self.assertIn('dbLoadDatabase "dbd/MYDEV-IOC-02.dbd"\n',
+                      self._read("iocBoot", "iocMYDEV-IOC-02", "st.cmd"))
+
+    def _assert_same_trees(self, expected, actual):
+        comparison = filecmp.dircmp(expected, actual)
+        self.assertEqual([], comparison.left_only + comparison.right_only, expected)
+        _, mismatch, errors = filecmp.cmpfiles(expected, actual, comparison.common_files, shallow=False)
+        self.assertEqual([], mismatch + errors, expected)
+        for name in comparison.common_dirs:
+            self._assert_same_trees(os.path.join(expected, name), os.path.join(actual, name))
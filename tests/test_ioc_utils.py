@@ -0,0 +1,65 @@
+""" Tests for generating IOCs """
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.common_utils import run_component
+from utils.ioc_utils import _clone_ioc, create_ioc
+
+
+class IocUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ioc_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.ioc_path)
+        self.device_info = mock.Mock()
+        self.device_info.ioc_path.return_value = self.ioc_path
+        self.device_info.ioc_app_name.side_effect = lambda index: "MYDEV-IOC-{:02d}".format(index)
+        self.device_info.ioc_boot_path.side_effect = \
+            lambda index: os.path.join(self.ioc_path, "iocBoot", "iocMYDEV-IOC-{:02d}".format(index))
+
+    def _write(self, content, *parts):
+        path = os.path.join(self.ioc_path, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _read(self, *parts):
+        with open(os.path.join(self.ioc_path, *parts)) as f:
+            return f.read()
+
+    def test_GIVEN_first_ioc_generated_WHEN_cloned_THEN_app_and_boot_copied_with_names_replaced(self):
+        # Arrange
+        self._write("APPNAME=MYDEV-IOC-01\n# _01_APP_NAME_\n", "MYDEV-IOC-01App", "src", "Makefile")
+        self._write("int main() {}\n", "MYDEV-IOC-01App", "src", "MYDEV-IOC-01Main.cpp")
+        self._write("MYDEV_IOC_01_registerRecordDeviceDriver pdbbase\n", "iocBoot", "iocMYDEV-IOC-01", "st.cmd")
+
+        # Act
+        _clone_ioc(self.device_info, 12)
+
+        # Assert
+        self.assertEqual("APPNAME=MYDEV-IOC-12\n# _01_APP_NAME_\n", self._read("MYDEV-IOC-12App", "src", "Makefile"))
+        self.assertEqual("int main() {}\n", self._read("MYDEV-IOC-12App", "src", "MYDEV-IOC-12Main.cpp"))
+        self.assertEqual("MYDEV_IOC_12_registerRecordDeviceDriver pdbbase\n",
+                         self._read("iocBoot", "iocMYDEV-IOC-12", "st.cmd"))
+        self.assertEqual("APPNAME=MYDEV-IOC-01\n# _01_APP_NAME_\n", self._read("MYDEV-IOC-01App", "src", "Makefile"))
+
+    def test_GIVEN_ioc_generator_that_fails_WHEN_ioc_step_run_THEN_step_fails(self):
+        # Arrange
+        generator = os.path.join(self.ioc_path, "failing_generator.py")
+        self._write("import sys\nsys.exit(2)\n", generator)
+
+        # Act
+        with mock.patch("utils.ioc_utils.ioc_skeleton_available", return_value=False), \
+                mock.patch("utils.ioc_utils.PERL", sys.executable), \
+                mock.patch("utils.ioc_utils.PERL_IOC_GENERATOR", generator), \
+                mock.patch("utils.ioc_utils.StagingArea") as staging:
+            succeeded = run_component(self.device_info, "branch", self.ioc_path, create_ioc, "Add template IOC", False,
+                                      device_count=1, ioc_dirs=[])
+
+        # Assert
+        self.assertFalse(succeeded)
+        staging.assert_not_called()
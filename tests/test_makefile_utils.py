@@ -0,0 +1,61 @@
+""" Tests for reading and editing the lists of directories in makefiles """
+import unittest
+
+from utils.makefile_utils import Makefile
+
+IOC_MAKEFILE = [
+    "TOP = .\n",
+    "## list all valid IOC directories that we may want to build at some point\n",
+    "IOCDIRS = AG33220A HLG2 \\\n",
+    "    CCD100 # A comment mentioning HLG\n",
+    "IOCDIRS += MCLEN MERCURY_ITC\n",
+    "\n",
+    "SUPPDIRS += asyn\n",
+    "include $(TOP)/configure/RULES_DIRS\n",
+]
+
+
+class MakefileUtilsTests(unittest.TestCase):
+
+    def test_GIVEN_list_with_continuation_and_comment_WHEN_checking_membership_THEN_only_exact_values_match(self):
+        # Arrange
+        makefile = Makefile(IOC_MAKEFILE)
+
+        # Act
+        members = [value for value in ("HLG", "HLG2", "CCD100", "MCLEN", "asyn") if makefile.contains("IOCDIRS", value)]
+
+        # Assert
+        self.assertEqual(["HLG2", "CCD100", "MCLEN"], members)
+
+    def test_GIVEN_several_new_values_WHEN_added_THEN_lines_inserted_after_last_assignment_and_others_unchanged(self):
+        # Arrange
+        makefile = Makefile(IOC_MAKEFILE)
+
+        # Act
+        added = makefile.add("IOCDIRS", ["HLG", "MCLEN", "NEWIOC", "HLG"])
+
+        # Assert
+        self.assertEqual(["HLG", "NEWIOC"], added)
+        self.assertEqual(IOC_MAKEFILE[:5] + ["IOCDIRS += HLG\n", "IOCDIRS += NEWIOC\n"] + IOC_MAKEFILE[5:],
+                         makefile.lines)
+
+    def test_GIVEN_values_added_to_one_list_WHEN_adding_to_a_later_list_THEN_later_list_position_is_kept(self):
+        # Arrange
+        makefile = Makefile(IOC_MAKEFILE)
+        makefile.add("IOCDIRS", ["NEWIOC"])
+
+        # Act
+        makefile.add("SUPPDIRS", ["newsupport"])
+
+        # Assert
+        self.assertEqual(["SUPPDIRS += asyn\n", "SUPPDIRS += newsupport\n"], makefile.lines[7:9])
+
+    def test_GIVEN_list_ending_on_last_line_without_newline_WHEN_added_THEN_value_goes_on_its_own_line(self):
+        # Arrange
+        makefile = Makefile(["SUPPDIRS += asyn"])
+
+        # Act
+        makefile.add("SUPPDIRS", ["newsupport"])
+
+        # Assert
+        self.assertEqual("SUPPDIRS += asyn\nSUPPDIRS += newsupport\n", makefile.text())
@@ -0,0 +1,99 @@
+""" Tests for the index of the OPIs the GUI already has """
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import opi_index_utils
+from utils.opi_index_utils import load_opi_index, existing_opi_problems
+
+ENTRY = "    <entry>\n      <key>{key}</key>\n      <value>\n        <path>{path}</path>\n      </value>\n    </entry>\n"
+
+
+def _opi_info(*keys):
+    entries = "".join(ENTRY.format(key=key, path=key.lower() + ".opi") for key in keys)
+    return "<?xml version='1.0' encoding='UTF-8'?>\n<opiinfo>\n  <opis>\n{}  </opis>\n</opiinfo>\n".format(entries)
+
+
+class OpiIndexUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch("utils.cache_utils.CACHE_DIR", os.path.join(self.directory, ".cache"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = os.path.join(self.directory, "opi_info.xml")
+        self._write(_opi_info("RING", "SWORD"))
+
+    def _write(self, content):
+        with open(self.path, "w") as f:
+            f.write(content)
+
+    def test_GIVEN_index_loaded_WHEN_loaded_again_with_file_unchanged_THEN_file_is_not_read(self):
+        # Arrange
+        load_opi_index(self.path)
+
+        # Act
+        with mock.patch.object(opi_index_utils, "read_opis") as read_opis:
+            opis = load_opi_index(self.path)
+
+        # Assert
+        self.assertEqual({"RING": "ring.opi", "SWORD": "sword.opi"}, opis)
+        read_opis.assert_not_called()
+
+    def test_GIVEN_index_loaded_WHEN_entries_appended_THEN_only_new_entries_are_read(self):
+        # Arrange
+        load_opi_index(self.path)
+        self._write(_opi_info("RING", "SWORD", "SHIELD"))
+
+        # Act
+        with mock.patch.object(opi_index_utils, "read_opis", wraps=opi_index_utils.read_opis) as read_opis:
+            opis = load_opi_index(self.path)
+
+        # Assert
+        self.assertEqual({"RING", "SWORD", "SHIELD"}, set(opis))
+        self.assertNotEqual(0, read_opis.call_args[0][1])
+
+    def test_GIVEN_index_loaded_WHEN_existing_entry_removed_THEN_whole_file_is_read_again(self):
+        # Arrange
+        load_opi_index(self.path)
+        self._write(_opi_info("SWORD", "SHIELD"))
+
+        # Act
+        opis = load_opi_index(self.path)
+
+        # Assert
+        self.assertEqual({"SWORD", "SHIELD"}, set(opis))
+
+    def test_GIVEN_key_in_index_and_opi_file_exists_WHEN_checked_THEN_both_problems_reported(self):
+        # Arrange
+        device_info = mock.Mock()
+        device_info.opi_key.return_value = "RING"
+        device_info.opi_file_path.return_value = self.path
+
+        # Act
+        problems = existing_opi_problems(device_info, load_opi_index(self.path))
+
+        # Assert
+        self.assertEqual(2, len(problems))
+        self.assertIn("ring.opi", problems[0])
+
+    def test_GIVEN_index_of_one_file_WHEN_another_file_indexed_THEN_first_index_kept(self):
+        # Arrange
+        load_opi_index(self.path)
+        other = os.path.join(self.directory, "other", "opi_info.xml")
+        os.makedirs(os.path.dirname(other))
+        with open(other, "w") as f:
+            f.write(_opi_info("STAFF"))
+
+        # Act
+        other_opis = load_opi_index(other)
+        with mock.patch.object(opi_index_utils, "read_opis") as read_opis:
+            opis = load_opi_index(self.path)
+
+        # Assert
+        self.assertEqual({"STAFF": "staff.opi"}, other_opis)
+        self.assertEqual({"RING": "ring.opi", "SWORD": "sword.opi"}, opis)
+        read_opis.assert_not_called()
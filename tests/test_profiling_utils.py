@@ -0,0 +1,59 @@
+""" Tests for the timing and resource use of steps """
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from utils.profiling_utils import span, spans, write_profile, trace_path
+
+
+class ProfilingUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_GIVEN_nested_spans_WHEN_they_finish_THEN_wall_time_status_and_parent_are_recorded(self):
+        # Act
+        with span("outer test span", "step"):
+            with span("inner test span", "command") as inner:
+                inner.status = subprocess.call([sys.executable, "-c", "import sys; sys.exit(3)"])
+
+        # Assert
+        recorded = {s.name: s for s in spans()}
+        self.assertEqual(3, recorded["inner test span"].status)
+        self.assertEqual("outer test span", recorded["inner test span"].parent)
+        self.assertEqual(0, recorded["outer test span"].status)
+        self.assertGreaterEqual(recorded["outer test span"].wall_time, recorded["inner test span"].wall_time)
+
+    def test_GIVEN_exception_in_span_WHEN_it_finishes_THEN_status_is_exception_name(self):
+        # Act
+        with self.assertRaises(ValueError):
+            with span("failing test span", "step"):
+                raise ValueError()
+
+        # Assert
+        self.assertEqual("ValueError", [s for s in spans() if s.name == "failing test span"][0].status)
+
+    def test_GIVEN_spans_WHEN_profile_written_THEN_spans_and_chrome_trace_events_are_written(self):
+        # Arrange
+        profile = os.path.join(self.directory, "profile.json")
+        with span("written test span", "git"):
+            pass
+
+        # Act
+        write_profile(profile)
+
+        # Assert
+        with open(profile) as f:
+            self.assertIn("written test span", [s["name"] for s in json.load(f)["spans"]])
+        with open(trace_path(profile)) as f:
+            event = [e for e in json.load(f)["traceEvents"] if e["name"] == "written test span"][0]
+        self.assertEqual("X", event["ph"])
+        self.assertEqual("git", event["cat"])
+        self.assertEqual(os.path.join(self.directory, "profile.trace.json"), trace_path(profile))
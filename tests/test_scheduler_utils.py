@@ -0,0 +1,191 @@
+""" Tests for the step scheduler """
+import threading
+import unittest
+from os.path import join
+from unittest import mock
+
+from IBEX_device_generator import generate_devices, _device_steps
+from utils.device_info_generator import DeviceInfoGenerator
+from utils.batch_utils import ManifestEntry
+from utils.scheduler_utils import Step, dependencies, run_steps
+
+ROOT = join("root", "EPICS")
+SUPPORT = join(ROOT, "support", "device", "master")
+CLIENT = join("root", "ibex_gui")
+
+
+def _step(name, path, writes=(), reads=(), after=(), use_git=False, action=None):
+    return Step(name, path, action or (lambda device: None), name, use_git, reads=reads, writes=writes, after=after)
+
+
+class SchedulerUtilsTests(unittest.TestCase):
+
+    def _manifest_steps(self, manifest):
+        with mock.patch("IBEX_device_generator.run_steps") as run, \
+                mock.patch("IBEX_device_generator.load_opi_index"), \
+                mock.patch("IBEX_device_generator.existing_opi_problems", return_value=[]):
+            generate_devices(manifest, False, None, max_workers=2)
+        return run.call_args[0][0]
+
+    def _named(self, steps, commit_message):
+        return [step for step in steps if step.commit_message == commit_message]
+
+    def test_GIVEN_steps_writing_disjoint_paths_in_the_same_repo_WHEN_dependencies_found_THEN_steps_are_independent(self):
+        # Arrange
+        steps = [_step("tests", SUPPORT, writes=[join(SUPPORT, "system_tests", "tests")], use_git=True),
+                 _step("emulator", SUPPORT, writes=[join(SUPPORT, "system_tests", "lewis_emulators")], use_git=True)]
+
+        # Act
+        deps = dependencies(steps)
+
+        # Assert
+        self.assertEqual([set(), set()], deps)
+
+    def test_GIVEN_step_writing_inside_a_directory_an_earlier_step_writes_WHEN_dependencies_found_THEN_later_step_waits(self):
+        # Arrange
+        template = _step("template", SUPPORT, writes=[SUPPORT])
+        emulator = _step("emulator", SUPPORT, writes=[join(SUPPORT, "system_tests", "lewis_emulators")])
+
+        # Act
+        deps = dependencies([template, emulator])
+
+        # Assert
+        self.assertEqual({template}, deps[1])
+
+    def test_GIVEN_step_reading_what_an_earlier_step_writes_WHEN_dependencies_found_THEN_later_step_waits(self):
+        # Arrange
+        writer = _step("writer", CLIENT, writes=[join(CLIENT, "opi_info.xml")])
+        reader = _step("reader", CLIENT, reads=[join(CLIENT, "opi_info.xml")])
+
+        # Act
+        deps = dependencies([writer, reader])
+
+        # Assert
+        self.assertEqual({writer}, deps[1])
+
+    def test_GIVEN_git_step_on_a_repo_containing_a_later_steps_repo_WHEN_dependencies_found_THEN_later_step_waits(self):
+        # Arrange
+        submodule = _step("submodule", ROOT, writes=[join(ROOT, ".gitmodules")], use_git=True)
+        support = _step("support", SUPPORT, writes=[join(SUPPORT, "Makefile")], use_git=True)
+        opi = _step("opi", CLIENT, writes=[join(CLIENT, "device.opi")], use_git=True)
+
+        # Act
+        deps = dependencies([submodule, support, opi])
+
+        # Assert
+        self.assertEqual([set(), {submodule}, set()], deps)
+
+    def test_GIVEN_explicit_ordering_WHEN_dependencies_found_THEN_later_step_waits(self):
+        # Arrange
+        first = _step("first", ROOT)
+        second = _step("second", ROOT, after=[first])
+
+        # Act
+        deps = dependencies([first, second])
+
+        # Assert
+        self.assertEqual({first}, deps[1])
+
+    def test_GIVEN_several_workers_WHEN_steps_run_THEN_independent_steps_overlap_and_dependent_steps_wait(self):
+        # Arrange
+        barrier = threading.Barrier(2, timeout=5)
+        order = []
+
+        def independent(device):
+            barrier.wait()  # Only passes if both independent steps are running at once
+            order.append(device)
+
+        first = _step("first", ROOT, writes=[join(ROOT, "a")], action=independent)
+        second = _step("second", CLIENT, writes=[join(CLIENT, "b")], action=independent)
+        last = _step("last", ROOT, reads=[join(ROOT, "a")], action=order.append)
+        answers = {"first": True, "second": True, "last": True}
+
+        # Act
+        run_steps([first, second, last], "branch", max_workers=2, step_answers=answers)
+
+        # Assert
+        self.assertEqual({"first", "second"}, set(order[:2]))
+        self.assertEqual("last", order[2])
+
+    def test_GIVEN_step_answered_no_WHEN_steps_run_THEN_step_is_skipped(self):
+        # Arrange
+        order = []
+        steps = [_step("yes", ROOT, action=order.append), _step("no", CLIENT, action=order.append)]
+
+        # Act
+        run_steps(steps, "branch", max_workers=2, step_answers={"yes": True, "no": False})
+
+        # Assert
+        self.assertEqual(["yes"], order)
+
+    def test_GIVEN_git_steps_that_succeed_WHEN_steps_run_THEN_deferred_pushes_made(self):
+        # Arrange
+        steps = [_step("ioc", ROOT, writes=[join(ROOT, "ioc")], use_git=True),
+                 _step("opi", CLIENT, writes=[join(CLIENT, "device.opi")], use_git=True)]
+
+        # Act
+        with mock.patch("utils.scheduler_utils.run_component", return_value=True), \
+                mock.patch("utils.git_utils.prepare_repositories"), \
+                mock.patch("utils.git_utils.push_deferred") as push, \
+                mock.patch("utils.git_utils.discard_deferred_pushes") as discard:
+            run_steps(steps, "branch", max_workers=2, step_answers={"ioc": True, "opi": True})
+
+        # Assert
+        push.assert_called_once_with(2)
+        discard.assert_not_called()
+
+    def test_GIVEN_git_step_that_fails_WHEN_steps_run_THEN_deferred_pushes_discarded(self):
+        # Arrange
+        steps = [_step("ioc", ROOT, writes=[join(ROOT, "ioc")], use_git=True),
+                 _step("opi", CLIENT, writes=[join(CLIENT, "device.opi")], use_git=True)]
+
+        # Act
+        def run_component(device, *args, **kwargs):
+            return device == "ioc"
+
+        with mock.patch("utils.scheduler_utils.run_component", side_effect=run_component), \
+                mock.patch("utils.git_utils.prepare_repositories"), \
+                mock.patch("utils.git_utils.push_deferred") as push, \
+                mock.patch("utils.git_utils.discard_deferred_pushes") as discard:
+            run_steps(steps, "branch", max_workers=2, step_answers={"ioc": True, "opi": True})
+
+        # Assert
+        push.assert_not_called()
+        discard.assert_called_once_with()
+
+    def test_GIVEN_two_devices_for_a_ticket_WHEN_steps_found_THEN_ioc_startups_made_once_after_both_iocs(self):
+        # Arrange
+        steps = self._manifest_steps([ManifestEntry("AAA", "AAA", 7, 1), ManifestEntry("BBB", "BBB", 7, 1)])
+
+        # Act
+        deps = dependencies(steps)
+
+        # Assert
+        startups = self._named(steps, "Make IOC startup files")
+        self.assertEqual(1, len(startups))
+        self.assertTrue(set(self._named(steps, "Add template IOC")) <= deps[steps.index(startups[0])])
+
+    def test_GIVEN_iocs_of_two_devices_sharing_outputs_WHEN_dependencies_found_THEN_second_ioc_step_waits(self):
+        # Arrange
+        first, second = (_device_steps(DeviceInfoGenerator(name, name), 1, False, None) for name in ("AAA", "BBB"))
+        steps = first + second
+
+        # Act
+        deps = dependencies(steps)
+
+        # Assert
+        first_ioc, second_ioc = self._named(steps, "Add template IOC")
+        first_startups, second_startups = self._named(steps, "Make IOC startup files")
+        self.assertIn(first_ioc, deps[steps.index(second_ioc)])
+        self.assertIn(first_startups, deps[steps.index(second_startups)])
+
+    def test_GIVEN_shared_edits_collected_for_two_devices_WHEN_dependencies_found_THEN_ioc_steps_independent(self):
+        # Arrange
+        steps = self._manifest_steps([ManifestEntry("AAA", "AAA", 7, 1), ManifestEntry("BBB", "BBB", 7, 1)])
+
+        # Act
+        deps = dependencies(steps)
+
+        # Assert
+        first_ioc, second_ioc = self._named(steps, "Add template IOC")
+        self.assertNotIn(first_ioc, deps[steps.index(second_ioc)])
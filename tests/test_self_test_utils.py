@@ -0,0 +1,67 @@
+""" Tests for caching the result of the generator's own tests """
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.self_test_utils import run_tests_if_changed, source_fingerprint
+
+
+class SelfTestUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        patcher = mock.patch("utils.cache_utils.CACHE_DIR", self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_GIVEN_tests_passed_WHEN_run_again_with_no_changes_THEN_tests_are_not_rerun(self):
+        # Arrange
+        run_tests = mock.Mock(return_value=True)
+
+        # Act
+        first = run_tests_if_changed(run_tests)
+        second = run_tests_if_changed(run_tests)
+
+        # Assert
+        self.assertTrue(first and second)
+        self.assertEqual(1, run_tests.call_count)
+
+    def test_GIVEN_tests_failed_WHEN_run_again_THEN_tests_are_rerun(self):
+        # Arrange
+        run_tests = mock.Mock(return_value=False)
+
+        # Act
+        run_tests_if_changed(run_tests)
+        passed = run_tests_if_changed(run_tests)
+
+        # Assert
+        self.assertFalse(passed)
+        self.assertEqual(2, run_tests.call_count)
+
+    def test_GIVEN_tests_passed_WHEN_forced_THEN_tests_are_rerun(self):
+        # Arrange
+        run_tests = mock.Mock(return_value=True)
+
+        # Act
+        run_tests_if_changed(run_tests)
+        run_tests_if_changed(run_tests, force=True)
+
+        # Assert
+        self.assertEqual(2, run_tests.call_count)
+
+    def test_GIVEN_tests_passed_WHEN_fingerprint_changes_THEN_tests_are_rerun(self):
+        # Arrange
+        run_tests = mock.Mock(return_value=True)
+        run_tests_if_changed(run_tests)
+
+        # Act
+        with mock.patch("utils.self_test_utils.source_fingerprint", return_value="changed"):
+            run_tests_if_changed(run_tests)
+
+        # Assert
+        self.assertEqual(2, run_tests.call_count)
+
+    def test_GIVEN_no_changes_WHEN_fingerprint_calculated_twice_THEN_fingerprints_match(self):
+        self.assertEqual(source_fingerprint(), source_fingerprint())
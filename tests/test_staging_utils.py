@@ -0,0 +1,71 @@
+""" Tests for staging the files a step writes before writing them to the tree """
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.staging_utils import StagingArea, StagingError
+
+
+class StagingUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.template = os.path.join(self.root, "template.txt")
+        with open(self.template, "w") as f:
+            f.write("Device _DEVICE_\n")
+        self.target = os.path.join(self.root, "device", "app", "Makefile")
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_GIVEN_copy_substitute_and_append_staged_WHEN_flushed_THEN_file_written_once_with_final_content(self):
+        # Arrange
+        staging = StagingArea(self.root)
+        staging.copy(self.template, self.target)
+        staging.replace([self.target], [("_DEVICE_", "MYDEV")])
+        staging.append(self.target, ["ioctests:\n"])
+
+        # Act
+        not_yet_written = os.path.exists(self.target)
+        written = staging.flush()
+
+        # Assert
+        self.assertFalse(not_yet_written)
+        self.assertEqual([os.path.abspath(self.target)], written)
+        self.assertEqual("Device MYDEV\nioctests:\n", self._read(self.target))
+        self.assertEqual(0, len(staging))
+
+    def test_GIVEN_write_outside_root_and_removal_of_missing_file_WHEN_flushed_THEN_nothing_written_and_error_raised(self):
+        # Arrange
+        staging = StagingArea(os.path.join(self.root, "device"))
+        staging.write(self.target, "inside\n")
+        staging.write(os.path.join(self.root, "outside.txt"), "outside\n")
+        staging.remove(os.path.join(self.root, "device", "missing.txt"))
+
+        # Act
+        with self.assertRaises(StagingError) as context:
+            staging.flush()
+
+        # Assert
+        self.assertIn("outside.txt", str(context.exception))
+        self.assertIn("missing.txt", str(context.exception))
+        self.assertFalse(os.path.exists(self.target))
+
+    def test_GIVEN_file_staged_for_removal_WHEN_flushed_THEN_file_removed_and_no_longer_exists_in_staging(self):
+        # Arrange
+        os.makedirs(os.path.dirname(self.target))
+        with open(self.target, "w") as f:
+            f.write("generated\n")
+        staging = StagingArea(self.root)
+
+        # Act
+        staging.remove(os.path.dirname(self.target))
+        exists_once_flushed = staging.exists(self.target)
+        staging.flush()
+
+        # Assert
+        self.assertFalse(exists_once_flushed)
+        self.assertFalse(os.path.exists(os.path.dirname(self.target)))
@@ -0,0 +1,151 @@
+""" Tests for generating support modules from a snapshot of makeSupport.pl output """
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from system_paths import PERL, PERL_SUPPORT_GENERATOR
+from utils.staging_utils import StagingArea
+from utils.support_skeleton_utils import support_skeleton_available, stage_support_skeleton, \
+    capture_support_skeleton, make_support_command, tweak_make_support_output, SUPPORT_NAME
+
+# The perl the benchmarks use in place of the real one. It creates the files makeSupport.pl creates, and the snapshot
+# in FIXTURE was captured from it with capture_support_skeleton
+STUB_PERL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "stubs", "perl")
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "support_skeleton")
+
+
+def _stub_perl():
+    """
+    Returns: Patches that make the support skeleton utilities run the stand in perl, as the snapshot in FIXTURE was
+        taken
+    """
+    return mock.patch.multiple("utils.support_skeleton_utils", PERL=STUB_PERL,
+                               PERL_SUPPORT_GENERATOR="makeSupport.pl")
+
+
+class SupportSkeletonUtilsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.skeleton_dir = tempfile.mkdtemp()
+        self.master_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.skeleton_dir)
+        self.addCleanup(shutil.rmtree, self.master_dir)
+        self.device_info = mock.Mock()
+        self.device_info.support_app_name.return_value = "my_dev"
+        self.device_info.support_master_dir.return_value = self.master_dir
+
+    def _write(self, root, content, *parts):
+        path = os.path.join(root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def _read(self, *parts):
+        with open(os.path.join(self.master_dir, *parts)) as f:
+            return f.read()
+
+    def _files(self, root):
+        return sorted(os.path.relpath(os.path.join(directory, name), root)
+                      for directory, _, names in os.walk(root) for name in names)
+
+    def test_GIVEN_no_snapshot_WHEN_checked_THEN_not_available(self):
+        # Act
+        available = support_skeleton_available(self.skeleton_dir)
+
+        # Assert
+        self.assertFalse(available)
+
+    def test_GIVEN_snapshot_WHEN_staged_and_flushed_THEN_tokens_replaced_in_names_and_content(self):
+        # Arrange
+        self._write(self.skeleton_dir, "DIRS += $(wildcard *Sup)\n", "Makefile")
+        self._write(self.skeleton_dir, "DB += {}.db\n".format(SUPPORT_NAME), SUPPORT_NAME + "Sup", "Makefile")
+        staging = StagingArea(self.master_dir)
+
+        # Act
+        stage_support_skeleton(staging, self.device_info, self.skeleton_dir)
+        staging.flush()
+
+        # Assert
+        self.assertEqual("DIRS += $(wildcard *Sup)\n", self._read("Makefile"))
+        self.assertEqual("DB += my_dev.db\n", self._read("my_devSup", "Makefile"))
+        self.assertEqual(["Makefile", os.path.join("my_devSup", "Makefile")], self._files(self.master_dir))
+
+    def test_GIVEN_make_support_output_WHEN_tweaked_THEN_db_removed_and_makefiles_changed(self):
+        # Arrange
+        self._write(self.master_dir, "TOP = .\n", "Makefile")
+        self._write(self.master_dir, "#DB += xxx.db\nDB += my_dev.proto\n", "my_devSup", "Makefile")
+        self._write(self.master_dir, "record(ai, \"$(P)VALUE\") {}\n", "my_devSup", "my_dev.db")
+        staging = StagingArea(self.master_dir)
+
+        # Act
+        tweak_make_support_output(staging, self.master_dir, "my_dev")
+        staging.flush()
+
+        # Assert
+        self.assertFalse(os.path.exists(os.path.join(self.master_dir, "my_devSup", "my_dev.db")))
+        self.assertEqual("DB += my_dev.db\n\n", self._read("my_devSup", "Makefile"))
+        self.assertEqual("TOP = .\n\nioctests:\n\t.\\system_tests\\run_tests.bat\n", self._read("Makefile"))
+
+    @unittest.skipUnless(os.path.exists(PERL) and os.path.exists(PERL_SUPPORT_GENERATOR),
+                         "makeSupport.pl not available")
+    def test_GIVEN_snapshot_of_makeSupport_WHEN_staged_THEN_same_files_as_tweaked_makeSupport_output(self):
+        # Arrange
+        expected = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, expected)
+        subprocess.run(make_support_command("my_dev"), cwd=expected, check=True, stdin=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        expected_staging = StagingArea(expected)
+        tweak_make_support_output(expected_staging, expected, "my_dev")
+        expected_staging.flush()
+        capture_support_skeleton(self.skeleton_dir)
+        staging = StagingArea(self.master_dir)
+
+        # Act
+        stage_support_skeleton(staging, self.device_info, self.skeleton_dir)
+        staging.flush()
+
+        # Assert
+        self.assertEqual(self._files(expected), self._files(self.master_dir))
+        for name in self._files(expected):
+            with open(os.path.join(expected, name), "rb") as f, open(os.path.join(self.master_dir, name), "rb") as g:
+                self.assertEqual(f.read(), g.read(), name)
+
+    @unittest.skipIf(os.name == "nt", "The stand in perl is run through its shebang line")
+    def test_GIVEN_committed_snapshot_WHEN_staged_THEN_same_files_as_tweaked_output_of_the_perl_it_was_taken_from(self):
+        # Arrange
+        expected = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, expected)
+        with _stub_perl():
+            subprocess.run(make_support_command("my_dev"), cwd=expected, check=True, stdin=subprocess.DEVNULL)
+        expected_staging = StagingArea(expected)
+        tweak_make_support_output(expected_staging, expected, "my_dev")
+        expected_staging.flush()
+        staging = StagingArea(self.master_dir)
+
+        # Act
+        stage_support_skeleton(staging, self.device_info, FIXTURE)
+        staging.flush()
+
+        # Assert
+        self._assert_same_files(expected, self.master_dir)
+
+    @unittest.skipIf(os.name == "nt", "The stand in perl is run through its shebang line")
+    def test_GIVEN_stand_in_perl_WHEN_captured_THEN_same_as_committed_snapshot(self):
+        # Arrange
+        skeleton_dir = os.path.join(self.skeleton_dir, "skeleton")
+
+        # Act
+        with _stub_perl():
+            capture_support_skeleton(skeleton_dir)
+
+        # Assert
+        self._assert_same_files(FIXTURE, skeleton_dir)
+
+    def _assert_same_files(self, expected, actual):
+        self.assertEqual(self._files(expected), self._files(actual))
+        for name in self._files(expected):
+            with open(os.path.join(expected, name), "rb") as f, open(os.path.join(actual, name), "rb") as g:
+                self.assertEqual(f.read(), g.read(), name)
@@ -0,0 +1,87 @@
+""" Utilities for generating several devices in a single run from a manifest """
+import csv
+from collections import namedtuple, OrderedDict
+
+DEFAULT_DEVICE_COUNT = 2
+
+ManifestEntry = namedtuple("ManifestEntry", ["ioc_name", "device_name", "ticket", "device_count"])
+
+
+class InvalidManifestError(Exception):
+    "Raised when a device manifest cannot be read."
+    pass
+
+
+def read_manifest(manifest_path):
+    """
+    Reads a CSV manifest of devices to generate. The manifest must have a header row with the columns ioc_name and
+    ticket. The columns device_name (defaults to the IOC name) and device_count (defaults to 2) are optional.
+
+    Args:
+        manifest_path: Path to the manifest file
+
+    Returns:
+        A list of ManifestEntry, in the order they appear in the manifest
+
+    Raises:
+        InvalidManifestError: if the manifest is missing a required column or contains an invalid value
+    """
+    with open(manifest_path, newline="") as f:
+        return parse_manifest(f)
+
+
+def parse_manifest(lines):
+    """
+    Args:
+        lines: An iterable of lines of CSV text, the first being the header
+
+    Returns:
+        A list of ManifestEntry, in the order they appear in the manifest
+    """
+    reader = csv.DictReader(line for line in lines if line.strip() and not line.lstrip().startswith("#"))
+    columns = [c.strip() for c in reader.fieldnames or []]
+    for required in ("ioc_name", "ticket"):
+        if required not in columns:
+            raise InvalidManifestError("Manifest is missing the required column '{}'".format(required))
+
+    entries = []
+    for row in reader:
+        row = {k.strip(): (v or "").strip() for k, v in row.items() if k is not None}
+        try:
+            entries.append(ManifestEntry(
+                ioc_name=row["ioc_name"],
+                device_name=row.get("device_name") or row["ioc_name"],
+                ticket=int(row["ticket"]),
+                device_count=int(row.get("device_count") or DEFAULT_DEVICE_COUNT)))
+        except ValueError as e:
+            raise InvalidManifestError("Invalid manifest row {}: {}".format(row, e))
+    return entries
+
+
+def group_by_ticket(entries):
+    """
+    Devices for the same ticket share a branch in each repository, so edits to shared files can be made once per
+    ticket.
+
+    Args:
+        entries: The manifest entries
+
+    Returns:
+        An ordered dictionary of ticket number to the list of entries for that ticket
+    """
+    groups = OrderedDict()
+    for entry in entries:
+        groups.setdefault(entry.ticket, []).append(entry)
+    return groups
+
+
+class SharedEdits(object):
+    """
+    Collects the edits several devices make to files that are shared between devices (the IOC and support Makefiles
+    and opi_info.xml) so that each file is only read and written once for a batch
+    """
+
+    def __init__(self):
+        self.ioc_dirs = []
+        self.supp_dirs = []
+        self.opi_entries = []
@@ -0,0 +1,87 @@
+""" Utilities for building the IOCs and support modules that are generated """
+import logging
+import os
+import time
+from collections import namedtuple
+from os.path import relpath
+
+from utils.common_utils import run_command, BUILD_TIMEOUT
+
+# The outcome of a build: how long it took and the files it created or changed
+BuildResult = namedtuple("BuildResult", ["wall_time", "rebuilt"])
+
+
+def make_jobs():
+    """
+    Returns: The number of jobs to run make with, one for each core this process may run on
+    """
+    try:
+        return max(len(os.sched_getaffinity(0)), 1)
+    except AttributeError:
+        # sched_getaffinity is not available on Windows or macOS
+        return os.cpu_count() or 1
+
+
+def _modification_times(directory):
+    """
+    Args:
+        directory: Folder to look in
+
+    Returns: A dictionary of the path of every file in the folder, outside .git, to its modification time
+    """
+    times = {}
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != ".git":
+                        stack.append(entry.path)
+                else:
+                    times[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+    return times
+
+
+def build(directory, targets=(), jobs=None):
+    """
+    Runs make in a folder with a job for each core, and logs how long it took and which files it created or changed
+
+    Args:
+        directory: Folder to run make in
+        targets: Make targets to build, the default target if empty
+        jobs: Number of jobs to run make with, see make_jobs if not set
+
+    Returns: The BuildResult of the build
+
+    Raises:
+        CommandError: If make fails or does not finish in time
+    """
+    jobs = make_jobs() if jobs is None else jobs
+    before = _modification_times(directory)
+    start = time.perf_counter()
+    run_command(["make", "-j{}".format(jobs)] + list(targets), directory, timeout=BUILD_TIMEOUT)
+    wall_time = time.perf_counter() - start
+    rebuilt = sorted(path for path, mtime in _modification_times(directory).items() if before.get(path) != mtime)
+    logging.info("Built {} in {:.1f}s with {} jobs, {} targets rebuilt".format(directory, wall_time, jobs,
+                                                                               len(rebuilt)))
+    for path in rebuilt:
+        logging.debug("Rebuilt {}".format(relpath(path, directory)))
+    return BuildResult(wall_time, rebuilt)
+
+
+def make_ioc_startups(epics_path):
+    """
+    Runs the iocstartups target of the EPICS top Makefile, which generates the startup files the IOCs share. The
+    target is defined by the EPICS tree and cannot be narrowed to one IOC from here, so it is run once after every IOC
+    has been generated rather than by each IOC step. The new IOC's own iocBoot folders are made by the build of the
+    IOC, so they are not made here as well
+
+    Args:
+        epics_path: The top of the EPICS tree
+
+    Raises:
+        CommandError: If make fails or does not finish in time
+    """
+    start = time.perf_counter()
+    run_command(["make", "iocstartups"], epics_path, timeout=BUILD_TIMEOUT)
+    logging.info("Made the IOC startup files in {:.1f}s".format(time.perf_counter() - start))
@@ -0,0 +1,50 @@
+""" Utilities for remembering results between runs of the generator """
+import json
+import logging
+from os import makedirs, replace, environ
+from os.path import join, dirname, abspath
+
+# Set IBEX_GENERATOR_CACHE to keep the cache somewhere else, e.g. so a benchmark run does not touch the real one
+CACHE_DIR = environ.get("IBEX_GENERATOR_CACHE") or join(dirname(dirname(abspath(__file__))), ".cache")
+
+
+def cache_path(name):
+    """
+    Args:
+        name: File name of the cache entry
+
+    Returns: Path to the cache entry
+    """
+    return join(CACHE_DIR, name)
+
+
+def read_cache(name):
+    """
+    Args:
+        name: File name of the cache entry
+
+    Returns: The JSON content of the cache entry, or None if there isn't one or it can't be read
+    """
+    try:
+        with open(cache_path(name)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def write_cache(name, content):
+    """
+    Writes a cache entry. Failing to write the cache is not an error, the work will just be repeated next time
+
+    Args:
+        name: File name of the cache entry
+        content: Content that can be written as JSON
+    """
+    try:
+        makedirs(CACHE_DIR, exist_ok=True)
+        temporary_path = cache_path(name) + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(content, f)
+        replace(temporary_path, cache_path(name))
+    except IOError as e:
+        logging.warning("Unable to write cache {}: {}".format(name, e))
@@ -1,20 +1,61 @@
 """ Utilities for running scripts from the command line """
+from contextlib import contextmanager
+from threading import RLock
+from utils.profiling_utils import span
 
+# Steps may run on several threads at once. Only one of them may talk to the user at a time
+_prompt_lock = RLock()
 
-def ask_do_step(name):
+
+def prompt(message):
+    """
+    Ask the user for input. Safe to call from several threads at once
+
+    Args:
+        message: The message to show the user
+
+    Returns: The user's reply
+    """
+    with _prompt_lock, span(message.strip(), "prompt"):
+        return input(message)
+
+
+@contextmanager
+def asking_together():
+    """
+    Keeps other threads from talking to the user inside the context, so that a message and the questions that follow
+    it are shown together
+    """
+    with _prompt_lock:
+        yield
+
+
+def ask_do_step(name, answers=None):
     """
     Ask the user whether to do a step
 
     Args:
         name: Name of the step
+        answers: Optional dictionary of previous answers keyed by step name. If the step has already been answered the
+            user is not asked again, otherwise the new answer is recorded
 
     Returns: True or False on whether to perform the step
     """
-    while True:
-        reply = input(f"Should I do step: {name} (Y/N) ").upper()
-        if reply == "Y":
-            return True
-        elif reply == "N":
-            return False
-        else:
-            print(f"Invalid response: {reply}.")
+    with _prompt_lock:
+        if answers is not None and name in answers:
+            return answers[name]
+
+        while True:
+            reply = prompt(f"Should I do step: {name} (Y/N) ").upper()
+            if reply == "Y":
+                answer = True
+                break
+            elif reply == "N":
+                answer = False
+                break
+            else:
+                print(f"Invalid response: {reply}.")
+
+        if answers is not None:
+            answers[name] = answer
+        return answer
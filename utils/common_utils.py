@@ -1,14 +1,63 @@
 """ Utilities common to all steps """
 from contextlib import contextmanager
 
-from utils.git_utils import RepoWrapper
+from importlib import import_module
 from utils.command_line_utils import ask_do_step
+from utils.file_system_utils import record_writes
+from utils.profiling_utils import span
+import asyncio
 import logging
-import subprocess
-from os import devnull
+from collections import namedtuple, deque
+from os.path import abspath, normcase, basename
+from threading import Lock
 import datetime
 
-def create_component(device, branch, path, action, commit_message, use_git, **kwargs):
+# The outcome of a command run by run_commands
+CommandResult = namedtuple("CommandResult", ["command", "returncode", "output"])
+
+# Seconds to allow a command, and a build, before it is killed
+COMMAND_TIMEOUT = 600
+BUILD_TIMEOUT = 3600
+
+# Number of lines of a command's output kept to report if it fails
+OUTPUT_LINES = 50
+
+# One lock per repository so that steps running in parallel do not interleave git operations on the same repository
+_repo_locks = {}
+_repo_locks_lock = Lock()
+
+
+def _repo_lock(path):
+    """
+    Args:
+        path: Path to the repository
+
+    Returns: The lock guarding git operations on the repository
+    """
+    with _repo_locks_lock:
+        return _repo_locks.setdefault(normcase(abspath(path)), Lock())
+
+
+def lazy_action(module_name, function_name):
+    """
+    Importing some steps loads slow third party modules (GitPython, lxml, requests). Deferring the import until the
+    step runs keeps the generator quick to start, and skipped steps never pay for it
+
+    Args:
+        module_name: Name of the module containing the action
+        function_name: Name of the action in the module
+
+    Returns: A function that imports the module the first time it is called and then calls the action
+    """
+    def action(*args, **kwargs):
+        return getattr(import_module(module_name), function_name)(*args, **kwargs)
+
+    action.__name__ = function_name
+    return action
+
+
+def create_component(device, branch, path, action, commit_message, use_git, step_answers=None, commit_paths=None,
+                     fetch_submodules=False, writes=None, **kwargs):
     """
     Creates part of the IBEX device support
     
@@ -19,47 +68,206 @@ def create_component(device, branch, path, action, commit_message, use_git, **kw
         action: Function that takes the device as an argument that creates the component
         commit_message: Message to attach to the changes
         use_git: user git; False do not issue git commands
+        step_answers: Optional dictionary of answers to previous steps. When generating several devices the user is
+            only asked once whether to do each step
+        commit_paths: Paths to commit. If not set all changes in the repository are committed
+        fetch_submodules: Also fetch the submodules of the repository, for actions that change files inside them
+        writes: Paths the action writes. Only changes to these paths make the repository count as dirty. If not set
+            any change does
+
+    Returns: False if the step failed, True otherwise, including if the user chose not to do it
     """
-    if not ask_do_step(commit_message):
-        return
+    if not ask_do_step(commit_message, step_answers):
+        return True
+
+    return run_component(device, branch, path, action, commit_message, use_git, commit_paths=commit_paths,
+                         fetch_submodules=fetch_submodules, writes=writes, **kwargs)
+
 
+def run_component(device, branch, path, action, commit_message, use_git, commit_paths=None, fetch_submodules=False,
+                  writes=None, **kwargs):
+    """
+    Creates part of the IBEX device support without asking the user first
+
+    Args:
+        device: Name of the device used in the action
+        branch: Branch name to put the changes on
+        path: Path to the repository
+        action: Function that takes the device as an argument that creates the component
+        commit_message: Message to attach to the changes
+        use_git: user git; False do not issue git commands
+        commit_paths: Paths to commit. If not set all changes in the repository are committed
+        fetch_submodules: Also fetch the submodules of the repository, for actions that change files inside them
+        writes: Paths the action writes. Only changes to these paths make the repository count as dirty. If not set
+            any change does
+
+    Returns: True if the component was created, and committed if using git, False if the step failed
+    """
     @contextmanager
     def _git_operations():
         repo = None
         if use_git:
-            repo = RepoWrapper(path)
-            repo.prepare_new_branch(branch)
+            from utils.git_utils import repo_session
+            with _repo_lock(path):
+                repo = repo_session(path)
+                repo.prepare_new_branch(branch, fetch_submodules=fetch_submodules, paths=writes)
 
         yield
 
         if repo is not None:
-            repo.push_all_changes(commit_message)
+            with _repo_lock(path):
+                repo.push_all_changes(commit_message, paths=commit_paths)
+
+    with span(commit_message, "step") as step_span:
+        try:
+            with _git_operations(), record_writes() as write_stats:
+                action(device, **kwargs)
+            logging.info("{}: {}".format(commit_message, write_stats))
+            return True
 
-    try:
-        with _git_operations():
-            action(device, **kwargs)
+        except (RuntimeError, IOError) as e:
+            step_span.status = type(e).__name__
+            logging.error(str(e))
+        except RuntimeWarning as e:
+            step_span.status = type(e).__name__
+            logging.warning(str(e))
+        except Exception as e:
+            step_span.status = type(e).__name__
+            logging.error("Encountered unknown error: {}".format(e))
+        return False
 
-    except (RuntimeError, IOError) as e:
-        logging.error(str(e))
-    except RuntimeWarning as e:
-        logging.warning(str(e))
-    except Exception as e:
-        logging.error("Encountered unknown error: {}".format(e))
 
+class CommandError(RuntimeError):
+    """
+    Raised when a command exits with a non-zero code or does not finish in time. The message includes the last lines
+    the command wrote
+    """
+
+    def __init__(self, command, returncode, output, timeout=None):
+        """
+        Args:
+            command: A list defining the command that was run
+            returncode: The exit code of the command, None if it timed out
+            output: The last lines the command wrote to stdout and stderr
+            timeout: Seconds the command was allowed, if it timed out
+        """
+        if timeout is None:
+            problem = "exited with code {}".format(returncode)
+        else:
+            problem = "did not finish within {} seconds".format(timeout)
+        super(CommandError, self).__init__("{} {}. Last output:\n{}".format(" ".join(command), problem, output))
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+        self.timeout = timeout
 
-def run_command(command, working_dir):
+
+async def _log_lines(stream, name, level, tail):
     """
-    Runs a command using subprocess. Waits for completion
+    Logs each line written to a stream as it is written
 
+    Args:
+        stream: The stdout or stderr of a process
+        name: Name to prefix the lines with
+        level: Level to log the lines at
+        tail: Ring buffer of the last lines written to either stream
+    """
+    async for line in stream:
+        line = line.decode(errors="replace").rstrip("\r\n")
+        tail.append(line)
+        logging.log(level, "{}: {}".format(name, line))
+
+
+async def _run_async(command, working_dir, timeout, semaphore):
+    """
     Args:
         command: A list defining the command to run
         working_dir: The directory to run the command in
+        timeout: Seconds to allow the command before killing it
+        semaphore: Limits how many commands run at once
+
+    Returns: The CommandResult of the command. The output is the last OUTPUT_LINES lines it wrote
     """
-    logging.info("Running command {} from {}".format(" ".join(command), working_dir))
-    with open(devnull, 'w') as null_out:
-        cmd = subprocess.Popen(command, cwd=working_dir, stdout=null_out, stderr=subprocess.STDOUT,
-                               stdin=subprocess.PIPE)
-    cmd.wait()
+    async with semaphore:
+        logging.info("Running command {} from {}".format(" ".join(command), working_dir))
+        name = basename(command[0])
+        tail = deque(maxlen=OUTPUT_LINES)
+        with span(" ".join(command), "command") as command_span:
+            process = await asyncio.create_subprocess_exec(
+                *command, cwd=working_dir, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+            try:
+                await asyncio.wait_for(asyncio.gather(_log_lines(process.stdout, name, logging.INFO, tail),
+                                                      _log_lines(process.stderr, name, logging.WARNING, tail),
+                                                      process.wait()), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                command_span.status = "timeout"
+                raise CommandError(command, None, "\n".join(tail), timeout)
+            command_span.status = process.returncode
+        return CommandResult(command, process.returncode, "\n".join(tail))
+
+
+async def _run_all(commands, working_dir, max_workers, timeout):
+    """
+    Args:
+        commands: A list of lists defining the commands to run
+        working_dir: The directory to run the commands in
+        max_workers: Maximum number of commands to run at once
+        timeout: Seconds to allow each command
+
+    Returns: For each command, its CommandResult or the exception raised running it
+    """
+    semaphore = asyncio.Semaphore(max(max_workers, 1))
+    return await asyncio.gather(*[_run_async(command, working_dir, timeout, semaphore) for command in commands],
+                                return_exceptions=True)
+
+
+def run_commands(commands, working_dir, max_workers=1, timeout=COMMAND_TIMEOUT, check=True):
+    """
+    Runs commands as separate processes, up to max_workers of them at once, logging their output as they write it.
+    Waits for them all to complete
+
+    Args:
+        commands: A list of lists defining the commands to run
+        working_dir: The directory to run the commands in
+        max_workers: Maximum number of commands to run at once
+        timeout: Seconds to allow each command before killing it
+        check: Raise a CommandError if any command exits with a non-zero code
+
+    Returns: A CommandResult for each command, in the same order as the commands
+
+    Raises:
+        CommandError: If a command times out, or fails and check is set. The other commands are still run to the end
+    """
+    if not commands:
+        return []
+    results = asyncio.run(_run_all(commands, working_dir, max_workers, timeout))
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+        if check and result.returncode != 0:
+            raise CommandError(result.command, result.returncode, result.output)
+    return results
+
+
+def run_command(command, working_dir, timeout=COMMAND_TIMEOUT):
+    """
+    Runs a command as a separate process, logging its output as it writes it. Waits for completion
+
+    Args:
+        command: A list defining the command to run
+        working_dir: The directory to run the command in
+        timeout: Seconds to allow the command before killing it
+
+    Returns: The CommandResult of the command
+
+    Raises:
+        CommandError: If the command exits with a non-zero code or times out
+    """
+    return run_commands([command], working_dir, timeout=timeout)[0]
+
 
 def get_year() -> str:
     """
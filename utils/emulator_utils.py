@@ -2,39 +2,12 @@
 import os
 
 from templates.paths import EMULATOR_TEMPLATE
-from utils.file_system_utils import copy_tree
-from os import path, walk
+from utils.command_line_utils import ask_do_step
+from utils.file_system_utils import render_tree, rmtree
+from shutil import ignore_patterns
 import logging
 
 
-def _copy_files(emulator_dir):
-    """
-    Args:
-        emulator_dir: Directory of the device emulator
-    """
-    logging.info("Copying template emulator to {}".format(emulator_dir))
-    copy_tree(EMULATOR_TEMPLATE, emulator_dir)
-
-
-def _replace_default_name(emulator_dir, emulator_name):
-    """
-    Args:
-        emulator_dir: Directory where the emulator lives
-        emulator_name: Name given to the emulator
-    """
-    default_name = "DEVICENAME"
-    for root, dirs, files in walk(emulator_dir):
-        for dir in dirs:
-            if default_name == dir:
-                os.rename(path.join(root, dir), path.join(root, emulator_name))
-    for root, dirs, files in walk(emulator_dir):
-        for filename in files:
-            with open(path.join(root, filename)) as f:
-                lines = [l.replace(default_name, emulator_name) for l in f.readlines()]
-            with open(path.join(root, filename), "w") as f:
-                f.writelines(lines)
-
-
 def create_emulator(device_info):
     """
     Creates a vanilla emulator in the DeviceEmulator submodule
@@ -42,5 +15,14 @@ def create_emulator(device_info):
     Args:
         device_info: Provides name-based information about the device
     """
-    _copy_files(os.path.abspath(os.path.join(device_info.emulator_dir(), os.pardir)))
-    _replace_default_name(os.path.abspath(os.path.join(device_info.emulator_dir(), os.pardir)), device_info.emulator_name())
+    emulator_dir = os.path.abspath(os.path.join(device_info.emulator_dir(), os.pardir))
+    if os.path.exists(emulator_dir):
+        if not ask_do_step("{} already exists. Delete it?".format(emulator_dir)):
+            raise OSError("File {} already exists. Aborting".format(emulator_dir))
+        rmtree(emulator_dir)
+
+    logging.info("Copying template emulator to {}".format(emulator_dir))
+    default_name = "DEVICENAME"
+    # Python may have compiled the template emulator if it has been imported
+    render_tree(EMULATOR_TEMPLATE, emulator_dir, [(default_name, device_info.emulator_name())],
+                renames={default_name: device_info.emulator_name()}, ignore=ignore_patterns("__pycache__", "*.pyc"))
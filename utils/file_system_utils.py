@@ -1,47 +1,227 @@
 """ Utilities for interacting with the file system """
+import hashlib
 import logging
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from locale import getpreferredencoding
 from os import access, chmod, W_OK, remove
-from os.path import exists, join
+from os.path import exists, join, dirname, basename
 from os import makedirs
 from stat import S_IWUSR
 from shutil import rmtree as rmtree_external
 from shutil import copyfile as copyfile_external
 from shutil import copytree as copytree_external
 from utils.command_line_utils import ask_do_step
+from utils.makefile_utils import Makefile
 
+# Flags for creating the temporary file write_file writes to. O_EXCL makes sure it is a new file
+_TEMPORARY_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
 
-def replace_in_file(target, substitutions):
+_write_stats = threading.local()
+
+
+class WriteStats(object):
     """
-    Replaces matching content in a file
+    Counts the writes made through write_file
+    """
+
+    def __init__(self):
+        self.bytes_written = 0
+        self.files_written = 0
+        self.files_skipped = 0
+
+    def __repr__(self):
+        return "{} bytes written to {} files, {} unchanged files skipped".format(
+            self.bytes_written, self.files_written, self.files_skipped)
+
+
+@contextmanager
+def record_writes():
+    """
+    Counts the writes made through write_file on this thread whilst the context is open
+
+    Returns: The WriteStats for the context
+    """
+    previous = getattr(_write_stats, "current", None)
+    _write_stats.current = WriteStats()
+    try:
+        yield _write_stats.current
+    finally:
+        _write_stats.current = previous
+
 
+def _encode(content):
+    """
     Args:
-        target: Path to file where we are going to make substitutions
-        substitutions: A collection of substitutions to make. Each substitution should be in the form
-        (original, final)
+        content: Text to write
+
+    Returns: The bytes that writing the text to a file opened in text mode would produce
     """
-    logging.info("Making substitutions into file {}: {}".format(target, substitutions))
-    with open(target) as f:
-        lines = f.readlines()
+    if os.linesep != "\n":
+        content = content.replace("\n", os.linesep)
+    return content.encode(getpreferredencoding(False))
+
+
+def _file_hash(target):
+    """
+    Args:
+        target: Path to a file
+
+    Returns: The sha256 digest of the file's content
+    """
+    digest = hashlib.sha256()
+    with open(target, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def write_file(target, content):
+    """
+    Writes text to a file, unless the file already holds exactly that text. Leaving unchanged files alone keeps their
+    modification times, so make does not rebuild anything because of them. The text is written to a temporary file
+    next to the target which then replaces it, so an interrupted write never leaves a partly written file
+
+    Args:
+        target: Path to the file
+        content: The text the file should hold, or bytes to write exactly as they are
+
+    Returns: True if the file was written, False if it already held the text
+    """
+    data = content if isinstance(content, bytes) else _encode(content)
+    stats = getattr(_write_stats, "current", None)
+    if exists(target) and os.path.getsize(target) == len(data) and _file_hash(target) == hashlib.sha256(data).digest():
+        logging.debug("{} is unchanged, not writing it".format(target))
+        if stats is not None:
+            stats.files_skipped += 1
+        return False
+
+    mode = os.stat(target).st_mode & 0o7777 if exists(target) else None
+    temporary_path = join(dirname(target), ".{}.{}.tmp".format(basename(target), uuid.uuid4().hex))
+    # Created with the permissions open() would give a new file, so the umask applies without having to read it
+    handle = os.open(temporary_path, _TEMPORARY_FLAGS, 0o666)
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(temporary_path, mode)
+        os.replace(temporary_path, target)
+    except BaseException:
+        if exists(temporary_path):
+            remove(temporary_path)
+        raise
+
+    if stats is not None:
+        stats.bytes_written += len(data)
+        stats.files_written += 1
+    return True
+
+
+class Substitutions(object):
+    """
+    A set of substitutions compiled into a single regular expression, so that every substitution is made in one scan
+    of the text. Each piece of the original text is substituted at most once: the output of one substitution is not
+    searched for the others. Where two originals match at the same place the longer one wins.
+    """
+
+    def __init__(self, substitutions):
+        """
+        Args:
+            substitutions: A collection of substitutions to make. Each substitution should be in the form
+                (original, final)
+        """
+        self._finals = {}
+        for original, final in substitutions:
+            if original and original not in self._finals:
+                self._finals[original] = final
+        originals = sorted(self._finals, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(o) for o in originals)) if originals else None
+
+    def __repr__(self):
+        return repr(list(self._finals.items()))
+
+    def items(self):
+        """
+        Returns: The (original, final) substitutions
+        """
+        return self._finals.items()
 
-    def substitute(input_str):
+    def apply(self, text):
         """
         Args:
-            input_str: The original string
+            text: The original text
 
         Returns:
-            The original string after substitutions have beeen made
+            The text after substitutions have been made, and the number of substitutions made
         """
-        output_str = input_str
-        for s in substitutions:
-            output_str = output_str.replace(s[0], s[1])
-        return output_str
+        if self._pattern is None:
+            return text, 0
+        return self._pattern.subn(lambda match: self._finals[match.group(0)], text)
+
+    def apply_to_files(self, targets):
+        """
+        Makes the substitutions in each file. Files with nothing to substitute are not rewritten
+
+        Args:
+            targets: Paths to the files
+
+        Returns:
+            The paths of the files that were changed
+        """
+        changed = []
+        for target in targets:
+            with open(target) as f:
+                original = f.read()
+            text, _ = self.apply(original)
+            if text != original and write_file(target, text):
+                changed.append(target)
+        return changed
+
+
+def replace_in_files(targets, substitutions):
+    """
+    Replaces matching content in several files, compiling the substitutions once
+
+    Args:
+        targets: Paths to the files where we are going to make substitutions
+        substitutions: A collection of substitutions to make. Each substitution should be in the form
+        (original, final)
+
+    Returns:
+        The paths of the files that were changed
+    """
+    if not isinstance(substitutions, Substitutions):
+        substitutions = Substitutions(substitutions)
+    logging.info("Making substitutions into files {}: {}".format(", ".join(targets), substitutions))
+    return substitutions.apply_to_files(targets)
+
+
+def replace_in_file(target, substitutions):
+    """
+    Replaces matching content in a file
+
+    Args:
+        target: Path to file where we are going to make substitutions
+        substitutions: A collection of substitutions to make. Each substitution should be in the form
+        (original, final)
+    """
+    replace_in_files([target], substitutions)
 
-    with open(target, "w") as f:
-        f.writelines(substitute(line) for line in lines)
 
 def append_to_file(target, newlines):
-    with open(target, "a") as f:
-        f.writelines(newlines)
+    """
+    Appends lines to the end of a file
+
+    Args:
+        target: Path to the file
+        newlines: The lines to append
+    """
+    with open(target) as f:
+        content = f.read()
+    write_file(target, content + "".join(newlines))
 
 
 def rmtree(delete_path):
@@ -110,15 +290,68 @@ def copy_file(src, dst):
     _copy(src, dst, remove, copyfile_external)
 
 
-def copy_tree(src, dst):
+def copy_tree(src, dst, ignore=None):
     """
     Copy a folder from one place to another
     
     Args:
         src: Place to copy from
         dst: Place to copy to
+        ignore: Optional callable to choose files not to copy, as for shutil.copytree
+    """
+    _copy(src, dst, rmtree, lambda s, d: copytree_external(s, d, ignore=ignore))
+
+
+def render_tree(src, dst, substitutions=(), renames=None, ignore=None, substitute_names=False):
+    """
+    Copies a folder of templates in a single traversal, renaming files and folders and making substitutions in each
+    file as it is copied, so every file is read once and written once. Line endings are kept as they are in the
+    template. If a file already exists the user is asked whether to replace it and it is left alone if not
+
+    Args:
+        src: Folder to copy from
+        dst: Folder to copy to. It is created if it does not exist
+        substitutions: Collection of (original, final) substitutions to make in the content of each file
+        renames: Optional dictionary of file or folder name in the template to name in the copy
+        ignore: Optional callable to choose files not to copy, as for shutil.copytree
+        substitute_names: Also make the substitutions in the names of the files and folders that are not renamed
+
+    Returns:
+        The paths of the files that were written
     """
-    _copy(src, dst, rmtree, copytree_external)
+    if not isinstance(substitutions, Substitutions):
+        substitutions = Substitutions(substitutions)
+    renames = renames or {}
+    encoding = getpreferredencoding(False)
+    logging.info("Copying templates from {} to {}".format(src, dst))
+
+    written = []
+    folders = [(src, dst)]
+    while folders:
+        src_dir, dst_dir = folders.pop()
+        makedirs(dst_dir, exist_ok=True)
+        with os.scandir(src_dir) as it:
+            entries = list(it)
+        ignored = ignore(src_dir, [entry.name for entry in entries]) if ignore is not None else set()
+        for entry in entries:
+            if entry.name in ignored:
+                continue
+            if entry.name in renames:
+                name = renames[entry.name]
+            else:
+                name = substitutions.apply(entry.name)[0] if substitute_names else entry.name
+            target = join(dst_dir, name)
+            if entry.is_dir():
+                folders.append((entry.path, target))
+                continue
+            if exists(target) and not ask_do_step("{} already exists. Delete it?".format(target)):
+                continue
+            with open(entry.path, "rb") as f:
+                data = f.read()
+            text, count = substitutions.apply(data.decode(encoding))
+            if write_file(target, text.encode(encoding) if count else data):
+                written.append(target)
+    return written
 
 
 def _copy(src, dst, remove_func, copy_func):
@@ -153,40 +386,26 @@ def _add_entry_to_list(text, list_name, entry):
     Returns: The original text with the requested entry added to the named list
 
     """
-    new_text = []
-    last_line = ""
-    marker = "{} += ".format(list_name)
-    
-    new_line = marker + entry + "\n"
-    # Go to the end of the list of IOCDIRS/SUPPDIRS += iocname, and add our new IOC
-    for line in text:
-        if entry in line:
-            # Entry already in the list
-            logging.warn("IOC name already added to {}".format(list_name))
-            return text
-        elif marker in last_line and marker not in line:
-            # We found the end of the list
-            new_text.append(new_line)
-        # Copy rest of the lines into new text as usual
-        new_text.append(line)
-        last_line = line
-    return new_text # return Makefile with new entry
-
-
-def add_to_makefile_list(directory, list_name, entry):
-    """
-    Adds an entry to a list in a makefile. Finds the last line of the form "list_name += ..." and puts a new line
-    containing the entry after it
+    makefile = Makefile(text)
+    makefile.add(list_name, [entry])
+    return makefile.lines
+
+
+def add_to_makefile_list(directory, list_name, entries):
+    """
+    Adds entries to a list in a makefile. Finds the last line of the form "list_name += ..." and puts a new line
+    containing each entry after it. The makefile is read, checked for the entries and written once however many
+    entries are added
     
     Args:
         directory: Directory containing the makefile
         list_name: The name of the list in the makefile to append to
-        entry: The entry to add to the list
+        entries: The entry, or a list of entries, to add to the list
     """
-    logging.info("Adding {} to list {} in Makefile for directory {}".format(entry, list_name, directory))
-    makefile = join(directory, "Makefile")
-    with open(makefile) as f:
-        old_lines = f.readlines()
-
-    with open(makefile, "w") as f:
-        f.writelines(_add_entry_to_list(old_lines, list_name, entry))
+    if isinstance(entries, str):
+        entries = [entries]
+    logging.info("Adding {} to list {} in Makefile for directory {}".format(", ".join(entries), list_name, directory))
+    path = join(directory, "Makefile")
+    makefile = Makefile.read(path)
+    if makefile.add(list_name, entries):
+        write_file(path, makefile.text())
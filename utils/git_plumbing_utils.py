@@ -0,0 +1,106 @@
+""" Utilities for reading what git_utils needs to know about a repository with as few git processes as possible """
+import subprocess
+
+from utils.profiling_utils import span
+
+# Branches a repository may use as its default branch
+DEFAULT_BRANCHES = ("master", "main")
+
+_HEADS = "refs/heads/"
+_ORIGIN = "refs/remotes/origin/"
+
+
+def _run_git(working_tree_dir, args):
+    """
+    Args:
+        working_tree_dir: The working tree of the repository
+        args: Arguments to git
+
+    Returns: What git wrote to stdout
+
+    Raises:
+        RuntimeError: If git fails
+    """
+    command = ["git"] + args
+    with span(" ".join(command), "git") as git_span:
+        completed = subprocess.run(command, cwd=working_tree_dir, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        git_span.status = completed.returncode
+    if completed.returncode != 0:
+        raise RuntimeError("{} failed in {}: {}".format(" ".join(command), working_tree_dir,
+                                                        completed.stderr.decode(errors="replace").strip()))
+    return completed.stdout
+
+
+class RefIndex(object):
+    """
+    The local branches and the branches of origin in a repository, read with a single git for-each-ref
+    """
+
+    def __init__(self, refs):
+        """
+        Args:
+            refs: A dictionary of full ref name, e.g. refs/heads/main, to the object it points at
+        """
+        self.refs = refs
+        self._branches = {name[len(_HEADS):].upper(): name[len(_HEADS):] for name in refs if name.startswith(_HEADS)}
+
+    def branch(self, name):
+        """
+        Args:
+            name: Name of a branch, in any case
+
+        Returns: The name of the local branch with that name ignoring case, None if there isn't one
+        """
+        return self._branches.get(name.upper())
+
+    def default_branch(self):
+        """
+        Returns: Whichever of master and main the repository has, locally or on origin
+
+        Raises:
+            RuntimeError: If it has both or neither
+        """
+        found = [name for name in DEFAULT_BRANCHES if _HEADS + name in self.refs or _ORIGIN + name in self.refs]
+        if len(found) != 1:
+            raise RuntimeError("Initial branch naming conflict.")
+        return found[0]
+
+    def start_point(self, name):
+        """
+        Args:
+            name: Name of a branch, e.g. the default branch
+
+        Returns: The local branch if there is one, otherwise the branch of origin, e.g. in a clone of another branch
+        """
+        return name if _HEADS + name in self.refs else "origin/" + name
+
+
+def read_refs(working_tree_dir):
+    """
+    Args:
+        working_tree_dir: The working tree of the repository
+
+    Returns: The RefIndex of the repository
+    """
+    output = _run_git(working_tree_dir, ["for-each-ref", "--format=%(objectname) %(refname)", _HEADS, _ORIGIN])
+    refs = {}
+    for line in output.decode(errors="surrogateescape").splitlines():
+        objectname, _, refname = line.partition(" ")
+        refs[refname] = objectname
+    return RefIndex(refs)
+
+
+def staged_paths(working_tree_dir, pathspecs=None):
+    """
+    Args:
+        working_tree_dir: The working tree of the repository
+        pathspecs: Only look at these paths, relative to the working tree. Everything if None
+
+    Returns: The paths whose staged content differs from HEAD
+    """
+    args = ["diff", "--cached", "--name-only", "--no-renames", "-z", "HEAD"]
+    if pathspecs is not None:
+        args += ["--"] + list(pathspecs)
+    output = _run_git(working_tree_dir, args)
+    return [path.decode(errors="surrogateescape") for path in output.split(b"\0") if path]
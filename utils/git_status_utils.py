@@ -0,0 +1,119 @@
+""" Utilities for finding the changes in part of a git working tree without walking the whole of it """
+import subprocess
+from collections import namedtuple
+from os.path import relpath, realpath, normcase, pardir, sep
+
+from utils.profiling_utils import span
+
+# A change reported by git status. kind is "1" (changed), "2" (renamed or copied), "u" (unmerged), "?" (untracked) or
+# "!" (ignored). xy is the staged and unstaged status, e.g. ".M", or None for untracked and ignored files. orig_path
+# is the path a renamed or copied file came from
+StatusEntry = namedtuple("StatusEntry", ["kind", "xy", "path", "orig_path"])
+
+# Number of space separated fields before the path in each kind of porcelain v2 entry
+_FIELDS_BEFORE_PATH = {b"1": 8, b"2": 9, b"u": 10, b"?": 1, b"!": 1}
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def parse_porcelain_v2(chunks):
+    """
+    Parses the output of git status --porcelain=v2 -z as it arrives
+
+    Args:
+        chunks: Iterable of the bytes of the output, split anywhere
+
+    Returns: A generator of the StatusEntry of each change. Header lines, e.g. "# branch.oid", are skipped
+    """
+    buffer = b""
+    orig_path_for = None
+    for chunk in chunks:
+        buffer += chunk
+        *records, buffer = buffer.split(b"\0")
+        for record in records:
+            if orig_path_for is not None:
+                # A rename is followed by the path it was renamed from, as a record of its own
+                yield orig_path_for._replace(orig_path=record.decode(errors="surrogateescape"))
+                orig_path_for = None
+                continue
+            kind = record[:1]
+            if kind not in _FIELDS_BEFORE_PATH:
+                continue
+            fields = record.split(b" ", _FIELDS_BEFORE_PATH[kind])
+            entry = StatusEntry(kind.decode(), fields[1].decode() if len(fields) > 2 else None,
+                                fields[-1].decode(errors="surrogateescape"), None)
+            if kind == b"2":
+                orig_path_for = entry
+            else:
+                yield entry
+
+
+def status(working_tree_dir, paths=None, ignore_submodules=True, untracked=True):
+    """
+    Runs git status on part of a working tree, reading its output as it is written so a caller that only needs the
+    first change can stop early. The untracked cache is used so untracked files are found without rescanning every
+    folder
+
+    Args:
+        working_tree_dir: The working tree of the repository
+        paths: Paths in the working tree to look at, the whole working tree if None
+        ignore_submodules: Don't look inside submodules
+        untracked: Report untracked files
+
+    Returns: A generator of the StatusEntry of each change
+    """
+    command = ["git", "-c", "core.untrackedCache=true", "status", "--porcelain=v2", "-z", "--no-renames",
+               "--ignore-submodules={}".format("all" if ignore_submodules else "none"),
+               "--untracked-files={}".format("normal" if untracked else "no")]
+    if paths is not None:
+        command += ["--"] + pathspecs(working_tree_dir, paths)
+    with span(" ".join(command), "git") as git_span:
+        process = subprocess.Popen(command, cwd=working_tree_dir, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        finished = False
+        try:
+            yield from parse_porcelain_v2(iter(lambda: process.stdout.read1(_CHUNK_SIZE), b""))
+            finished = True
+        finally:
+            if not finished:
+                process.kill()
+            _, error = process.communicate()
+            git_span.status = process.returncode
+        if process.returncode != 0:
+            raise RuntimeError("git status failed in {}: {}".format(working_tree_dir, error.decode(errors="replace")))
+
+
+def pathspecs(working_tree_dir, paths):
+    """
+    Args:
+        working_tree_dir: The working tree of the repository
+        paths: Paths to look at
+
+    Returns: Pathspecs for the paths inside the working tree. Where file names are not case sensitive, e.g. Windows,
+        the pathspecs are not either
+    """
+    root = realpath(working_tree_dir)
+    relative_paths = [relpath(realpath(p), root) for p in paths]
+    magic = ":(icase)" if normcase("A") != "A" else ""
+    return [magic + p for p in relative_paths if p != pardir and not p.startswith(pardir + sep)]
+
+
+def is_dirty(working_tree_dir, paths=None):
+    """
+    Args:
+        working_tree_dir: The working tree of the repository
+        paths: Paths in the working tree to look at. If None the whole working tree is looked at, including
+            submodules but not untracked files, as GitPython's is_dirty does
+
+    Returns: True if there are changes to the paths
+    """
+    if paths is None:
+        changes = status(working_tree_dir, ignore_submodules=False, untracked=False)
+    elif not pathspecs(working_tree_dir, paths):
+        return False
+    else:
+        changes = status(working_tree_dir, paths)
+    for _ in changes:
+        changes.close()
+        return True
+    return False
@@ -3,25 +3,280 @@ Utilities for interacting with Git. This is largely done via the command line be
 to maintain than the PythonGit API.
 """
 from git import Repo, GitCommandError, InvalidGitRepositoryError, NoSuchPathError
-from utils.command_line_utils import ask_do_step
+from utils.command_line_utils import ask_do_step, prompt, asking_together
 from templates.paths import SUPPORT_README
 from utils.file_system_utils import copy_file, mkdir, rmtree
-from os.path import join, exists, relpath
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join, exists, relpath, realpath, normcase, sep
+from threading import Lock
+from time import time, perf_counter
+from utils import git_status_utils, gitmodules_utils, git_plumbing_utils
+from utils.cache_utils import read_cache, write_cache
+from utils.profiling_utils import span
 import logging
 import subprocess
 
+# The ways of cleaning a dirty repository the user can choose from
+CLEAN_OPTIONS = ("    0: No clean\n"
+                 "    1: Stash uncommited changes\n"
+                 "    2: Git submodule update --recursive. This will return all submodules to the tips "
+                 "of the branches they are pinned to. In most cases this will return EPICS top to a clean state.\n"
+                 "    3: Reset hard to HEAD. All unpushed changes will be lost\n")
+
+# Seconds after a fetch during which the same refs are not fetched again, see set_fetch_window
+DEFAULT_FETCH_WINDOW = 15 * 60
+_fetch_window = DEFAULT_FETCH_WINDOW
+FETCH_CACHE = "fetch_times.json"
+# Recorded in the fetch cache, alongside the refspecs, when the submodules of a repository are fetched
+_SUBMODULES = "submodules"
+_fetch_cache_lock = Lock()
+
+# Whether commits are kept local until push_deferred is called, see set_deferred_push
+_defer_push = False
+
+# One RepoWrapper per repository for the whole run, see repo_session
+_sessions = {}
+_session_locks = {}
+_sessions_lock = Lock()
+
+
+def set_fetch_window(seconds):
+    """
+    Args:
+        seconds: Refs fetched less than this long ago, in this run or a previous one, are not fetched again. 0 to
+            fetch every time
+    """
+    global _fetch_window
+    _fetch_window = seconds
+
+
+def set_deferred_push(defer):
+    """
+    Args:
+        defer: Keep the branch and the commit of each step local, and push each repository once when push_deferred is
+            called, rather than pushing after every step
+    """
+    global _defer_push
+    _defer_push = defer
+
+
+def _fetch_times():
+    """
+    Returns: A dictionary of repository path to a dictionary of refspec to the time it was last fetched
+    """
+    with _fetch_cache_lock:
+        return read_cache(FETCH_CACHE) or {}
+
+
+def _record_fetch(working_tree_dir, refspecs):
+    """
+    Records that refspecs were fetched into a repository now, and forgets fetches that are older than the window
+
+    Args:
+        working_tree_dir: Path to the repository
+        refspecs: The refspecs fetched
+    """
+    now = time()
+    with _fetch_cache_lock:
+        fetch_times = read_cache(FETCH_CACHE) or {}
+        fetch_times.setdefault(working_tree_dir, {}).update({refspec: now for refspec in refspecs})
+        write_cache(FETCH_CACHE, {path: {refspec: t for refspec, t in times.items() if now - t <= _fetch_window}
+                                  for path, times in fetch_times.items()})
+
+
+def repo_session(path):
+    """
+    Every step that works on a repository shares one RepoWrapper for it, so the repository is opened once and
+    remembers that it has already been cleaned, fetched and switched to the branch for the run
+
+    Args:
+        path: The path to the git repository
+
+    Returns: The RepoWrapper for the repository, opened the first time it is asked for
+    """
+    key = normcase(realpath(path))
+    with _sessions_lock:
+        lock = _session_locks.setdefault(key, Lock())
+    with lock:
+        if key not in _sessions:
+            _sessions[key] = RepoWrapper(path)
+        return _sessions[key]
+
+
+def _is_within(path, directory):
+    """
+    Args:
+        path: A path
+        directory: Another path
+
+    Returns: True if the path is the directory or is inside it
+    """
+    path, directory = normcase(realpath(path)), normcase(realpath(directory))
+    return path == directory or path.startswith(directory.rstrip(sep) + sep)
+
+
+def _nesting_levels(paths):
+    """
+    Args:
+        paths: Paths to repositories
+
+    Returns: The paths grouped into lists: the repositories not inside any of the others first, then the repositories
+        inside those, and so on
+    """
+    levels = []
+    remaining = sorted(set(normcase(realpath(p)) for p in paths))
+    while remaining:
+        outer = [p for p in remaining if not any(p != o and p.startswith(o.rstrip(sep) + sep) for o in remaining)]
+        levels.append(outer)
+        remaining = [p for p in remaining if p not in outer]
+    return levels
+
+
+def prepare_repositories(paths, branch, max_workers=1, fetch_submodules=(), writes=None):
+    """
+    Prepares the branch in every repository the steps will commit to before any step runs. The repositories are checked
+    for uncommitted changes at the same time, the user is asked how to clean all the dirty ones together, and then the
+    branches are prepared on a thread pool. A repository inside another, e.g. a submodule of EPICS, is prepared after
+    the repository containing it. Repositories that do not exist yet are left for their steps to create
+
+    Args:
+        paths: Paths to the repositories
+        branch: Name of the branch to prepare
+        max_workers: Maximum number of repositories to work on at once
+        fetch_submodules: Paths to the repositories whose submodules should be fetched too
+        writes: Optional dictionary of the path of each repository to the paths in it the steps will write. Only
+            changes to those paths make a repository count as dirty. The whole of a repository not in it is checked
+
+    Returns: A dictionary of the path of each repository that could not be prepared to the error
+    """
+    levels = _nesting_levels(p for p in paths if exists(join(p, ".git")))
+    sessions = {path: repo_session(path) for level in levels for path in level}
+    unprepared = {path: session for path, session in sessions.items() if session.needs_preparing(branch)}
+    if not unprepared:
+        return {}
+    recurse = {normcase(realpath(p)) for p in fetch_submodules}
+    writes = {normcase(realpath(path)): paths_written for path, paths_written in (writes or {}).items()}
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        dirty = [path for path, is_dirty in zip(unprepared, executor.map(
+            lambda path: unprepared[path].check_for_changes(writes.get(path)), unprepared)) if is_dirty]
+        clean_options = {path: None for path in unprepared}
+        if dirty:
+            with asking_together():
+                print("These repositories have uncommitted changes:\n{}\nWays to clean them:\n{}".format(
+                    "\n".join("    {}".format(path) for path in dirty), CLEAN_OPTIONS))
+                for path in dirty:
+                    clean_options[path] = unprepared[path].ask_clean_option(show_options=False)
+
+        errors = {}
+        for level in levels:
+            level = [path for path in level if path in unprepared]
+            for path, error in zip(level, executor.map(
+                    lambda path: _try_prepare(unprepared[path], branch, clean_options[path], path in recurse,
+                                              writes.get(path)), level)):
+                if error is not None:
+                    errors[path] = error
+
+    for path, error in errors.items():
+        logging.error("Could not prepare branch {} in {}: {}".format(branch, path, error))
+    logging.info("Prepared branch {} in {} of {} repositories, {:.1f}s spent fetching".format(
+        branch, len(unprepared) - len(errors), len(unprepared), sum(s.fetch_time for s in unprepared.values())))
+    return errors
+
+
+def push_deferred(max_workers=1):
+    """
+    Pushes the branch of every repository whose pushes have been deferred, see set_deferred_push. The repositories are
+    pushed at the same time, except that a repository inside another, e.g. a submodule of EPICS, is pushed before the
+    one it is in so the commits it refers to are on the remote
+
+    Args:
+        max_workers: Maximum number of repositories to push at once
+
+    Returns: A dictionary of the path of each repository that could not be pushed to the error
+    """
+    with _sessions_lock:
+        unpushed = {path: session for path, session in _sessions.items() if session.unpushed_branch is not None}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        for level in reversed(_nesting_levels(unpushed)):
+            for path, error in zip(level, executor.map(lambda path: _try_push(unpushed[path]), level)):
+                if error is not None:
+                    errors[path] = error
+
+    for path, error in errors.items():
+        logging.error("Could not push {}: {}".format(path, error))
+    if unpushed:
+        logging.info("Pushed {} of {} repositories".format(len(unpushed) - len(errors), len(unpushed)))
+    return errors
+
+
+def discard_deferred_pushes():
+    """
+    Forgets the pushes that have been deferred, see set_deferred_push, leaving the commits on the local branches
+    """
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        if session.unpushed_branch is not None:
+            logging.warning("Branch {} in {} has not been pushed because a step failed".format(
+                session.unpushed_branch, session._repo.working_tree_dir))
+            session.unpushed_branch = None
+
+
+def _try_push(session):
+    """
+    Args:
+        session: The repository
+
+    Returns: The error raised pushing the repository, None if it was pushed
+    """
+    try:
+        session.push_branch()
+    except Exception as e:
+        return e
+    return None
+
+
+def _try_prepare(session, branch, clean_option, fetch_submodules, paths):
+    """
+    Args:
+        session: The repository
+        branch: Name of the branch to prepare
+        clean_option: How to clean the repository
+        fetch_submodules: Also fetch the submodules of the repository
+        paths: The paths the steps will write in the repository, None for all of it
+
+    Returns: The error raised preparing the branch, None if it was prepared
+    """
+    try:
+        session.prepare_new_branch(branch, clean_option, fetch_submodules, paths)
+    except Exception as e:
+        return e
+    return None
+
+
 class RepoWrapper(object):
     """
-    A wrapper around a git repository
+    A wrapper around a git repository. Use repo_session to share one wrapper per repository between steps
     """
+
     def __init__(self, path):
         """
         Args:
             path: The path to the git repository
         """
+        # The paths that have been checked for changes, and cleaned if the user asked, during the run
+        self._checked_paths = set()
+        self._checked_everything = False
+        self.fetch_time = 0.0
+        self._prepared_branch = None
+        self._failed_branch = None
+        # The branch that has commits, or has been created, since it was last pushed, when pushes are deferred
+        self.unpushed_branch = None
         try:
-            self._repo = Repo(path)
+            with span("open repository {}".format(path), "git"):
+                self._repo = Repo(path)
         except (InvalidGitRepositoryError, NoSuchPathError):
             mkdir(path)
             self._repo = Repo.init(path, initial_branch='main')
@@ -29,99 +284,273 @@ class RepoWrapper(object):
         except Exception as e:
             raise RuntimeError("Unable to attach to git repository at path {}: {}".format(path, e))
         
+    def _git(self, command, *args, **kwargs):
+        """
+        Runs a git command on the repository, timing it
+
+        Args:
+            command: The git command, e.g. "checkout"
+            args: Positional arguments to the command
+            kwargs: Keyword arguments to the command, converted to options as for GitPython
+
+        Returns: The output of the command
+        """
+        with span("git {} {}".format(command.replace("_", "-"), " ".join(str(a) for a in args)).strip(), "git") \
+                as git_span:
+            try:
+                return getattr(self._repo.git, command)(*args, **kwargs)
+            except GitCommandError as e:
+                git_span.status = e.status
+                raise
+
     def git_command(self, command, path):
         try:
-            subprocess.run(command, cwd=path,  shell=True)  
+            with span(" ".join(command), "git") as git_span:
+                git_span.status = subprocess.run(command, cwd=path).returncode
         except subprocess.CalledProcessError as e:
             print("Error:", e)
 
 
-    def clean_repo(self):
+    def is_dirty(self, paths=None):
         """
-        Returns True if repo status is clean, False if otherwise
+        Args:
+            paths: Only look for changes to these paths, including untracked files but not changes inside submodules.
+                If None look at the whole working tree
+
+        Returns: True if the repository has uncommitted changes
         """
-        logging.info("Checking git status of repo {}".format(self._repo.working_tree_dir))
+        logging.info("Checking git status of repo {}{}".format(
+            self._repo.working_tree_dir, "" if paths is None else " for {} paths".format(len(paths))))
+        return git_status_utils.is_dirty(self._repo.working_tree_dir, paths)
 
-        if self._repo.is_dirty():
-            try:
-                option = int(input(
-                    "Repository {} is dirty, clean it? \n"
-                    "    0: No clean\n"
-                    "    1: Stash uncommited changes\n"
-                    "    2: Git submodule update --recursive. This will return all submodules to the tips "
-                    "of the branches they are pinned to. In most cases this will return EPICS top to a clean state.\n"
-                    "    3: Reset hard to HEAD. All unpushed changes will be lost\n"
-                    "    [Default: 0] ".format(self._repo.working_tree_dir)))
-                
-            except (ValueError, TypeError):
-                option = 0
+    def _unchecked_paths(self, paths):
+        """
+        Args:
+            paths: Paths about to be written, or None for the whole working tree
 
-            logging.info("Option {} selected".format(option))
+        Returns: The paths that have not been checked for changes yet during the run, or None if the whole working
+            tree has not
+        """
+        if self._checked_everything:
+            return []
+        if paths is None:
+            return None
+        return [p for p in paths if not any(_is_within(p, checked) for checked in self._checked_paths)]
 
-            try:
-                if option == 1:
-                    logging.info("Local changes will be stashed")
-                    self._repo.git.stash(include_untracked=True)
-
-                elif option == 2 and ask_do_step(
-                        "Git submodule update --recursive requested. All uncommited changes will be lost. Are you sure?"):
-                    command = ['git', 'submodule', 'update', '--recursive', '--init']
-                    self.git_command(command, self._repo.working_tree_dir)
-                    
-                elif option == 3 and ask_do_step(
-                        "Git reset HEAD --hard requested. All unpushed changes will be lost. Are you sure?"):
-                    self._repo.git.reset("HEAD", hard=True)
+    def _mark_checked(self, paths):
+        """
+        Args:
+            paths: Paths that have been checked for changes, or None for the whole working tree
+        """
+        if paths is None:
+            self._checked_everything = True
+        else:
+            self._checked_paths.update(paths)
 
-                else:
-                    logging.info("No clean requested")
+    def check_for_changes(self, paths=None):
+        """
+        Checks the paths that have not been checked already during the run for changes. If there are none they are
+        not checked again
 
-            except GitCommandError as e:
-                logging.warning("Error whilst scrubbing repository. I'll try to continue anyway: {}".format(e))
-        else:
-            logging.info("Repo {} is clean.".format(self._repo.working_tree_dir))
+        Args:
+            paths: Paths about to be written, or None for the whole working tree
+
+        Returns: True if there are changes the user should be asked about
+        """
+        unchecked = self._unchecked_paths(paths)
+        if unchecked == []:
+            return False
+        if self.is_dirty(unchecked):
+            return True
+        self._mark_checked(unchecked)
+        return False
 
-    def prepare_new_branch(self, branch):
+    def ask_clean_option(self, show_options=True):
         """
+        Asks the user how to clean the repository, and to confirm the options that lose changes
+
         Args:
-            branch: Name of the new branch
+            show_options: List the options in the question. Not needed if they have already been shown
+
+        Returns: The option selected, one of the keys of CLEAN_OPTIONS
         """
+        message = "Repository {} is dirty, clean it? \n".format(self._repo.working_tree_dir)
+        try:
+            option = int(prompt(message + (CLEAN_OPTIONS if show_options else "") + "    [Default: 0] "))
+        except (ValueError, TypeError):
+            option = 0
 
-        self.clean_repo()
+        logging.info("Option {} selected".format(option))
+        if option == 2 and not ask_do_step(
+                "Git submodule update --recursive requested. All uncommited changes will be lost. Are you sure?"):
+            option = 0
+        elif option == 3 and not ask_do_step(
+                "Git reset HEAD --hard requested. All unpushed changes will be lost. Are you sure?"):
+            option = 0
+        return option
 
+    def apply_clean_option(self, option, paths=None):
+        """
+        Args:
+            option: How to clean the repository, as returned by ask_clean_option
+            paths: Only stash changes to these paths, all changes if None
+        """
         try:
-            logging.info("Switching repo {} to master/main and fetching latest changes".format(self._repo.working_tree_dir))
-            
-            master_exists = False
-            main_exists = False
-            for ref in self._repo.references:
-                if ref.name == "master" or ref.name == "origin/master":
-                    master_exists = True
-                elif ref.name == "main" or ref.name == "origin/main":
-                    main_exists = True
-
-            if master_exists == main_exists:
-                raise RuntimeError("Initial branch naming conflict.")
-
-            if master_exists:
-                self._repo.git.checkout("master")
+            if option == 1:
+                logging.info("Local changes will be stashed")
+                if paths is None:
+                    self._git("stash", include_untracked=True)
+                else:
+                    self._git("stash", "push", "--include-untracked", "--",
+                              *git_status_utils.pathspecs(self._repo.working_tree_dir, paths))
+
+            elif option == 2:
+                command = ['git', 'submodule', 'update', '--recursive', '--init']
+                self.git_command(command, self._repo.working_tree_dir)
+
+            elif option == 3:
+                self._git("reset", "HEAD", hard=True)
+
             else:
-                self._repo.git.checkout("main")
+                logging.info("No clean requested")
 
-            self._repo.git.fetch(recurse_submodules=True)
         except GitCommandError as e:
-            raise RuntimeError("Could not switch repo back to master/main: {}".format(e))
+            logging.warning("Error whilst scrubbing repository. I'll try to continue anyway: {}".format(e))
+
+    def fetch(self, default_branch, branch, fetch_submodules=False):
+        """
+        Fetches only the default branch and the branch being prepared, rather than every branch and submodule. A ref
+        fetched within the fetch window, in this run or a recent one, is not fetched again. See set_fetch_window
+
+        Args:
+            default_branch: The main branch of the repository, master or main
+            branch: The branch being prepared. It need not exist on the remote
+            fetch_submodules: Also fetch the submodules of the repository
+        """
+        working_tree_dir = normcase(realpath(self._repo.working_tree_dir))
+        refspecs = ["+refs/heads/{0}:refs/remotes/origin/{0}".format(name) for name in (default_branch, branch)]
+        fetched = _fetch_times().get(working_tree_dir, {})
+        stale = [r for r in refspecs + [_SUBMODULES] if time() - fetched.get(r, 0) > _fetch_window]
+        recurse = fetch_submodules and _SUBMODULES in stale
+        refs = [r for r in stale if r != _SUBMODULES]
+        if not refs and not recurse:
+            logging.info("Repo {} was fetched less than {}s ago, not fetching it again".format(working_tree_dir,
+                                                                                               _fetch_window))
+            return
+
+        refs = refs or refspecs[:1]
+        start = perf_counter()
+        try:
+            self._git("fetch", "origin", *refs, recurse_submodules="yes" if recurse else "no")
+        except GitCommandError as e:
+            # The branch being prepared is usually new, so not on the remote yet. Fetch the rest without it
+            if refspecs[1] not in refs or "couldn't find remote ref" not in str(e.stderr):
+                raise
+            logging.info("Branch {} is not on the remote of {}".format(branch, working_tree_dir))
+            self._git("fetch", "origin", *([r for r in refs if r != refspecs[1]] or refspecs[:1]),
+                      recurse_submodules="yes" if recurse else "no")
+        elapsed = perf_counter() - start
+        self.fetch_time += elapsed
+        _record_fetch(working_tree_dir, refs + ([_SUBMODULES] if recurse else []))
+        logging.info("Fetched {}{} into {} in {:.1f}s".format(
+            ", ".join(refs), " and submodules" if recurse else "", working_tree_dir, elapsed))
+
+    def needs_preparing(self, branch):
+        """
+        Args:
+            branch: Name of the branch
+
+        Returns: True if the branch has not been prepared in the repository, or preparing it has not already failed
+        """
+        return self._prepared_branch != branch and self._failed_branch != branch
+
+    def clean_repo(self, paths=None, clean_option=None):
+        """
+        Asks the user how to clean the repository if the paths that have not been checked already have changes, and
+        cleans it
+
+        Args:
+            paths: Paths about to be written, or None for the whole working tree
+            clean_option: How to clean the repository, if the user has already been asked. See ask_clean_option
+        """
+        unchecked = self._unchecked_paths(paths)
+        if unchecked == []:
+            return
+        if clean_option is None:
+            if not self.is_dirty(unchecked):
+                logging.info("Repo {} is clean.".format(self._repo.working_tree_dir))
+                self._mark_checked(unchecked)
+                return
+            clean_option = self.ask_clean_option()
+        self.apply_clean_option(clean_option, unchecked)
+        self._mark_checked(unchecked)
+
+    def prepare_new_branch(self, branch, clean_option=None, fetch_submodules=False, paths=None):
+        """
+        Cleans the repository, switches to master/main, fetches and creates the branch. Work that has already been done
+        on this wrapper during the run is not repeated, and if preparing the branch has already failed the error is
+        raised again
+
+        Args:
+            branch: Name of the new branch
+            clean_option: How to clean the repository, if the user has already been asked. See ask_clean_option
+            fetch_submodules: Also fetch the submodules of the repository, for steps that change files inside them
+            paths: The paths the steps will write. Only changes to these paths make the repository count as dirty. If
+                None the whole working tree is checked
+        """
+        working_tree_dir = self._repo.working_tree_dir
+        if self._prepared_branch == branch and self._repo.active_branch.name == branch:
+            logging.info("Repo {} already on branch {}".format(working_tree_dir, branch))
+            self.clean_repo(paths)
+            return
+        if self._failed_branch == branch:
+            raise RuntimeError("Could not prepare branch {} in {}".format(branch, working_tree_dir))
+
+        try:
+            self._prepare_new_branch(branch, clean_option, fetch_submodules, paths)
+        except Exception:
+            self._failed_branch = branch
+            raise
+
+    def _prepare_new_branch(self, branch, clean_option, fetch_submodules, paths):
+        """
+        Args:
+            branch: Name of the new branch
+            clean_option: How to clean the repository, or None to ask the user if it is dirty
+            fetch_submodules: Also fetch the submodules of the repository
+            paths: The paths the steps will write, or None for the whole working tree
+        """
+        working_tree_dir = self._repo.working_tree_dir
+        self.clean_repo(paths, clean_option)
+
+        # One for-each-ref tells both which default branch the repository uses and whether the branch exists. Fetching
+        # only changes the branches of origin, so the local branches read here are still right after it
+        refs = git_plumbing_utils.read_refs(working_tree_dir)
+        default_branch = refs.default_branch()
+        try:
+            logging.info("Fetching latest changes to {} in repo {}".format(default_branch, working_tree_dir))
+            self.fetch(default_branch, branch, fetch_submodules)
+        except GitCommandError as e:
+            raise RuntimeError("Could not fetch {} in repo {}: {}".format(default_branch, working_tree_dir, e))
 
         try:
             logging.info("Creating/switching to branch {}".format(branch))
-            branch_is_new = branch.upper() not in [b.name.upper() for b in self._repo.branches]  # Case insensitive
-            self._repo.git.checkout(branch, b=branch_is_new)
-            self._repo.git.push("origin", branch, set_upstream=True)
+            if refs.branch(branch) is None:  # Case insensitive
+                # Branching from master/main directly saves checking it out first
+                self._git("checkout", "-b", branch, refs.start_point(default_branch))
+            elif self._repo.head.is_detached or self._repo.active_branch.name != branch:
+                self._git("checkout", branch)
+            if _defer_push:
+                self.unpushed_branch = branch
+            else:
+                self._git("push", "origin", branch, set_upstream=True)
         except GitCommandError as e:
             raise RuntimeError("Error whilst creating git branch, {}".format(e))
 
+        self._prepared_branch = branch
         logging.info("Branch {} ready".format(branch))
 
-    def push_all_changes(self, message, allow_master=False, allow_main=False):
+    def push_all_changes(self, message, allow_master=False, allow_main=False, paths=None):
         """
         Adds all modified and un-tracked files to git, commits with the message provided and pushes to git
 
@@ -129,6 +558,8 @@ class RepoWrapper(object):
             message: The commit message to include with the push
             allow_master: Can commit changes to the master branch
             allow_main: Can commit changes to the main branch
+            paths: Only add and commit changes under these paths. If not set all changes are committed. Used when
+                several steps change the same repository at once
         """
         logging.info("Pushing all changes to current branch, {}, for repo {}".format(
             self._repo.active_branch, self._repo.working_tree_dir))
@@ -138,17 +569,40 @@ class RepoWrapper(object):
             raise RuntimeError("Attempting to commit to main branch")
 
         try:
-            self._repo.git.add(A=True)
-            n_files = len(self._repo.index.diff("HEAD"))
+            if paths is None:
+                pathspec = []
+            else:
+                pathspec = ["--"] + [relpath(realpath(p), realpath(self._repo.working_tree_dir))
+                                     for p in paths if exists(p)]
+                if len(pathspec) == 1:
+                    return logging.warn("Commit aborted. No files changed")
+            self._git("add", "-A", *pathspec)
+            n_files = len(git_plumbing_utils.staged_paths(self._repo.working_tree_dir, pathspec[1:] or None))
             if n_files > 0:
-                self._repo.git.commit("-m", message, "--no-verify")
-                self._repo.git.push(recurse_submodule="check")
-                logging.info("{} files pushed to {}: {}".format(n_files, self._repo.active_branch, message))
+                self._git("commit", "-m", message, "--no-verify", *pathspec)
+                if _defer_push:
+                    self.unpushed_branch = self._repo.active_branch.name
+                    logging.info("{} files committed to {}, to be pushed later: {}".format(
+                        n_files, self._repo.active_branch, message))
+                else:
+                    self._git("push", recurse_submodule="check")
+                    logging.info("{} files pushed to {}: {}".format(n_files, self._repo.active_branch, message))
             else:
                 return logging.warn("Commit aborted. No files changed")
         except GitCommandError as e:
             raise RuntimeError("Error whilst pushing changes to git, {}".format(e))
 
+    def push_branch(self):
+        """
+        Pushes the branch whose push was deferred, setting its upstream
+        """
+        try:
+            self._git("push", "origin", self.unpushed_branch, set_upstream=True, recurse_submodules="check")
+        except GitCommandError as e:
+            raise RuntimeError("Error whilst pushing branch {} to git, {}".format(self.unpushed_branch, e))
+        logging.info("Pushed branch {} of {}".format(self.unpushed_branch, self._repo.working_tree_dir))
+        self.unpushed_branch = None
+
     def add_initial_commit(self):
         """
         Returns:
@@ -156,9 +610,9 @@ class RepoWrapper(object):
         """
         try:
             copy_file(SUPPORT_README, join(self._repo.working_dir, "README.md"))
-            self._repo.git.add(A=True)
-            self._repo.git.commit(m="Initial commit")
-            self._repo.git.push("origin", "main", set_upstream=True)
+            self._git("add", A=True)
+            self._git("commit", m="Initial commit")
+            self._git("push", "origin", "main", set_upstream=True)
         except (OSError, GitCommandError) as e:
             raise RuntimeError("Error whilst creating initial commit in {}: {}"
                                .format(self._repo.working_dir, e))
@@ -172,8 +626,8 @@ class RepoWrapper(object):
         """
         try:
             git_modules_path = join(self._repo.working_tree_dir, ".git", "modules", name)
-            if self.contains_submodule(url):
-                input("Submodule {} already exists. Confirm this is as expected and press return to continue"
+            if gitmodules_utils.find_submodule(self._repo.working_tree_dir, name, url) is not None:
+                prompt("Submodule {} already exists. Confirm this is as expected and press return to continue"
                           .format(name))
             else:
                 if exists(git_modules_path) and ask_do_step(
@@ -185,7 +639,9 @@ class RepoWrapper(object):
                 sub_path = relpath(path, start=self._repo.working_tree_dir)
                 # We use subprocess here because gitpython seems to add a /refs/heads/ prefix to any branch you give it,
                 # and this breaks the repo checks. 
-                subprocess.run(f"git submodule add -b {branch} --name {name} {url} {sub_path}", cwd = self._repo.working_tree_dir, check=True)
+                command = ["git", "submodule", "add", "-b", branch, "--name", name, url, sub_path]
+                with span(" ".join(command), "git") as git_span:
+                    git_span.status = subprocess.run(command, cwd = self._repo.working_tree_dir, check=True).returncode
                 
         except subprocess.CalledProcessError as e:
             logging.error("Cannot add {} as a submodule, error: {}".format(path, e))
@@ -194,8 +650,7 @@ class RepoWrapper(object):
 
     def contains_submodule(self, url):
         """
-        Check if the repository already contains the submodule. Can be a little slow to update after a reset so on
-        a simple retry loop
+        Check if the repository already contains the submodule, from its .gitmodules file
 
         Args:
             url: The url of the remote repository
@@ -203,8 +658,4 @@ class RepoWrapper(object):
         Returns:
              True if already a submodule else False
         """
-        for i in range(10):
-            if url.lower() in [s.url.lower() for s in self._repo.submodules]:
-                return True
-            sleep(0.1)
-        return False
+        return gitmodules_utils.find_submodule(self._repo.working_tree_dir, url=url) is not None
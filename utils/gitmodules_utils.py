@@ -0,0 +1,127 @@
+""" Utilities for knowing which submodules a repository has by reading its .gitmodules file directly """
+import re
+from collections import namedtuple
+from os import stat
+from os.path import join, normcase, realpath
+from threading import Lock
+
+# A submodule as recorded in .gitmodules. path is relative to the working tree of the repository
+Submodule = namedtuple("Submodule", ["name", "path", "url"])
+
+# An index of the submodules of a repository by name and by URL, see normalise_url
+SubmoduleIndex = namedtuple("SubmoduleIndex", ["by_name", "by_url"])
+
+_SECTION = re.compile(r'^\[\s*submodule\s+"((?:[^"\\]|\\.)*)"\s*\]$')
+_VARIABLE = re.compile(r"^([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*))?$")
+
+# Index of each .gitmodules file read, with the modification time and size it was read at
+_indexes = {}
+_indexes_lock = Lock()
+
+
+def normalise_url(url):
+    """
+    Args:
+        url: URL of a repository
+
+    Returns: The URL in a form that can be compared with other URLs of the same repository. Case, trailing slashes
+        and a trailing .git are ignored
+    """
+    url = url.strip().rstrip("/").lower()
+    return url[:-len(".git")] if url.endswith(".git") else url
+
+
+def _value(text):
+    """
+    Args:
+        text: The value of a variable in a git config file, after the =
+
+    Returns: The value without quotes, escapes or a trailing comment
+    """
+    value, quoted, i = [], False, 0
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            quoted = not quoted
+        elif char == "\\" and i + 1 < len(text):
+            i += 1
+            value.append({"n": "\n", "t": "\t", "b": "\b"}.get(text[i], text[i]))
+        elif char in "#;" and not quoted:
+            break
+        else:
+            value.append(char)
+        i += 1
+    return "".join(value).strip()
+
+
+def parse_gitmodules(text):
+    """
+    Args:
+        text: The content of a .gitmodules file
+
+    Returns: The Submodule of each section that has a path, in the order they appear
+    """
+    sections = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        section = _SECTION.match(line)
+        if section:
+            sections.append((re.sub(r"\\(.)", r"\1", section.group(1)), {}))
+        elif line.startswith("["):
+            sections.append((None, {}))
+        elif sections:
+            variable = _VARIABLE.match(line)
+            if variable:
+                sections[-1][1][variable.group(1).lower()] = _value(variable.group(2) or "")
+    return [Submodule(name, variables["path"], variables.get("url", ""))
+            for name, variables in sections if name is not None and "path" in variables]
+
+
+def submodule_index(working_tree_dir):
+    """
+    Reads the .gitmodules file of a repository, or reuses what was read last time if the file's modification time and
+    size have not changed since
+
+    Args:
+        working_tree_dir: The working tree of the repository
+
+    Returns: The SubmoduleIndex of the repository, empty if it has no .gitmodules file
+    """
+    path = join(working_tree_dir, ".gitmodules")
+    key = normcase(realpath(path))
+    try:
+        file_stat = stat(path)
+    except OSError:
+        with _indexes_lock:
+            _indexes.pop(key, None)
+        return SubmoduleIndex({}, {})
+    version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    with _indexes_lock:
+        cached = _indexes.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with open(path, encoding="utf-8", errors="surrogateescape") as f:
+        submodules = parse_gitmodules(f.read())
+    index = SubmoduleIndex({s.name: s for s in submodules}, {normalise_url(s.url): s for s in submodules if s.url})
+    with _indexes_lock:
+        _indexes[key] = (version, index)
+    return index
+
+
+def find_submodule(working_tree_dir, name=None, url=None):
+    """
+    Args:
+        working_tree_dir: The working tree of the repository
+        name: Name of the submodule
+        url: URL of the submodule's repository
+
+    Returns: The Submodule with the name or URL, None if the repository has no such submodule
+    """
+    index = submodule_index(working_tree_dir)
+    if url is not None and normalise_url(url) in index.by_url:
+        return index.by_url[normalise_url(url)]
+    return index.by_name.get(name)
@@ -1,11 +1,14 @@
 """ Utilities for modifying the gui for a new IOC """
 from templates.paths import OPI
 from system_paths import OPI_RESOURCES
-from utils.file_system_utils import replace_in_file
-from shutil import copyfile
+from utils.command_line_utils import ask_do_step
+from utils.file_system_utils import write_file
+from utils.opi_index_utils import load_opi_index
 from os import path
+from io import BytesIO
 from lxml import etree
 import logging
+import re
 
 
 def _generate_opi_entry(opi_key, opi_file_name, descriptive_device_name, macro_name):
@@ -58,42 +61,130 @@ def _generate_opi_entry(opi_key, opi_file_name, descriptive_device_name, macro_n
     return entry
 
 
-def _update_opi_info(opi_key, opi_file_name, descriptive_device_name, device_macro_name):
+def _splice_opi_entries(opi_info, entries):
     """
-    Add some basic template information to the opi_info.xml file
+    Inserts entries at the end of the list of OPIs, indented to match the entries already there, leaving the rest of
+    the document as it is
 
     Args:
-        opi_key: Key to identify to OPI to the GUI
-        opi_file_name: File name to the device's opi
-        descriptive_device_name: Human readable device name
-        device_macro_name: Name used for macro for creating PV prefix
+        opi_info: The content of opi_info.xml
+        entries: The ElementTree entries to add
+
+    Returns:
+        The content with the entries added, or None if the end of the list of OPIs is not on a line of its own
     """
-    logging.info("Adding template information to opi info")
-    opi_info_path = path.join(OPI_RESOURCES, "opi_info.xml")
-    with open(opi_info_path) as f:
-        # Remove blank on input or pretty printing won't work later
-        opi_xml = etree.parse(f, etree.XMLParser(remove_blank_text=True))
+    close = opi_info.rfind(b"</opis>")
+    line_start = opi_info.rfind(b"\n", 0, close) + 1
+    if close < 0 or opi_info[line_start:close].strip():
+        return None
+
+    newline = b"\r\n" if b"\r\n" in opi_info else b"\n"
+    existing_entry = re.search(rb"\n([ \t]*)<entry>", opi_info)
+    indent = existing_entry.group(1) if existing_entry else opi_info[line_start:close] + b"  "
+    lines = []
+    for entry in entries:
+        lines += [indent + line for line in
+                  etree.tostring(entry, pretty_print=True, encoding="UTF-8", xml_declaration=False).splitlines()
+                  if line.strip()]
+    return opi_info[:line_start] + newline.join(lines) + newline + opi_info[line_start:]
+
+
+def _rewrite_opi_info(opi_info, entries):
+    """
+    Adds entries to the list of OPIs by parsing and pretty printing the whole document
 
+    Args:
+        opi_info: The content of opi_info.xml
+        entries: The ElementTree entries to add
+
+    Returns:
+        The content with the entries added
+    """
+    # Remove blank on input or pretty printing won't work later
+    opi_xml = etree.parse(BytesIO(opi_info), etree.XMLParser(remove_blank_text=True))
     opis = opi_xml.find("opis")
-    if any(entry.find("key").text == opi_key for entry in opis):
+    for entry in entries:
+        opis.append(entry)
+    return etree.tostring(opi_xml, pretty_print=True, encoding='UTF-8', xml_declaration=True, standalone="yes")
+
+
+def _update_opi_info(opi_entries):
+    """
+    Add some basic template information to the opi_info.xml file. The file is read once, streamed to check for
+    existing keys, and written once with the new entries spliced in
+
+    Args:
+        opi_entries: A list of (opi_key, opi_file_name, descriptive_device_name, device_macro_name) tuples where
+            opi_key identifies the OPI to the GUI, opi_file_name is the file name of the device's OPI,
+            descriptive_device_name is a human readable device name and device_macro_name is the name used for the
+            macro for creating the PV prefix
+    """
+    logging.info("Adding template information to opi info")
+    opi_info_path = path.join(OPI_RESOURCES, "opi_info.xml")
+    with open(opi_info_path, "rb") as f:
+        opi_info = f.read()
+
+    existing_keys = set(load_opi_index(opi_info_path, opi_info))
+    new_entries = []
+    for opi_entry in opi_entries:
+        if opi_entry[0] in existing_keys:
+            logging.warning("OPI with key {} already exists".format(opi_entry[0]))
+        else:
+            existing_keys.add(opi_entry[0])
+            new_entries.append(opi_entry)
+
+    if not new_entries:
         raise RuntimeWarning("OPI with default name already exists")
 
-    opis.append(_generate_opi_entry(opi_key, opi_file_name, descriptive_device_name, device_macro_name))
-    with open(opi_info_path, "w") as f:
-        f.write(
-            etree.tostring(opi_xml, pretty_print=True, encoding='UTF-8', xml_declaration=True, standalone="yes")
-            .decode())
+    entries = [_generate_opi_entry(*opi_entry) for opi_entry in new_entries]
+    spliced = _splice_opi_entries(opi_info, entries)
+    opi_info = spliced if spliced is not None else _rewrite_opi_info(opi_info, entries)
+    write_file(opi_info_path, opi_info)
+    # Read the new entries into the index now, whilst the content is in memory
+    load_opi_index(opi_info_path, opi_info)
 
 
-def create_opi(device_info):
+def _opi_info_entry(device_info):
+    """
+    Args:
+        device_info: Provides name-based information about the device
+
+    Returns:
+        The (opi_key, opi_file_name, descriptive_device_name, device_macro_name) tuple for the device's OPI
+    """
+    return device_info.opi_key(), device_info.opi_file_name(), device_info.log_name(), device_info.ioc_name
+
+
+def create_opi(device_info, opi_entries=None):
     """
     Creates a blank OPI as part of the GUI and add it to the OPI info
 
     Args:
         device_info: Provides name-based information about the device
+        opi_entries: Optional list to collect the OPI info entry in, rather than adding it to opi_info.xml straight
+            away. Used to update opi_info.xml once for a batch of devices
     """
-    logging.info("Copying template OPI file to {}".format(device_info.opi_file_path()))
-    copyfile(OPI, device_info.opi_file_path())
-    replace_in_file(device_info.opi_file_path(), [("$(DEVICE)", "$({})".format(device_info.ioc_name))])
+    if path.exists(device_info.opi_file_path()) and \
+            not ask_do_step("{} already exists. Replace it?".format(device_info.opi_file_path())):
+        logging.warning("Keeping existing OPI file {}".format(device_info.opi_file_path()))
+    else:
+        logging.info("Copying template OPI file to {}".format(device_info.opi_file_path()))
+        with open(OPI) as f:
+            template = f.read()
+        write_file(device_info.opi_file_path(), template.replace("$(DEVICE)", "$({})".format(device_info.ioc_name)))
+
+    if opi_entries is None:
+        _update_opi_info([_opi_info_entry(device_info)])
+    else:
+        opi_entries.append(_opi_info_entry(device_info))
+
+
+def add_opis_to_opi_info(opi_entries):
+    """
+    Adds the OPI info entries collected for a batch of devices to opi_info.xml in a single pass
 
-    _update_opi_info(device_info.opi_key(), device_info.opi_file_name(), device_info.log_name(), device_info.ioc_name)
+    Args:
+        opi_entries: List of entries collected by create_opi
+    """
+    if opi_entries:
+        _update_opi_info(opi_entries)
@@ -0,0 +1,176 @@
+"""
+Utilities for generating IOCs from a snapshot of what makeBaseApp.pl generates, without running perl.
+
+The snapshot is taken by running makeBaseApp.pl once for a placeholder IOC and replacing the placeholder's names, the
+architecture and the EPICS base path with tokens. Take a new snapshot whenever the IBEX makeBaseApp templates
+change by running, from an EPICS terminal on a machine with the full IBEX tree:
+
+    python -m utils.ioc_skeleton_utils
+
+Until a snapshot is committed to templates/ioc/skeleton, IOCs are still generated by running makeBaseApp.pl.
+"""
+import logging
+import tempfile
+from locale import getpreferredencoding
+from os import walk, listdir, makedirs
+from os.path import join, exists, isdir, relpath, sep, dirname
+
+from system_paths import PERL, PERL_IOC_GENERATOR, ARCHITECTURE, EPICS
+from templates.paths import IOC_SKELETON
+from utils.common_utils import run_commands
+from utils.file_system_utils import Substitutions, render_tree, rmtree, write_file
+
+# Tokens standing in for the names of an IOC in the snapshot
+APP_NAME = "_IBEX_APP_NAME_"
+APP_IDENTIFIER = "_IBEX_APP_IDENTIFIER_"
+IOC_NAME = "_IBEX_IOC_NAME_"
+ARCH = "_IBEX_ARCH_"
+EPICS_BASE = "_IBEX_EPICS_BASE_"
+EPICS_BASE_POSIX = "_IBEX_EPICS_BASE_POSIX_"
+
+# The IOC the snapshot is taken from. Its name is long enough not to turn up by chance in the generated files
+PLACEHOLDER_IOC = "SKELETON"
+PLACEHOLDER_APP = "{}-IOC-01".format(PLACEHOLDER_IOC)
+
+
+def ioc_skeleton_available(skeleton_dir=IOC_SKELETON):
+    """
+    Args:
+        skeleton_dir: Folder holding the snapshot
+
+    Returns: True if there is a snapshot to generate IOCs from
+    """
+    return isdir(skeleton_dir) and any(name != "__pycache__" for name in listdir(skeleton_dir))
+
+
+def _base_app_commands(app_name):
+    """
+    Args:
+        app_name: Name of the IOC app
+
+    Returns: The makeBaseApp.pl commands that generate the app and its boot folder
+    """
+    return [[PERL, PERL_IOC_GENERATOR, "-a", ARCHITECTURE, "-t", "ioc", app_name],
+            [PERL, PERL_IOC_GENERATOR, "-a", ARCHITECTURE, "-i", "-t", "ioc", "-p", app_name, app_name]]
+
+
+def environment_values():
+    """
+    Returns: (token, value) pairs for the parts of the generated files that depend on the machine
+    """
+    base = join(EPICS, "base", "master")
+    return [(ARCH, ARCHITECTURE), (EPICS_BASE, base), (EPICS_BASE_POSIX, base.replace("\\", "/"))]
+
+
+def _values(ioc_name, app_name):
+    """
+    Args:
+        ioc_name: Name of the IOC, e.g. MYDEV
+        app_name: Name of the IOC app, e.g. MYDEV-IOC-01
+
+    Returns: (token, value) pairs for an IOC app
+    """
+    return [(APP_NAME, app_name), (APP_IDENTIFIER, app_name.replace("-", "_")), (IOC_NAME, ioc_name)] + \
+        environment_values()
+
+
+def capture_ioc_skeleton(skeleton_dir=IOC_SKELETON):
+    """
+    Runs makeBaseApp.pl for the placeholder IOC and saves what it generates as the snapshot
+
+    Args:
+        skeleton_dir: Folder to save the snapshot to. Anything already in it is replaced
+    """
+    work_dir = tempfile.mkdtemp(prefix="ioc_skeleton_")
+    try:
+        run_commands(_base_app_commands(PLACEHOLDER_APP), work_dir)
+        if exists(skeleton_dir):
+            rmtree(skeleton_dir)
+        tokens = [(value, token) for token, value in _values(PLACEHOLDER_IOC, PLACEHOLDER_APP) if value]
+        render_tree(work_dir, skeleton_dir, tokens, substitute_names=True)
+    finally:
+        rmtree(work_dir)
+    logging.info("Saved the IOC skeleton to {}".format(skeleton_dir))
+
+
+def _instance_paths(skeleton_dir):
+    """
+    Args:
+        skeleton_dir: Folder holding the snapshot
+
+    Returns: Paths in the snapshot, relative to it, that belong to one IOC app. Everything else is shared by the apps
+    """
+    paths = []
+    for root, dirs, files in walk(skeleton_dir):
+        for name in list(dirs) + files:
+            if APP_NAME in name or APP_IDENTIFIER in name:
+                paths.append(relpath(join(root, name), skeleton_dir))
+                if name in dirs:
+                    dirs.remove(name)
+    return paths
+
+
+def _render(src, dst, substitutions):
+    """
+    Args:
+        src: File or folder in the snapshot
+        dst: Where to render it to
+        substitutions: Substitutions of tokens for values
+    """
+    if isdir(src):
+        render_tree(src, dst, substitutions, substitute_names=True)
+    else:
+        encoding = getpreferredencoding(False)
+        makedirs(dirname(dst), exist_ok=True)
+        with open(src, "rb") as f:
+            write_file(dst, substitutions.apply(f.read().decode(encoding))[0].encode(encoding))
+
+
+def render_ioc_skeleton(device_info, device_count, skeleton_dir=IOC_SKELETON):
+    """
+    Generates the IOC apps for a device from the snapshot, as running makeBaseApp.pl for each would. The files the
+    apps share are rendered for the first app, and left alone if they already exist
+
+    Args:
+        device_info: Name-based information about the device
+        device_count: How many IOC apps to generate
+        skeleton_dir: Folder holding the snapshot
+    """
+    instance_paths = _instance_paths(skeleton_dir)
+    for i in range(1, device_count + 1):
+        app_name = device_info.ioc_app_name(i)
+        logging.info("Generating IOC {} from the IOC skeleton".format(app_name))
+        substitutions = Substitutions(_values(device_info.ioc_name, app_name))
+        if i == 1:
+            ignore = _ignore_existing_shared_files(skeleton_dir, device_info.ioc_path(), instance_paths)
+            render_tree(skeleton_dir, device_info.ioc_path(), substitutions, ignore=ignore, substitute_names=True)
+        else:
+            for instance_path in instance_paths:
+                target = substitutions.apply(instance_path)[0]
+                _render(join(skeleton_dir, instance_path), join(device_info.ioc_path(), target), substitutions)
+
+
+def _ignore_existing_shared_files(skeleton_dir, ioc_path, instance_paths):
+    """
+    Args:
+        skeleton_dir: Folder holding the snapshot
+        ioc_path: Folder the IOC apps are generated in
+        instance_paths: Paths in the snapshot that belong to one IOC app
+
+    Returns: A callable for render_tree that skips shared files that already exist, as makeBaseApp.pl does
+    """
+    def ignore(directory, names):
+        ignored = {"__pycache__"}
+        for name in names:
+            path = relpath(join(directory, name), skeleton_dir)
+            shared = not any(path == p or path.startswith(p + sep) for p in instance_paths)
+            if shared and not isdir(join(directory, name)) and exists(join(ioc_path, path)):
+                ignored.add(name)
+        return ignored
+    return ignore
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    capture_ioc_skeleton()
+    print("Review the snapshot in {} and commit it".format(IOC_SKELETON))
@@ -1,9 +1,26 @@
 """ Utilities for integrating the device into the IOC test framework """
-from templates.paths import TESTS_TEMPLATE, TESTS_RUN_SCRIPT
-from utils.file_system_utils import replace_in_file, copy_file, mkdir, touch
+from templates.paths import SYSTEM_TESTS_TEMPLATE, TESTS_TEMPLATE, TESTS_RUN_SCRIPT
+from utils.file_system_utils import mkdir, render_tree
+from os import makedirs, path
 import logging
 
 
+def _ignore_other_templates(directory, names):
+    """
+    Chooses the system test templates that are not part of the test framework. The emulator is added by its own step
+
+    Args:
+        directory: Template folder being copied
+        names: Names of the files and folders in it
+
+    Returns: The names not to copy
+    """
+    ignored = {name for name in names if name == "__pycache__" or name.endswith(".pyc")}
+    if path.normcase(path.abspath(directory)) == path.normcase(SYSTEM_TESTS_TEMPLATE):
+        ignored |= {name for name in names if name not in ("tests", path.basename(TESTS_RUN_SCRIPT))}
+    return ignored
+
+
 def _add_template_test_file(device_info):
     """
     Args:
@@ -11,21 +28,16 @@ def _add_template_test_file(device_info):
     """
     dst = device_info.ioc_test_framework_file_path()
     logging.info("Copying template ioc test framework tests to {}".format(dst))
-    mkdir(device_info.system_tests_folder_path())
+    # The emulator shares the system tests folder, so don't offer to empty it if it already exists
+    makedirs(device_info.system_tests_folder_path(), exist_ok=True)
     mkdir(device_info.ioc_test_framework_folder_path())
-    try:
-        copy_file(TESTS_RUN_SCRIPT, device_info.ioc_test_framework_run_script_path())
-    except OSError:
-        pass # Carry on if file already exists
-    try:
-        copy_file(TESTS_TEMPLATE, dst)
-    except OSError:
-        pass # Carry on if file already exists
-    touch(device_info.ioc_test_framework_folder_path(), "__init__.py")
-
-    replace_in_file(dst, [("_DEVICE_", device_info.ioc_name),
-                          ("_Device_", device_info.test_class_identifier()),
-                          ("_device_", device_info.emulator_name())])
+
+    # Copies the run script, the tests package and the tests, renamed for the device, in one pass
+    render_tree(SYSTEM_TESTS_TEMPLATE, device_info.system_tests_folder_path(),
+                [("_DEVICE_", device_info.ioc_name),
+                 ("_Device_", device_info.test_class_identifier()),
+                 ("_device_", device_info.emulator_name())],
+                renames={path.basename(TESTS_TEMPLATE): path.basename(dst)}, ignore=_ignore_other_templates)
 
 
 def create_test_framework(device_info):
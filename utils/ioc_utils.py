@@ -1,76 +1,150 @@
 """ Utilities for adding a template emulator for a new IBEX device"""
-from system_paths import IOC_ROOT, PERL, PERL_IOC_GENERATOR, EPICS, ARCHITECTURE
-from templates.paths import CONFIG_XML, CONFIG_XML_NOT_0
-from utils.common_utils import run_command
-from utils.file_system_utils import replace_in_file, rmtree, mkdir, copy_file, add_to_makefile_list
-from os import path, walk, remove
+from system_paths import IOC_ROOT, PERL, PERL_IOC_GENERATOR, ARCHITECTURE
+from templates.paths import CONFIG_XML, CONFIG_XML_NOT_0, IOC_SKELETON
+from utils.build_utils import build
+from utils.common_utils import run_commands
+from utils.command_line_utils import prompt
+from utils.file_system_utils import mkdir, add_to_makefile_list, render_tree
+from utils.ioc_skeleton_utils import ioc_skeleton_available, render_ioc_skeleton
+from utils.staging_utils import StagingArea
+from os import path, walk
 import logging
 
+# Most IOCs that can be generated for a device by running perl for each, and by copying the first
+MAX_IOCS = 9
+MAX_CLONED_IOCS = 99
 
-def _run_ioc_template_setup(device_info, device_count):
+
+def _check_results(results, device_info):
+    """
+    Args:
+        results: The CommandResult of each command run
+        device_info: Name-based information about the device
+
+    Raises:
+        RuntimeError: If any of the commands failed. The output of each failed command is logged
+    """
+    failed = [result for result in results if result.returncode != 0]
+    for result in failed:
+        logging.error("{} failed with exit code {}:\n{}".format(" ".join(result.command), result.returncode,
+                                                                result.output))
+    if failed:
+        raise RuntimeError("Failed to generate IOC {} for {}".format(
+            ", ".join(result.command[-1] for result in failed), device_info.ioc_name))
+
+
+def _clone_ioc(device_info, index):
+    """
+    Creates the app and boot directories of an IOC by copying those makeBaseApp.pl generated for the first IOC, with
+    the first IOC's app name replaced by this one's in file and folder names and in file contents
+
+    Args:
+        device_info: Name-based information about the device
+        index: Number of the IOC to create
+    """
+    first, app_name = device_info.ioc_app_name(1), device_info.ioc_app_name(index)
+    substitutions = [(first, app_name), (first.replace("-", "_"), app_name.replace("-", "_"))]
+    logging.info("Generating IOC {} from {}".format(app_name, first))
+    render_tree(path.join(device_info.ioc_path(), "{}App".format(first)),
+                path.join(device_info.ioc_path(), "{}App".format(app_name)), substitutions, substitute_names=True)
+    render_tree(device_info.ioc_boot_path(1), device_info.ioc_boot_path(index), substitutions, substitute_names=True)
+
+
+def _run_ioc_template_setup(device_info, device_count, max_workers=1, clone=False):
     """
     Runs the EPICS perl scripts associated with IOC creation. Passes in the IBEX type flag to use our own templates
     found in C:\\Instrument\\Apps\\EPICS\\base\\master\\templates
 
+    The first IOC is generated on its own because it creates the files every IOC shares, e.g. the top Makefile,
+    configure and iocBoot/Makefile. makeBaseApp.pl leaves files that already exist alone, so the apps of the other
+    IOCs can then be generated at the same time, followed by their boot directories
+
     Args:
         device_info: Name-based information about the device
         device_count: How many IOC apps to generate
+        max_workers: Maximum number of perl processes to run at once
+        clone: Only run perl for the first IOC and create the others by copying it. Neither perl nor copying is
+            needed if there is a snapshot of the IOC skeleton, see ioc_skeleton_utils
     """
-    if device_count > 99:
+    if device_count > MAX_CLONED_IOCS:
         raise ValueError("Cannot generate more than 99 IOCs for a single device")
 
-    for i in range(1, device_count+1):
-        app_name = device_info.ioc_app_name(i)
-        logging.info("Generating IOC {}".format(app_name))
-        run_command([PERL, PERL_IOC_GENERATOR, "-a", ARCHITECTURE, "-t", "ioc", app_name], device_info.ioc_path())
-        run_command([PERL, PERL_IOC_GENERATOR, "-a", ARCHITECTURE, "-i", "-t", "ioc", "-p", app_name, app_name],
-                    device_info.ioc_path())
+    if ioc_skeleton_available():
+        render_ioc_skeleton(device_info, device_count)
+        return
+    logging.info("No snapshot of makeBaseApp.pl output in {}, running perl".format(IOC_SKELETON))
+
+    def app_command(index):
+        return [PERL, PERL_IOC_GENERATOR, "-a", ARCHITECTURE, "-t", "ioc", device_info.ioc_app_name(index)]
 
+    def boot_command(index):
+        app_name = device_info.ioc_app_name(index)
+        return [PERL, PERL_IOC_GENERATOR, "-a", ARCHITECTURE, "-i", "-t", "ioc", "-p", app_name, app_name]
 
-def _add_template_config_xml(device_info, device_count):
+    logging.info("Generating IOC {}".format(device_info.ioc_app_name(1)))
+    _check_results(run_commands([app_command(1), boot_command(1)], device_info.ioc_path(), check=False), device_info)
+
+    others = range(2, device_count+1)
+    if clone:
+        for i in others:
+            _clone_ioc(device_info, i)
+        return
+
+    if others:
+        logging.info("Generating IOCs {}".format(", ".join(device_info.ioc_app_name(i) for i in others)))
+    for command in (app_command, boot_command):
+        _check_results(run_commands([command(i) for i in others], device_info.ioc_path(), max_workers, check=False),
+                       device_info)
+
+
+def _add_template_config_xml(staging, device_info, device_count):
     """
     Add the basic config.xml file to the IOC
 
     Args:
+        staging: Staging area for the IOC
         device_info: Name-based information about the device
         device_count: How many IOC apps to generate
     """
-    copy_file(CONFIG_XML, path.join(device_info.ioc_boot_path(1), "config.xml"))
+    staging.copy(CONFIG_XML, path.join(device_info.ioc_boot_path(1), "config.xml"))
     for i in range(2, device_count+1):
-        copy_file(CONFIG_XML_NOT_0, path.join(device_info.ioc_boot_path(i), "config.xml"))
-    run_command(["make", "iocstartups"], EPICS)
+        staging.copy(CONFIG_XML_NOT_0, path.join(device_info.ioc_boot_path(i), "config.xml"))
 
 
-def _replace_macros(device_info, device_count):
+def _replace_macros(staging, device_info, device_count):
     """
     Replace a couple of templates in the st.cmd with generated names
 
     Args:
+        staging: Staging area for the IOC
         device_info: Name-based information about the device
         device_count: How many IOC apps to update
     """
+    files_containing_macros = []
     for i in range(1, device_count+1):
-        files_containing_macros = [
+        files_containing_macros += [
             path.join(device_info.ioc_src_path(i), "Makefile"),
             path.join(device_info.ioc_boot_path(i), "st.cmd"),
             path.join(device_info.ioc_boot_path(i), "st-common.cmd"),
             path.join(device_info.ioc_boot_path(i), "config.xml")]
 
-        for file_containing_macros in files_containing_macros:
-            if not path.exists(file_containing_macros):
-                AssertionError("Attempting to replace macros before command file has been created")
-            replace_in_file(file_containing_macros,
-                            [("_SUPPORT_MACRO_", device_info.ioc_name),
-                             ("_DB_NAME_", device_info.ioc_name),
-                             ("_NAME_LOWER_", device_info.support_app_name()),
-                             ("_01_APP_NAME_", device_info.ioc_app_name(1))])
+    for file_containing_macros in files_containing_macros:
+        if not staging.exists(file_containing_macros):
+            raise AssertionError("Attempting to replace macros before command file has been created")
+
+    staging.replace(files_containing_macros,
+                    [("_SUPPORT_MACRO_", device_info.ioc_name),
+                     ("_DB_NAME_", device_info.ioc_name),
+                     ("_NAME_LOWER_", device_info.support_app_name()),
+                     ("_01_APP_NAME_", device_info.ioc_app_name(1))])
 
 
-def _clean_up(device_info, device_count):
+def _clean_up(staging, device_info, device_count):
     """
     Clean up any files generated by Perl that we don't need (including those that are generated for devices 2+)
 
     Args:
+        staging: Staging area for the IOC
         device_info: device information
         device_count: number of devices
     """
@@ -79,11 +153,11 @@ def _clean_up(device_info, device_count):
     for root, dirs, files in walk(device_info.ioc_path()):
         for d in dirs:
             if d == "protocol":
-                rmtree(path.join(root, d))
+                staging.remove(path.join(root, d))
 
     for i in range(2, device_count + 1):
-        remove(path.join(device_info.ioc_boot_path(i), "st-common.cmd"))
-        remove(path.join(device_info.ioc_src_path(i), "build.mak"))
+        staging.remove(path.join(device_info.ioc_boot_path(i), "st-common.cmd"))
+        staging.remove(path.join(device_info.ioc_src_path(i), "build.mak"))
 
 
 def _build(ioc_path):
@@ -93,59 +167,86 @@ def _build(ioc_path):
     Args:
         ioc_path: Path to the IOC directory
     """
-    run_command(["make"], ioc_path)
+    build(ioc_path)
 
 
-def _add_to_ioc_makefile(name):
+def _add_to_ioc_makefile(names):
     """
-    Add the IOC to the main IOC makefile repo
+    Add the IOCs to the main IOC makefile repo
 
     Args:
-        name: IOC name
+        names: IOC name, or a list of IOC names
     """
-    add_to_makefile_list(IOC_ROOT, "IOCDIRS", name)
+    add_to_makefile_list(IOC_ROOT, "IOCDIRS", names)
 
 
-def _add_macro_to_release_file(device_info):
+def _add_macro_to_release_file(staging, device_info):
     """
     Adds a macro for the support directory to IOC release file
 
     Args:
+        staging: Staging area for the IOC
         device_info: Name-based device information
     """
     logging.info("Adding macro to RELEASE")
-    with open(path.join(device_info.ioc_path(), "configure", "RELEASE"), "a") as f:
-        f.write("{macro}=$(SUPPORT)/{name}/master\n".format(
-            macro=device_info.ioc_name, name=device_info.support_app_name()))
+    staging.append(path.join(device_info.ioc_path(), "configure", "RELEASE"),
+                   ["{macro}=$(SUPPORT)/{name}/master\n".format(
+                       macro=device_info.ioc_name, name=device_info.support_app_name())])
 
 
-def create_ioc(ioc_info, device_count):
+def create_ioc(ioc_info, device_count, ioc_dirs=None, max_workers=1, clone=False):
     """
-    Creates a vanilla IOC in the EPICS IOC submodule
+    Creates a vanilla IOC in the EPICS IOC submodule. The startup files the IOCs share are made afterwards by a
+    separate step, once for every IOC generated, see build_utils.make_ioc_startups
 
     Args:
         device_info: Provides name-based information about the device
         device_count: Number of IOCs to generate
+        ioc_dirs: Optional list to collect the IOC name in, rather than adding it to the IOC Makefile straight away.
+            Used to update the Makefile once for a batch of devices
+        max_workers: Maximum number of perl processes to run at once when generating the IOCs
+        clone: Only run perl for the first IOC and create the others by copying it. Allows more IOCs
+
+    Raises:
+        RuntimeError: If perl or make fails, or a CommandError if either does not finish in time, so the step is not
+            committed
     """
-    while not 1 <= device_count <= 9:
+    max_count = MAX_CLONED_IOCS if clone else MAX_IOCS
+    while not 1 <= device_count <= max_count:
         try:
-            device_count = int(input("{} IOCs currently requested. The current script requires a number"
-                                         " between 1 and 9. Please enter a new value: ".format(device_count)))
+            device_count = int(prompt("{} IOCs currently requested. The current script requires a number"
+                                      " between 1 and {}. Please enter a new value: ".format(device_count, max_count)))
         except (ValueError, TypeError) as e:
             logging.warning("That was not a valid input, please try again: {}".format(e))
-    
-    try:
+
+    if ioc_dirs is None:
         _add_to_ioc_makefile(ioc_info.ioc_name)
-        
-        mkdir(ioc_info.ioc_path())
-
-        _run_ioc_template_setup(ioc_info, device_count)
-        _add_template_config_xml(ioc_info, device_count)
-        _replace_macros(ioc_info, device_count)
-        _clean_up(ioc_info, device_count)
-        _build(ioc_info.ioc_path())
-        _add_macro_to_release_file(ioc_info)
-        
-        
-    except Exception as e:
-        logging.error(str(e))
+    else:
+        ioc_dirs.append(ioc_info.ioc_name)
+
+    mkdir(ioc_info.ioc_path())
+
+    _run_ioc_template_setup(ioc_info, device_count, max_workers, clone)
+
+    # Make every change to the files generated by perl in memory, then write them in one pass
+    staging = StagingArea(ioc_info.ioc_path())
+    _add_template_config_xml(staging, ioc_info, device_count)
+    _replace_macros(staging, ioc_info, device_count)
+    _clean_up(staging, ioc_info, device_count)
+    staging.flush()
+
+    _build(ioc_info.ioc_path())
+
+    _add_macro_to_release_file(staging, ioc_info)
+    staging.flush()
+
+
+def add_iocs_to_ioc_makefile(ioc_dirs):
+    """
+    Adds the IOCs collected for a batch of devices to the IOC Makefile in a single pass
+
+    Args:
+        ioc_dirs: List of IOC names collected by create_ioc
+    """
+    if ioc_dirs:
+        _add_to_ioc_makefile(ioc_dirs)
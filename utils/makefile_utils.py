@@ -0,0 +1,138 @@
+""" Utilities for reading and editing the lists of directories in EPICS makefiles """
+import logging
+import re
+
+# An assignment to a make variable, e.g. "IOCDIRS += MYIOC OTHERIOC"
+_ASSIGNMENT = re.compile(r"^\s*(?P<name>[A-Za-z0-9_.]+)\s*(?:\+=|:=|\?=|=)(?P<values>.*)$")
+
+
+def _values(text):
+    """
+    Args:
+        text: The values of an assignment, or a continuation line of one
+
+    Returns: The values as a list, without any comment, and whether the assignment continues on the next line
+    """
+    text = text.split("#", 1)[0].rstrip("\r\n").rstrip()
+    continues = text.endswith("\\")
+    if continues:
+        text = text[:-1]
+    return text.split(), continues
+
+
+class _ListIndex(object):
+    """
+    The values assigned to a list in a makefile, and the line the last assignment ends on
+    """
+
+    def __init__(self):
+        self.values = set()
+        self.last_line = None
+
+
+class Makefile(object):
+    """
+    The lines of a makefile. Lists are parsed into an index the first time they are used, so checking whether a list
+    holds a value does not rescan the file, and adding many values to a list inserts them all in one go, after the
+    last line that assigns to the list, without changing any other line
+    """
+
+    def __init__(self, lines):
+        """
+        Args:
+            lines: The lines of the makefile
+        """
+        self.lines = list(lines)
+        self._indexes = None
+
+    @classmethod
+    def read(cls, path):
+        """
+        Args:
+            path: Path to the makefile
+
+        Returns: The makefile
+        """
+        with open(path) as f:
+            return cls(f.readlines())
+
+    def text(self):
+        """
+        Returns: The content of the makefile
+        """
+        return "".join(self.lines)
+
+    def _index(self, list_name):
+        """
+        Args:
+            list_name: The name of a list
+
+        Returns: The index of the list, empty if the makefile does not assign to it
+        """
+        if self._indexes is None:
+            self._indexes = {}
+            current = None
+            for i, line in enumerate(self.lines):
+                if current is None:
+                    match = _ASSIGNMENT.match(line)
+                    if match is None:
+                        continue
+                    current = self._indexes.setdefault(match.group("name"), _ListIndex())
+                    values, continues = _values(match.group("values"))
+                else:
+                    values, continues = _values(line)
+                current.values.update(values)
+                current.last_line = i
+                if not continues:
+                    current = None
+        return self._indexes.get(list_name, _ListIndex())
+
+    def contains(self, list_name, value):
+        """
+        Args:
+            list_name: The name of the list
+            value: The value to look for
+
+        Returns: True if the value is exactly one of the values in the list
+        """
+        return value in self._index(list_name).values
+
+    def add(self, list_name, values):
+        """
+        Adds values to a list, one "list_name += value" line each, after the last line that assigns to the list. Values
+        the list already holds are not added again. If the makefile does not assign to the list the lines are added to
+        the end of it
+
+        Args:
+            list_name: The name of the list
+            values: The values to add
+
+        Returns: The values that were added
+        """
+        index = self._index(list_name)
+        added = []
+        for value in values:
+            if value in index.values:
+                logging.warning("{} already added to {}".format(value, list_name))
+            else:
+                index.values.add(value)
+                added.append(value)
+        if not added:
+            return added
+
+        if index.last_line is None:
+            logging.warning("No {} list found, adding it to the end of the makefile".format(list_name))
+            position = len(self.lines)
+        else:
+            position = index.last_line + 1
+        if position == len(self.lines) and self.lines and not self.lines[-1].endswith("\n"):
+            self.lines[-1] += "\n"
+
+        self.lines[position:position] = ["{} += {}\n".format(list_name, value) for value in added]
+        # Every list after the insertion has moved down
+        for other in self._indexes.values():
+            if other.last_line is not None and other.last_line >= position:
+                other.last_line += len(added)
+        index.last_line = position + len(added) - 1
+        self._indexes[list_name] = index
+        return added
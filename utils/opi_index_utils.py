@@ -0,0 +1,146 @@
+""" Utilities for knowing which OPIs the GUI already has without parsing opi_info.xml every time """
+import hashlib
+import logging
+from io import BytesIO
+from os import stat
+from os.path import join, exists, normcase, realpath
+
+from system_paths import OPI_RESOURCES
+from utils.cache_utils import read_cache, write_cache
+
+CACHE_NAME = "opi_index.json"
+
+
+def opi_info_path():
+    """
+    Returns: Path to the GUI's list of OPIs
+    """
+    return join(OPI_RESOURCES, "opi_info.xml")
+
+
+def read_opis(opi_info, start=0, end=None):
+    """
+    Reads the OPIs in part of opi_info.xml one entry at a time, without building the whole document in memory
+
+    Args:
+        opi_info: The content of opi_info.xml
+        start: Offset of the first byte to read. If not 0 the bytes up to end must be a sequence of whole entries
+        end: Offset of the byte after the last byte to read, the end of the content if not set
+
+    Returns: A dictionary of OPI key to OPI file name
+    """
+    from lxml import etree
+
+    document = opi_info[start:end]
+    if start:
+        document = b"<opis>" + document + b"</opis>"
+    opis = {}
+    for _, entry in etree.iterparse(BytesIO(document), events=("end",), tag="entry"):
+        parent = entry.getparent()
+        if parent is not None and parent.tag == "opis":
+            opis[entry.findtext("key")] = entry.findtext("value/path")
+            entry.clear()
+            # Entries already read are not needed again
+            while entry.getprevious() is not None:
+                del parent[0]
+    return opis
+
+
+def _prefix_hash(opi_info, end):
+    """
+    Args:
+        opi_info: The content of opi_info.xml
+        end: Length of the prefix
+
+    Returns: A hash of the content up to end
+    """
+    return hashlib.sha256(opi_info[:end]).hexdigest()
+
+
+def _cache_key(path):
+    """
+    Args:
+        path: Path to opi_info.xml
+
+    Returns: The key the index of the file is kept under in the cache
+    """
+    return normcase(realpath(path))
+
+
+def _cached_indexes():
+    """
+    Returns: A dictionary of the cache key of each opi_info.xml that has been indexed to its index
+    """
+    cached = read_cache(CACHE_NAME)
+    if not isinstance(cached, dict):
+        return {}
+    return {key: index for key, index in cached.items() if isinstance(index, dict) and "mtime_ns" in index}
+
+
+def load_opi_index(path=None, opi_info=None):
+    """
+    The index is kept in the generator's cache rather than next to opi_info.xml, so it never shows up as a change in
+    the GUI repository. Each opi_info.xml has its own index, so runs against another tree, e.g. a benchmark, leave the
+    index of the GUI's alone. It is used as it is while the size and modification time of opi_info.xml match it. If they
+    don't but everything before the end of the list of OPIs is unchanged, as it is when entries have been added to
+    the end, only the new entries are read. Otherwise the whole file is read again
+
+    Args:
+        path: Path to opi_info.xml, the GUI's if not set
+        opi_info: The content of opi_info.xml, if it has already been read
+
+    Returns: A dictionary of OPI key to OPI file name, empty if there is no opi_info.xml
+    """
+    path = opi_info_path() if path is None else path
+    if not exists(path):
+        return {} if opi_info is None else read_opis(opi_info)
+    file_stat = stat(path)
+    indexes = _cached_indexes()
+    cached = indexes.get(_cache_key(path))
+    if cached is not None and cached["mtime_ns"] == file_stat.st_mtime_ns and cached["size"] == file_stat.st_size:
+        return cached["opis"]
+
+    if opi_info is None:
+        with open(path, "rb") as f:
+            opi_info = f.read()
+    close = opi_info.rfind(b"</opis>")
+    if close < 0:
+        return read_opis(opi_info)
+    # New entries go after the last one, so the content before any white space that precedes </opis> is unchanged
+    last_entry_end = len(opi_info[:close].rstrip())
+
+    cached_end = None if cached is None else cached["last_entry_end"]
+    if cached_end is not None and cached_end <= last_entry_end and \
+            _prefix_hash(opi_info, cached_end) == cached["prefix"]:
+        logging.info("Reading the OPIs added to {} since it was indexed".format(path))
+        opis = cached["opis"]
+        opis.update(read_opis(opi_info, cached_end, close))
+    else:
+        logging.info("Indexing the OPIs in {}".format(path))
+        opis = read_opis(opi_info)
+
+    indexes[_cache_key(path)] = {"mtime_ns": file_stat.st_mtime_ns, "size": file_stat.st_size,
+                                 "last_entry_end": last_entry_end, "prefix": _prefix_hash(opi_info, last_entry_end),
+                                 "opis": opis}
+    write_cache(CACHE_NAME, indexes)
+    return opis
+
+
+def existing_opi_problems(device_info, opis=None):
+    """
+    Checks whether the GUI already has an OPI for the device
+
+    Args:
+        device_info: Provides name-based information about the device
+        opis: The OPI index, loaded if not given
+
+    Returns: A list describing each way in which the OPI already exists, empty if it does not
+    """
+    opis = load_opi_index() if opis is None else opis
+    problems = []
+    if device_info.opi_key() in opis:
+        problems.append("OPI with key {} already exists in opi_info.xml, using {}".format(
+            device_info.opi_key(), opis[device_info.opi_key()]))
+    if exists(device_info.opi_file_path()):
+        problems.append("OPI file {} already exists".format(device_info.opi_file_path()))
+    return problems
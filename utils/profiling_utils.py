@@ -0,0 +1,167 @@
+""" Utilities for timing the steps, commands and git calls made whilst generating a device """
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows. Spans still record wall time but not CPU time or memory use
+    resource = None
+
+_spans = []
+_spans_lock = threading.Lock()
+# The spans open in the current thread, or asyncio task, innermost last. Each task started while a span is open gets
+# its own copy, so commands running at once in one thread are not nested in each other
+_stack = contextvars.ContextVar("span_stack", default=())
+_start = time.perf_counter()
+
+
+class Span(object):
+    """
+    The timing and resource use of a single piece of work
+    """
+
+    def __init__(self, name, category, parent):
+        """
+        Args:
+            name: Name of the work, e.g. the command line that was run
+            category: The kind of work, e.g. step, command, git or prompt
+            parent: Name of the span this one is nested in, if any
+        """
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter() - _start
+        self.wall_time = None
+        self.child_cpu_time = None
+        self.max_rss_kb = None
+        self.max_child_rss_kb = None
+        self.status = None
+
+    def to_dict(self):
+        """
+        Returns: The span as a dictionary that can be written as JSON
+        """
+        return {key: getattr(self, key) for key in ("name", "category", "parent", "thread", "start", "wall_time",
+                                                    "child_cpu_time", "max_rss_kb", "max_child_rss_kb", "status")}
+
+
+def _child_cpu_time():
+    """
+    Returns: CPU time (user and system) used so far by child processes that have finished, or None if unknown
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _max_rss_kb(who):
+    """
+    Args:
+        who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+
+    Returns: Peak resident set size in kilobytes so far, or None if unknown
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes, everything else kilobytes
+    return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+
+@contextmanager
+def span(name, category):
+    """
+    Times the work done inside the context. Set the status attribute of the span to record an exit code, otherwise it
+    is 0, or the name of the exception if one is raised.
+
+    The child CPU time is process wide, so it includes any child processes that finished on other threads whilst this
+    span was open. Peak memory use is also process wide and is the peak so far, not just during the span.
+
+    Args:
+        name: Name of the work, e.g. the command line that was run
+        category: The kind of work, e.g. step, command, git or prompt
+    """
+    stack = _stack.get()
+    current = Span(name, category, stack[-1].name if stack else None)
+    token = _stack.set(stack + (current,))
+    child_cpu_time_at_start = _child_cpu_time()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = type(e).__name__
+        raise
+    finally:
+        _stack.reset(token)
+        current.wall_time = time.perf_counter() - _start - current.start
+        if child_cpu_time_at_start is not None:
+            current.child_cpu_time = _child_cpu_time() - child_cpu_time_at_start
+            current.max_rss_kb = _max_rss_kb(resource.RUSAGE_SELF)
+            current.max_child_rss_kb = _max_rss_kb(resource.RUSAGE_CHILDREN)
+        if current.status is None:
+            current.status = 0
+        with _spans_lock:
+            _spans.append(current)
+
+
+def spans():
+    """
+    Returns: A list of the spans that have finished, in order of starting
+    """
+    with _spans_lock:
+        return sorted(_spans, key=lambda s: s.start)
+
+
+def _trace_events(finished_spans):
+    """
+    Args:
+        finished_spans: The spans to convert
+
+    Returns: The spans as complete events in the Chrome trace event format
+    """
+    pid = os.getpid()
+    return [{
+        "name": s.name,
+        "cat": s.category,
+        "ph": "X",
+        "ts": round(s.start * 1e6),
+        "dur": round(s.wall_time * 1e6),
+        "pid": pid,
+        "tid": s.thread,
+        "args": {"status": s.status, "child_cpu_time": s.child_cpu_time, "max_rss_kb": s.max_rss_kb,
+                 "max_child_rss_kb": s.max_child_rss_kb},
+    } for s in finished_spans]
+
+
+def trace_path(profile_path):
+    """
+    Args:
+        profile_path: Path to write the spans to
+
+    Returns: Path to write the Chrome trace events to, alongside the spans
+    """
+    root, ext = os.path.splitext(profile_path)
+    return "{}.trace{}".format(root, ext or ".json")
+
+
+def write_profile(profile_path):
+    """
+    Writes the finished spans as JSON, and as a Chrome trace that can be opened in chrome://tracing or Perfetto
+
+    Args:
+        profile_path: Path to write the spans to. The trace is written next to it, see trace_path
+    """
+    finished_spans = spans()
+    with open(profile_path, "w") as f:
+        json.dump({"spans": [s.to_dict() for s in finished_spans]}, f, indent=2)
+    with open(trace_path(profile_path), "w") as f:
+        json.dump({"traceEvents": _trace_events(finished_spans), "displayTimeUnit": "ms"}, f)
+    logging.info("Profile written to {} and {}".format(profile_path, trace_path(profile_path)))
@@ -0,0 +1,206 @@
+""" Utilities for running the steps of device generation, in parallel where they do not depend on each other """
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from os.path import realpath, normcase, sep, dirname, exists, join
+import logging
+
+from utils.command_line_utils import ask_do_step
+from utils.common_utils import create_component, run_component
+
+
+class Step(object):
+    """
+    A single step of device generation, along with the repository and paths it reads and writes
+    """
+
+    def __init__(self, device, path, action, commit_message, use_git, reads=(), writes=(), after=(), **kwargs):
+        """
+        Args:
+            device: Passed as the first argument to the action
+            path: Path to the repository the step commits to
+            action: Function that takes the device as an argument that creates the component
+            commit_message: Message to attach to the changes. Also identifies the step to the user
+            use_git: use git; False do not issue git commands
+            reads: Paths the step reads that other steps may write
+            writes: Paths the step creates or modifies, including what the commands it runs write, e.g. build
+                output. A directory covers everything inside it. Steps are only run at the same time as others if
+                this is complete
+            after: Steps that must have finished before this one starts, in addition to those inferred from the paths
+            kwargs: Keyword arguments passed to the action
+        """
+        self.device = device
+        self.path = path
+        self.action = action
+        self.commit_message = commit_message
+        self.use_git = use_git
+        self.reads = [_normalise(p) for p in reads]
+        self.writes = [_normalise(p) for p in writes]
+        self.after = list(after)
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return "Step({})".format(self.commit_message)
+
+
+def _normalise(path):
+    """
+    Args:
+        path: A file system path
+
+    Returns: The path in a form that can be compared with other paths
+    """
+    return normcase(realpath(path))
+
+
+def _overlap(paths, other_paths):
+    """
+    Args:
+        paths: Normalised paths
+        other_paths: Other normalised paths
+
+    Returns: True if any path is the same as, or contains, or is contained by, any of the other paths
+    """
+    return any(p == o or o.startswith(p.rstrip(sep) + sep) or p.startswith(o.rstrip(sep) + sep)
+               for p in paths for o in other_paths)
+
+
+def _depends_on(step, earlier):
+    """
+    A step depends on an earlier one if it was told to, if one writes what the other reads or writes, or if one
+    uses git on a repository that contains (but is not the same as) the other's repository, e.g. EPICS and a support
+    submodule inside it. Steps on the same repository can run at the same time because they only commit the paths
+    they write and take it in turns to run git.
+
+    Args:
+        step: The later step
+        earlier: The earlier step
+
+    Returns: True if the step must wait for the earlier step to finish
+    """
+    if earlier in step.after:
+        return True
+    if _overlap(earlier.writes, step.reads + step.writes) or _overlap(earlier.reads, step.writes):
+        return True
+    if _normalise(earlier.path) != _normalise(step.path):
+        if earlier.use_git and _overlap([_normalise(earlier.path)], step.writes):
+            return True
+        if step.use_git and _overlap([_normalise(step.path)], earlier.writes):
+            return True
+    return False
+
+
+def _writes_into_submodule(step):
+    """
+    Args:
+        step: A step
+
+    Returns: True if the step writes inside a repository nested in the repository it commits to, e.g. inside a
+        submodule of EPICS
+    """
+    root = _normalise(step.path)
+    for path in step.writes:
+        parent = dirname(path)
+        while parent.startswith(root.rstrip(sep) + sep):
+            if exists(join(parent, ".git")):
+                return True
+            parent = dirname(parent)
+    return False
+
+
+def dependencies(steps):
+    """
+    Args:
+        steps: The steps in the order they would run one after another
+
+    Returns: A list holding, for each step, the set of earlier steps it must wait for
+    """
+    return [{earlier for earlier in steps[:i] if _depends_on(step, earlier)} for i, step in enumerate(steps)]
+
+
+def _writes_by_repository(steps):
+    """
+    Args:
+        steps: The steps to run
+
+    Returns: A dictionary of the path of each repository the steps commit to to the paths they write in it, or to None
+        if a step that commits to it does not say what it writes
+    """
+    writes = {}
+    for step in steps:
+        if step.use_git:
+            if not step.writes:
+                writes[step.path] = None
+            elif writes.get(step.path, []) is not None:
+                writes[step.path] = writes.get(step.path, []) + step.writes
+    return writes
+
+
+def _finish_pushes(steps, failed, max_workers):
+    """
+    Pushes the repositories whose pushes were deferred until the steps had finished, or if any step failed leaves the
+    commits on the local branches so nothing half finished is pushed
+
+    Args:
+        steps: The steps that were run
+        failed: The steps that failed
+        max_workers: Maximum number of repositories to push at once
+    """
+    if not any(step.use_git for step in steps):
+        return
+    from utils.git_utils import push_deferred, discard_deferred_pushes
+    if failed:
+        discard_deferred_pushes()
+    else:
+        push_deferred(max_workers)
+
+
+def run_steps(steps, branch, max_workers=1, step_answers=None):
+    """
+    Runs the steps of device generation. With one worker the steps run in order and the user is asked about each step
+    just before it runs. With more workers the user is asked about every step up front, the branch is prepared in every
+    repository the steps commit to at once, and then steps run on a thread pool as soon as the steps they depend on
+    have finished
+
+    Args:
+        steps: The steps in the order they would run one after another
+        branch: Branch name to put the changes on
+        max_workers: Maximum number of steps to run at once
+        step_answers: Optional dictionary of answers to previous steps
+    """
+    if max_workers <= 1:
+        failed = [step for step in steps if not create_component(
+            step.device, branch, step.path, step.action, step.commit_message, step.use_git, step_answers,
+            step.writes or None, _writes_into_submodule(step), step.writes or None, **step.kwargs)]
+        _finish_pushes(steps, failed, max_workers)
+        return
+
+    selected = [step for step in steps if ask_do_step(step.commit_message, step_answers)]
+    git_paths = [step.path for step in selected if step.use_git]
+    if git_paths:
+        from utils.git_utils import prepare_repositories
+        prepare_repositories(git_paths, branch, max_workers,
+                             [step.path for step in selected if step.use_git and _writes_into_submodule(step)],
+                             _writes_by_repository(selected))
+    pending = list(zip(selected, dependencies(selected)))
+    running = {}
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = [step for step, waiting_for in pending if not waiting_for]
+            pending = [(step, waiting_for) for step, waiting_for in pending if waiting_for]
+            for step in ready:
+                logging.info("Starting step: {}".format(step.commit_message))
+                running[executor.submit(run_component, step.device, branch, step.path, step.action,
+                                        step.commit_message, step.use_git, commit_paths=step.writes,
+                                        fetch_submodules=_writes_into_submodule(step), writes=step.writes or None,
+                                        **step.kwargs)] = step
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished = running.pop(future)
+                if not future.result():
+                    failed.append(finished)
+                for _, waiting_for in pending:
+                    waiting_for.discard(finished)
+
+    _finish_pushes(selected, failed, max_workers)
@@ -0,0 +1,66 @@
+""" Utilities for only running the generator's own tests when the generator has changed """
+import hashlib
+import logging
+from os import walk
+from os.path import join, dirname, abspath, relpath, exists
+
+import system_paths
+from utils.cache_utils import read_cache, write_cache
+
+ROOT = dirname(dirname(abspath(__file__)))
+SOURCE_DIRS = ("utils", "templates", "tests")
+SOURCE_FILES = ("run_tests.py", "system_paths.py")
+CACHE_NAME = "self_test.json"
+
+
+def _source_files():
+    """
+    Returns: Sorted paths of the files the tests depend on
+    """
+    files = [join(ROOT, f) for f in SOURCE_FILES]
+    for source_dir in SOURCE_DIRS:
+        for root, dirs, names in walk(join(ROOT, source_dir)):
+            dirs[:] = [d for d in dirs if d != "__pycache__"]
+            files += [join(root, name) for name in names if not name.endswith((".pyc", ".pyo"))]
+    return sorted(files)
+
+
+def source_fingerprint():
+    """
+    The system path tests check that the configured paths exist, so the paths and whether they exist are part of the
+    fingerprint along with the sources
+
+    Returns: A hash of the generator's sources and the system paths it is configured to use
+    """
+    digest = hashlib.sha256()
+    for path in _source_files():
+        digest.update(relpath(path, ROOT).replace("\\", "/").encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    for name in sorted(dir(system_paths)):
+        value = getattr(system_paths, name)
+        if name.isupper() and isinstance(value, str):
+            digest.update("{}={}:{}".format(name, value, exists(value)).encode())
+    return digest.hexdigest()
+
+
+def run_tests_if_changed(run_tests, force=False):
+    """
+    Runs the tests unless they have already passed for the current fingerprint
+
+    Args:
+        run_tests: Function that runs the tests and returns True if they passed
+        force: Run the tests even if they have already passed
+
+    Returns: True if the tests passed, now or on a previous run, False otherwise
+    """
+    fingerprint = source_fingerprint()
+    cached = read_cache(CACHE_NAME)
+    if not force and cached is not None and cached.get("passed") == fingerprint:
+        logging.info("Skipping self tests, they have already passed for this version of the generator")
+        return True
+
+    passed = run_tests()
+    if passed:
+        write_cache(CACHE_NAME, {"passed": fingerprint})
+    return passed
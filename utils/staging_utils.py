@@ -0,0 +1,251 @@
+""" Utilities for preparing the files a step writes in memory before writing them to the tree in one pass """
+import logging
+from collections import OrderedDict
+from locale import getpreferredencoding
+from os import makedirs, remove
+from os.path import exists, isdir, isfile, dirname, abspath, normcase, sep
+
+from utils.command_line_utils import ask_do_step
+from utils.file_system_utils import Substitutions, write_file, rmtree
+
+# Marks a staged path that is to be removed rather than written
+_REMOVED = object()
+
+
+class StagingError(RuntimeError):
+    """
+    Raised when the staged changes could not be written to the tree as they are
+    """
+
+
+def _key(path):
+    """
+    Args:
+        path: A file system path
+
+    Returns: The path in a form that can be compared with other paths
+    """
+    return normcase(abspath(path))
+
+
+def _contains(directory, path):
+    """
+    Args:
+        directory: Key of a directory
+        path: Key of a path
+
+    Returns: True if the path is the directory or is inside it
+    """
+    return path == directory or path.startswith(directory.rstrip(sep) + sep)
+
+
+def _as_text(content):
+    """
+    Args:
+        content: Staged file content, as text or as bytes copied from a template
+
+    Returns: The content as text, as it would be read from a file opened in text mode
+    """
+    if isinstance(content, bytes):
+        content = content.decode(getpreferredencoding(False)).replace("\r\n", "\n").replace("\r", "\n")
+    return content
+
+
+class StagingArea(object):
+    """
+    Collects the files a step creates, changes and removes in memory. A file that is copied from a template and then
+    has substitutions made and lines appended is read once and written once, when the staging area is flushed.
+    Nothing touches the tree until the flush, and the whole change set is checked before anything is written
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root: Directory the step owns. Staging anything outside it is an error
+        """
+        self.root = abspath(root)
+        self._staged = OrderedDict()
+
+    def __len__(self):
+        return len(self._staged)
+
+    def _stage(self, path, content):
+        key = _key(path)
+        self._staged.pop(key, None)
+        self._staged[key] = (abspath(path), content)
+
+    def _staged_content(self, path):
+        """
+        Args:
+            path: Path to a file
+
+        Returns: The content staged for the file, _REMOVED if it or a directory containing it is staged for removal, or
+            None if nothing is staged for it
+        """
+        key = _key(path)
+        if key in self._staged:
+            return self._staged[key][1]
+        for staged_key, (_, content) in reversed(self._staged.items()):
+            if content is _REMOVED and _contains(staged_key, key):
+                return _REMOVED
+        return None
+
+    def exists(self, path):
+        """
+        Args:
+            path: Path to a file or directory
+
+        Returns: True if the path will exist once the staging area is flushed
+        """
+        content = self._staged_content(path)
+        if content is _REMOVED:
+            return False
+        return content is not None or exists(path)
+
+    def read(self, path):
+        """
+        Args:
+            path: Path to a file
+
+        Returns: The text the file will hold once the staging area is flushed
+        """
+        content = self._staged_content(path)
+        if content is _REMOVED:
+            raise IOError("{} is staged for removal".format(path))
+        if content is None:
+            with open(path) as f:
+                content = f.read()
+        return _as_text(content)
+
+    def write(self, path, content):
+        """
+        Args:
+            path: Path to a file
+            content: The text the file should hold
+        """
+        self._stage(path, content)
+
+    def copy(self, src, dst, substitutions=None, confirm_overwrite=True):
+        """
+        Stages a copy of a file, optionally making substitutions in it
+
+        Args:
+            src: File to copy
+            dst: Place to copy to
+            substitutions: Optional collection of (original, final) substitutions to make in the copy
+            confirm_overwrite: Ask the user before replacing a file that already exists, and raise if they say no
+        """
+        if confirm_overwrite and self.exists(dst) and not ask_do_step("{} already exists. Delete it?".format(dst)):
+            raise OSError("File {} already exists. Aborting".format(dst))
+        if substitutions is None:
+            with open(src, "rb") as f:
+                self._stage(dst, f.read())
+        else:
+            with open(src) as f:
+                self._stage(dst, _as_substitutions(substitutions).apply(f.read())[0])
+
+    def replace(self, paths, substitutions):
+        """
+        Stages substitutions in files, reading each file from the staging area if it is staged and from the tree if not
+
+        Args:
+            paths: Paths to the files
+            substitutions: Collection of (original, final) substitutions to make
+        """
+        substitutions = _as_substitutions(substitutions)
+        for path in paths:
+            original = self.read(path)
+            text, _ = substitutions.apply(original)
+            if text != original or _key(path) in self._staged:
+                self._stage(path, text)
+
+    def append(self, path, lines):
+        """
+        Args:
+            path: Path to a file
+            lines: Lines to add to the end of the file
+        """
+        self._stage(path, self.read(path) + "".join(lines))
+
+    def remove(self, path):
+        """
+        Args:
+            path: File or folder to remove
+        """
+        key = _key(path)
+        for staged_key in [k for k in self._staged if _contains(key, k)]:
+            del self._staged[staged_key]
+        self._staged[key] = (abspath(path), _REMOVED)
+
+    def validate(self):
+        """
+        Checks that every staged change can be made: everything is inside the root, nothing to be removed is missing,
+        no file is written where a folder is, and no folder is needed where a file is
+
+        Raises:
+            StagingError: Describing every problem found
+        """
+        root = _key(self.root)
+        removed = [key for key, (_, content) in self._staged.items() if content is _REMOVED]
+        written = {key: path for key, (path, content) in self._staged.items() if content is not _REMOVED}
+        problems = []
+        for key, (path, content) in self._staged.items():
+            if not _contains(root, key):
+                problems.append("{} is outside {}".format(path, self.root))
+            elif content is _REMOVED:
+                if not exists(path):
+                    problems.append("{} is to be removed but does not exist".format(path))
+            elif not any(_contains(r, key) for r in removed):
+                if isdir(path):
+                    problems.append("{} is to be written but is a folder".format(path))
+        for key, path in written.items():
+            parent = dirname(path)
+            while _contains(root, _key(parent)) and _key(parent) != root:
+                if _key(parent) in written:
+                    problems.append("{} needs {} to be a folder but it is to be written as a file".format(path, parent))
+                elif isfile(parent) and not any(_contains(r, _key(parent)) for r in removed):
+                    problems.append("{} needs {} to be a folder but it is a file".format(path, parent))
+                parent = dirname(parent)
+        if problems:
+            raise StagingError("Cannot write the changes to {}:\n{}".format(self.root, "\n".join(problems)))
+
+    def flush(self):
+        """
+        Validates the staged changes and then makes them: removals first, then every folder that is needed, then the
+        files in the order they were staged. Files whose content has not changed are left alone. The staging area is
+        empty afterwards
+
+        Returns: The paths of the files that were written
+        """
+        self.validate()
+        staged = list(self._staged.values())
+        self._staged.clear()
+
+        for path, content in staged:
+            if content is _REMOVED:
+                logging.info("Removing {}".format(path))
+                if isdir(path):
+                    rmtree(path)
+                else:
+                    remove(path)
+
+        files = [(path, content) for path, content in staged if content is not _REMOVED]
+        folders = sorted({dirname(path) for path, _ in files if not isdir(dirname(path))})
+        # Creating the deepest folders creates their parents too
+        for i, folder in enumerate(folders):
+            if not (i + 1 < len(folders) and _contains(_key(folder), _key(folders[i + 1]))):
+                makedirs(folder, exist_ok=True)
+
+        written = [path for path, content in files if write_file(path, content)]
+        logging.info("Wrote {} of {} staged files under {}".format(len(written), len(files), self.root))
+        return written
+
+
+def _as_substitutions(substitutions):
+    """
+    Args:
+        substitutions: Substitutions, or a collection of (original, final) substitutions
+
+    Returns: The substitutions compiled
+    """
+    return substitutions if isinstance(substitutions, Substitutions) else Substitutions(substitutions)
@@ -0,0 +1,125 @@
+"""
+Utilities for generating support modules from a snapshot of what makeSupport.pl generates, without running perl.
+
+The snapshot is taken by running makeSupport.pl once for a placeholder support module, making the same tweaks to its
+output that the generator makes, and replacing the placeholder's name, the architecture and the EPICS base path with
+tokens. Take a new snapshot whenever the streamSCPI template changes by running, from an EPICS terminal on a machine
+with the full IBEX tree:
+
+    python -m utils.support_skeleton_utils
+
+Until a snapshot is committed to templates/support/skeleton, support modules are still generated by running
+makeSupport.pl.
+"""
+import logging
+import tempfile
+from os import walk, listdir
+from os.path import join, exists, isdir, relpath
+
+from system_paths import PERL, PERL_SUPPORT_GENERATOR
+from templates.paths import SUPPORT_SKELETON
+from utils.common_utils import run_command
+from utils.file_system_utils import Substitutions, render_tree, rmtree
+from utils.ioc_skeleton_utils import environment_values
+from utils.staging_utils import StagingArea
+
+# Token standing in for the name of the support module in the snapshot
+SUPPORT_NAME = "_IBEX_SUPPORT_NAME_"
+
+# The support module the snapshot is taken from
+PLACEHOLDER_SUPPORT = "ibex_skeleton"
+
+
+def support_skeleton_available(skeleton_dir=SUPPORT_SKELETON):
+    """
+    Args:
+        skeleton_dir: Folder holding the snapshot
+
+    Returns: True if there is a snapshot to generate support modules from
+    """
+    return isdir(skeleton_dir) and any(name != "__pycache__" for name in listdir(skeleton_dir))
+
+
+def make_support_command(support_app_name):
+    """
+    Args:
+        support_app_name: Name of the support module
+
+    Returns: The makeSupport.pl command that generates the support module
+    """
+    return [PERL, PERL_SUPPORT_GENERATOR, "-t", "streamSCPI", support_app_name]
+
+
+def tweak_make_support_output(staging, support_master_dir, support_app_name):
+    """
+    Stages the changes the generator makes to what makeSupport.pl generates: the generated Db is removed as the
+    template Db replaces it, the Db is built rather than the protocol file, and the module gets an ioctests target
+
+    Args:
+        staging: Staging area for the support module
+        support_master_dir: Folder makeSupport.pl was run in
+        support_app_name: Name of the support module
+    """
+    app_path = join(support_master_dir, "{}Sup".format(support_app_name))
+    staging.remove(join(app_path, "{}.db".format(support_app_name)))
+    staging.replace([join(app_path, "Makefile")],
+                    [("DB += {}.proto".format(support_app_name), ""),
+                     ("#DB += xxx.db", "DB += {}.db".format(support_app_name))])
+    staging.append(join(support_master_dir, "Makefile"), ["\nioctests:\n", "\t.\\system_tests\\run_tests.bat\n"])
+
+
+def _values(support_app_name):
+    """
+    Args:
+        support_app_name: Name of the support module
+
+    Returns: (token, value) pairs for a support module
+    """
+    return [(SUPPORT_NAME, support_app_name)] + environment_values()
+
+
+def capture_support_skeleton(skeleton_dir=SUPPORT_SKELETON):
+    """
+    Runs makeSupport.pl for the placeholder support module, tweaks its output and saves it as the snapshot
+
+    Args:
+        skeleton_dir: Folder to save the snapshot to. Anything already in it is replaced
+    """
+    work_dir = tempfile.mkdtemp(prefix="support_skeleton_")
+    try:
+        run_command(make_support_command(PLACEHOLDER_SUPPORT), work_dir)
+        staging = StagingArea(work_dir)
+        tweak_make_support_output(staging, work_dir, PLACEHOLDER_SUPPORT)
+        staging.flush()
+        if exists(skeleton_dir):
+            rmtree(skeleton_dir)
+        tokens = [(value, token) for token, value in _values(PLACEHOLDER_SUPPORT) if value]
+        render_tree(work_dir, skeleton_dir, tokens, substitute_names=True)
+    finally:
+        rmtree(work_dir)
+    logging.info("Saved the support skeleton to {}".format(skeleton_dir))
+
+
+def stage_support_skeleton(staging, device_info, skeleton_dir=SUPPORT_SKELETON):
+    """
+    Stages the support module for a device from the snapshot, as running makeSupport.pl and tweaking its output would
+
+    Args:
+        staging: Staging area for the support module
+        device_info: Name-based information about the device
+        skeleton_dir: Folder holding the snapshot
+    """
+    logging.info("Generating support module {} from the support skeleton".format(device_info.support_app_name()))
+    substitutions = Substitutions(_values(device_info.support_app_name()))
+    for root, dirs, files in walk(skeleton_dir):
+        dirs[:] = [name for name in dirs if name != "__pycache__"]
+        for name in files:
+            src = join(root, name)
+            target = substitutions.apply(relpath(src, skeleton_dir))[0]
+            staging.copy(src, join(device_info.support_master_dir(), target), substitutions)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    capture_support_skeleton()
+    print("Review the snapshot in {} and commit it".format(SUPPORT_SKELETON))
@@ -1,102 +1,128 @@
 """ Utilities for adding a template emulator for a new IBEX device"""
-from system_paths import EPICS_SUPPORT, PERL, PERL_SUPPORT_GENERATOR, EPICS
-from templates.paths import SUPPORT_MAKEFILE, SUPPORT_GITIGNORE, SUPPORT_GITATTRIBUTES, SUPPORT_LICENCE, DB
+from system_paths import EPICS_SUPPORT, EPICS
+from templates.paths import SUPPORT_MAKEFILE, SUPPORT_GITIGNORE, SUPPORT_GITATTRIBUTES, SUPPORT_LICENCE, DB, \
+    SUPPORT_SKELETON
+from utils.build_utils import build
 from utils.common_utils import run_command, get_year
-from utils.file_system_utils import append_to_file, mkdir, add_to_makefile_list, replace_in_file, copy_file
-from os import path, remove
-from shutil import copyfile
+from utils.file_system_utils import mkdir, add_to_makefile_list
+from utils.staging_utils import StagingArea
+from utils.support_skeleton_utils import support_skeleton_available, stage_support_skeleton, \
+    make_support_command, tweak_make_support_output
+from os import path
 import logging
-from utils.git_utils import RepoWrapper
+from utils.command_line_utils import prompt
 
 
-def _add_to_makefile(name):
+def _add_to_makefile(names):
     """
     Args:
-        name: Name of the device
+        names: Name of the device, or a list of device names
     """
-    add_to_makefile_list(EPICS_SUPPORT, "SUPPDIRS", name)
+    add_to_makefile_list(EPICS_SUPPORT, "SUPPDIRS", names)
 
 
-def create_submodule(device_info, create_submodule_in_git):
+def add_support_modules_to_makefile(supp_dirs):
+    """
+    Adds the support modules collected for a batch of devices to the support Makefile in a single pass
+
+    Args:
+        supp_dirs: List of support module names collected by create_submodule
+    """
+    if supp_dirs:
+        _add_to_makefile(supp_dirs)
+
+
+def create_submodule(device_info, create_submodule_in_git, supp_dirs=None):
     """
     Creates a submodule and links it into the main EPICS repo
 
     Args:
         device_info: Provides name-based information about the device
         create_submodule_in_git: True then create submodule in git; False do not do this operation
+        supp_dirs: Optional list to collect the support module name in, rather than adding it to the support Makefile
+            straight away. Used to update the Makefile once for a batch of devices
     """
-    try:
-        mkdir(device_info.support_dir())
-        copyfile(SUPPORT_MAKEFILE, path.join(device_info.support_dir(), "Makefile"))
-        master_dir = device_info.support_master_dir()
-    except Exception as e:
-        logging.error(str(e))
+    mkdir(device_info.support_dir())
+    staging = StagingArea(device_info.support_dir())
+    staging.copy(SUPPORT_MAKEFILE, path.join(device_info.support_dir(), "Makefile"), confirm_overwrite=False)
+    staging.flush()
+    master_dir = device_info.support_master_dir()
 
     if create_submodule_in_git:
         if path.isdir(path.join(master_dir, ".git")):
             logging.error("A git repository (not submodule) already exists at {0}."
                           "Remove this to be able to create the submodule correctly".format(master_dir))
             exit()
-        input(f"Attempting to add submodule using remote {device_info.support_repo_url()}. Press return to confirm it exists")
-        RepoWrapper(EPICS).create_submodule(device_info.support_app_name(), device_info.support_repo_url(), master_dir)
+        prompt(f"Attempting to add submodule using remote {device_info.support_repo_url()}. Press return to confirm it exists")
+        from utils.git_utils import repo_session
+        repo_session(EPICS).create_submodule(device_info.support_app_name(), device_info.support_repo_url(), master_dir)
     else:
         logging.warning("Because you have chosen no-git the submodule has not been added for your ioc support module. "
                         "If files are added they will be added to EPICS not a submodule of it.")
 
     logging.info("Initializing device support repository {}".format(master_dir))
-    _add_to_makefile(device_info.support_app_name())
+    if supp_dirs is None:
+        _add_to_makefile(device_info.support_app_name())
+    else:
+        supp_dirs.append(device_info.support_app_name())
 
 
 def apply_support_dir_template(device_info):
     """
+    Generates the support module from the snapshot of makeSupport.pl output if there is one, or by running
+    makeSupport.pl and tweaking its output if not, then adds the template files and builds it
+
     Args:
         device_info: Provides name-based information about the device
     """
-    try:
-        mkdir(device_info.support_master_dir())
-        cmd = [PERL, PERL_SUPPORT_GENERATOR, "-t", "streamSCPI", device_info.support_app_name()]
-        run_command(cmd, device_info.support_master_dir())
-    except Exception as e:
-        logging.error(str(e))
+    staging = StagingArea(device_info.support_master_dir())
+    if support_skeleton_available():
+        stage_support_skeleton(staging, device_info)
+    else:
+        logging.info("No snapshot of makeSupport.pl output in {}, running perl".format(SUPPORT_SKELETON))
+        _run_make_support(device_info)
+        tweak_make_support_output(staging, device_info.support_master_dir(), device_info.support_app_name())
 
-    if not path.exists(device_info.support_db_path()):
-        logging.warning("The makeSupport.pl didn't run correctly. It's very temperamental. "
-                        "Please run the following command manually from an EPICS terminal: "
-                        "cd {} && {}".format(device_info.support_master_dir(), " ".join(cmd)))
-        input("Press return to continue...")
+    staging.copy(SUPPORT_GITIGNORE, path.join(device_info.support_master_dir(), ".gitignore"), confirm_overwrite=False)
+    staging.copy(SUPPORT_GITATTRIBUTES, path.join(device_info.support_master_dir(), ".gitattributes"),
+                 confirm_overwrite=False)
+    staging.copy(SUPPORT_LICENCE, path.join(device_info.support_master_dir(), "LICENCE"), [("_YEAR_", get_year())],
+                 confirm_overwrite=False)
+    _add_template_db(staging, device_info)
+    staging.flush()
 
-    # Some manual tweaks to the auto template
-    remove(device_info.support_db_path())
-    copyfile(SUPPORT_GITIGNORE, path.join(device_info.support_master_dir(), ".gitignore"))
+    build(device_info.support_master_dir())
 
-    copyfile(SUPPORT_GITATTRIBUTES, path.join(device_info.support_master_dir(), ".gitattributes"))
 
-    copied_license_filepath =  path.join(device_info.support_master_dir(), "LICENCE")
-    copyfile(SUPPORT_LICENCE, copied_license_filepath)
-    replace_in_file(copied_license_filepath, [("_YEAR_", get_year())])
-    replace_in_file(path.join(device_info.support_app_path(), "Makefile"),
-                    [("DB += {}.proto".format(device_info.support_app_name()), "")])
-    _add_template_db(device_info)
-    append_to_file(
-        path.join(device_info.support_master_dir(), "Makefile"),
-        ["\nioctests:\n", "\t.\\system_tests\\run_tests.bat\n"]
-    )
+def _run_make_support(device_info):
+    """
+    Runs makeSupport.pl for the device, asking the user to run it by hand if it does not generate the Db
 
-    run_command(["make"], device_info.support_master_dir())
+    Args:
+        device_info: Provides name-based information about the device
 
+    Raises:
+        CommandError: If makeSupport.pl fails or does not finish in time
+    """
+    cmd = make_support_command(device_info.support_app_name())
+    mkdir(device_info.support_master_dir())
+    run_command(cmd, device_info.support_master_dir())
 
-def _add_template_db(device_info):
+    if not path.exists(device_info.support_db_path()):
+        logging.warning("The makeSupport.pl didn't run correctly. It's very temperamental. "
+                        "Please run the following command manually from an EPICS terminal: "
+                        "cd {} && {}".format(device_info.support_master_dir(), " ".join(cmd)))
+        prompt("Press return to continue...")
+
+
+def _add_template_db(staging, device_info):
     """
     Add the basic DB file to the support module
 
     Args:
+        staging: Staging area for the support module
         device_info: Name-based information about the device
     """
     db_dir = path.join(device_info.support_app_path())
     logging.info("Copying basic Db file to {}".format(db_dir))
-    copy_file(DB, path.join(db_dir, "{}.db".format(device_info.support_app_name())))
-
-    # Make sure Db is included in the build
-    replace_in_file(path.join(db_dir, "Makefile"), [("#DB += xxx.db", "DB += {}.db".format(device_info.support_app_name()))])
-
-
+    staging.copy(DB, path.join(db_dir, "{}.db".format(device_info.support_app_name())))